@@ -0,0 +1,218 @@
+import json
+import random
+
+
+CATEGORIES = ('requests', 'sync.commit', 'sync.begin', 'django', 'query',
+              'auth', 'cache.get', 'cache.set', 'celery', 'redis')
+SERVERS = ('front1', 'front2', 'front3', 'front4')
+USER_AGENTS = ('Opera', 'Chrome', 'Firefox', 'Safari', 'Opera Mini')
+# Span of creation times of generated events.
+DAYS = 14
+# Creation time of the newest generated event.
+NEWEST = (2016, 4, 22)
+
+
+class Config(object):
+    """
+    Shape of generated events.
+    """
+
+    def __init__(self, headers=4, tags=4, frames=5, variables=6,
+                 breadcrumbs=8, categories=5, users=50):
+        """
+        :param headers: number of HTTP headers
+        :type: int
+        :param tags: number of tags
+        :type: int
+        :param frames: number of stack frames
+        :type: int
+        :param variables: number of variables in each frame
+        :type: int
+        :param breadcrumbs: max number of breadcrumbs
+        :type: int
+        :param categories: number of distinct breadcrumbs' categories
+        :type: int
+        :param users: number of distinct users (context)
+        :type: int
+        """
+        self.headers = headers
+        self.tags = tags
+        self.frames = frames
+        self.variables = variables
+        self.breadcrumbs = breadcrumbs
+        self.categories = CATEGORIES[:max(1, min(categories,
+                                                 len(CATEGORIES)))]
+        self.users = users
+
+
+def generate_breadcrumb(rng, category, position):
+    """
+    :type rng: random.Random
+    :type category: str
+    :type position: int
+    :rtype: dict
+    """
+    breadcrumb = {
+        'category': category,
+        'level': 'info',
+        'timestamp': 1460000000 + position,
+        'message': None,
+        'type': 'default',
+        'event_id': None,
+        'data': None,
+    }
+
+    if category == 'requests':
+        breadcrumb['data'] = {'status_code': rng.choice([200, 404, 500]),
+                              'url': 'http://example.com/'}
+    elif category == 'sync.commit':
+        breadcrumb['data'] = {'extra': {'mobile': rng.choice([True, False])}}
+    elif category == 'query':
+        breadcrumb['message'] = 'SELECT * FROM table_%d' % rng.randint(0, 9)
+
+    return breadcrumb
+
+
+def generate_headers(rng, config):
+    """
+    :type rng: random.Random
+    :type config: Config
+    :rtype: list - [name, value] pairs
+    """
+    headers = [['User-Agent', rng.choice(USER_AGENTS)],
+               ['Host', 'sync.opera.com'],
+               ['Accept-Encoding', rng.choice(['gzip', 'identity'])]]
+    headers.extend(['X-Header-%d' % i, str(rng.randint(0, 9))]
+                   for i in xrange(max(0, config.headers - len(headers))))
+    return headers[:config.headers]
+
+
+def generate_tags(rng, config):
+    """
+    :type rng: random.Random
+    :type config: Config
+    :rtype: list(dict)
+    """
+    tags = [{'key': 'server_name', 'value': rng.choice(SERVERS)},
+            {'key': 'release', 'value': rng.choice(['5d74084', 'a8e1f3b'])},
+            {'key': 'logger', 'value': 'sync.api'}]
+    tags.extend({'key': 'tag_%d' % i, 'value': str(rng.randint(0, 4))}
+                for i in xrange(max(0, config.tags - len(tags))))
+    return tags[:config.tags]
+
+
+def generate_frames(rng, config):
+    """
+    :type rng: random.Random
+    :type config: Config
+    :rtype: list(dict)
+    """
+    frames = []
+
+    for number in xrange(config.frames):
+        frame = {'filename': 'module_%d.py' % number,
+                 'function': 'function_%d' % number,
+                 'lineNo': rng.randint(1, 500)}
+
+        # Some frames (e.g. from libraries) don't have variables.
+        if number % 3 != 2:
+            frame['vars'] = {'var_%d' % i: rng.randint(0, 3)
+                             for i in xrange(config.variables)}
+            frame['vars']['self'] = '<object at 0x%x>' % rng.getrandbits(32)
+
+        frames.append(frame)
+
+    return frames
+
+
+def generate_event(rng, number, count, config=None):
+    """
+    Generate synthetic event resembling events returned by Sentry's API.
+    Events are spread over two weeks, the first one is the newest.
+
+    :type rng: random.Random
+    :param number: number of event
+    :type: int
+    :param count: number of all generated events
+    :type: int
+    :type config: Config
+    :rtype: dict
+    """
+    config = config or Config()
+    breadcrumbs = [
+        generate_breadcrumb(rng, rng.choice(config.categories), position)
+        for position in xrange(rng.randint(0, config.breadcrumbs))]
+    seconds = DAYS * 86400 * number // max(count, 1)
+    day, seconds = divmod(seconds, 86400)
+    year, month, newest_day = NEWEST
+
+    return {
+        'id': str(count - number),
+        'eventID': '%032x' % number,
+        'dateCreated': '%d-%02d-%02dT%02d:%02d:%02dZ' % (
+            year, month, newest_day - day, 23 - seconds // 3600,
+            59 - seconds // 60 % 60, 59 - seconds % 60),
+        'context': {'filename': 'f.py', 'request': '<WSGIRequest>'},
+        'user': ({'id': 'user_%d' % rng.randint(1, config.users)}
+                 if number % 3 else None),
+        'tags': generate_tags(rng, config),
+        'entries': [
+            {'type': 'request',
+             'data': {'headers': generate_headers(rng, config)}},
+            {'type': 'message',
+             'data': {'message': 'boom %s', 'params': ['x']}},
+            {'type': 'exception',
+             'data': {'values': [
+                 {'type': 'ValueError',
+                  'stacktrace': {'frames': generate_frames(rng, config)}}]}},
+            {'type': 'breadcrumbs', 'data': {'values': breadcrumbs}},
+        ],
+    }
+
+
+def generate_events(count, seed=1, config=None):
+    """
+    :param count: number of events
+    :type: int
+    :param seed: seed of random numbers generator
+    :type: int
+    :type config: Config
+    :rtype: iterator<dict>
+    """
+    rng = random.Random(seed)
+
+    for number in xrange(count):
+        yield generate_event(rng, number, count, config)
+
+
+def write_events(pathname, count, seed=1, config=None, format='json'):
+    """
+    Write events the way `query` does without keeping them all in memory.
+
+    :param pathname: path to output file
+    :type: str
+    :param count: number of events
+    :type: int
+    :param seed: seed of random numbers generator
+    :type: int
+    :type config: Config
+    :param format: json (array) or ndjson
+    :type: str
+    """
+    events = generate_events(count, seed, config)
+
+    with open(pathname, 'wb') as f:
+        if format == 'ndjson':
+            for event in events:
+                f.write(json.dumps(event, separators=(',', ':')) + '\n')
+            return
+
+        f.write('[')
+
+        for number, event in enumerate(events):
+            if number:
+                f.write(',')
+
+            f.write('\n  ' + json.dumps(event))
+
+        f.write('\n]')
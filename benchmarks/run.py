@@ -0,0 +1,233 @@
+"""
+Run benchmarks of sentrycli commands on generated events and report time
+and peak memory of each of them as JSON.
+
+    python -m benchmarks.run --events 20000 -o results.json
+    python -m benchmarks.run --events 20000 --baseline results.json
+"""
+import argparse
+import json
+import os
+import platform
+import re
+import shutil
+import subprocess
+import sys
+import tempfile
+import time
+
+from benchmarks.events import Config, write_events
+
+
+LOAD_SCRIPT = ('import sys\n'
+               'from sentrycli.event import load_from_file\n'
+               'for event in load_from_file(sys.argv[1]):\n'
+               '    event.tags\n')
+# Relative change of time reported as regression when comparing results.
+THRESHOLD = 0.1
+
+
+def get_cases(pathname, stub_url):
+    """
+    :param pathname: path to file with events
+    :type: str
+    :param stub_url: URL of API stub
+    :type: str
+    :return: (name, arguments, setup) triples - setup is run before each
+    measurement (if not None)
+    :rtype: list
+    """
+    index = pathname + '.idx'
+
+    def remove_index():
+        if os.path.exists(index):
+            os.remove(index)
+
+    cli = [sys.executable, '-m', 'sentrycli.main']
+    group = cli + ['group', pathname]
+    breadcrumbs = cli + ['breadcrumbs', pathname]
+    output = os.path.join(os.path.dirname(pathname), 'query.json')
+    return [
+        ('load', [sys.executable, '-c', LOAD_SCRIPT, pathname], None),
+        ('group-tags', group + ['--tags', 'server_name', '--no-index'],
+         None),
+        ('group-tags-index-build', group + ['--tags', 'server_name'],
+         remove_index),
+        ('group-tags-index', group + ['--tags', 'server_name'], None),
+        ('group-headers', group + ['--headers', 'User-Agent', '--no-index'],
+         None),
+        ('group-context', group + ['--context', 'id', '--no-index'], None),
+        ('group-params', group + ['--params', 'message', '--no-index'], None),
+        ('group-variables', group + ['--variables', 'var_0'], None),
+        ('group-ctime', group + ['--ctime', 'daily', '--no-index'], None),
+        ('group-breadcrumbs', group + ['--breadcrumbs', 'requests.*query',
+                                       '--tags', 'server_name'], None),
+        ('group-options', group + ['--options'], None),
+        ('breadcrumbs-attributes', breadcrumbs + [
+            '-a', 'requests:data.status_code', 'sync.commit:data.mobile'],
+         None),
+        ('breadcrumbs-options', breadcrumbs + ['-o'], None),
+        ('query', cli + ['query', '1', '--host', stub_url, '--api-key', 'key',
+                         '-o', output, '--no-cache'], None),
+        # Pages are revalidated with ETag after the first run.
+        ('query-cached', cli + ['query', '1', '--host', stub_url,
+                                '--api-key', 'key', '-o', output], None),
+    ]
+
+
+def measure(arguments, env):
+    """
+    Run command and measure it.
+
+    :param arguments: command and its arguments
+    :type: list(str)
+    :param env: environment variables
+    :type: dict
+    :return: wall time in seconds, peak RSS in kilobytes and exit status
+    :rtype: (float, int, int)
+    """
+    with open(os.devnull, 'wb') as devnull:
+        start = time.time()
+        process = subprocess.Popen(arguments, stdout=devnull,
+                                   stderr=devnull, env=env)
+        _, status, usage = os.wait4(process.pid, 0)
+        elapsed = time.time() - start
+
+    # Popen shouldn't try to reap already reaped process.
+    process.returncode = os.WEXITSTATUS(status)
+    return elapsed, usage.ru_maxrss, process.returncode
+
+
+def compare(results, baseline):
+    """
+    Print comparison of results with baseline ones.
+
+    :type results: dict
+    :type baseline: dict
+    :return: names of benchmarks slower by more than `THRESHOLD`
+    :rtype: list(str)
+    """
+    previous = {result['name']: result for result in baseline['results']}
+    regressions = []
+    print >> sys.stderr, '%-25s %10s %10s %8s %10s' % (
+        'benchmark', 'before', 'after', 'change', 'peak RSS')
+
+    for result in results['results']:
+        before = previous.get(result['name'])
+
+        if before is None:
+            continue
+
+        change = result['seconds'] / before['seconds'] - 1
+        memory = result['peak_rss_kb'] / float(before['peak_rss_kb']) - 1
+        print >> sys.stderr, '%-25s %9.3fs %9.3fs %+7.1f%% %+9.1f%%' % (
+            result['name'], before['seconds'], result['seconds'],
+            change * 100, memory * 100)
+
+        if change > THRESHOLD:
+            regressions.append(result['name'])
+
+    return regressions
+
+
+def main():
+    parser = argparse.ArgumentParser(
+        description=__doc__.strip(),
+        formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--events', type=int, default=10000,
+                        help='number of generated events')
+    parser.add_argument('--seed', type=int, default=1)
+    parser.add_argument('--headers', type=int, default=4)
+    parser.add_argument('--tags', type=int, default=4)
+    parser.add_argument('--frames', type=int, default=5)
+    parser.add_argument('--variables', type=int, default=6,
+                        help='number of variables per frame')
+    parser.add_argument('--breadcrumbs', type=int, default=8,
+                        help='max number of breadcrumbs per event')
+    parser.add_argument('--categories', type=int, default=5,
+                        help='number of breadcrumbs categories')
+    parser.add_argument('--latency', type=float, default=0.01,
+                        help="stub API's latency in seconds")
+    parser.add_argument('--repeat', type=int, default=1,
+                        help='run each benchmark that many times and report '
+                             'the fastest run')
+    parser.add_argument('-k', '--filter', help='run only benchmarks matching '
+                                               'regex')
+    parser.add_argument('-o', '--output', help='path to file for results '
+                                               '(standard output by default)')
+    parser.add_argument('--baseline', help='path to results to compare with, '
+                                           'exits with 1 on regressions')
+    args = parser.parse_args()
+    config = Config(headers=args.headers, tags=args.tags, frames=args.frames,
+                    variables=args.variables, breadcrumbs=args.breadcrumbs,
+                    categories=args.categories)
+    directory = tempfile.mkdtemp(prefix='sentrycli-benchmark-')
+    # Don't touch user's preferences.
+    env = dict(os.environ, HOME=directory)
+    root = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+    env['PYTHONPATH'] = os.pathsep.join(
+        filter(None, [root, os.environ.get('PYTHONPATH')]))
+
+    try:
+        pathname = os.path.join(directory, 'events.json')
+        write_events(pathname, args.events, args.seed, config)
+        # Stub runs in separate process so commands started by this one
+        # don't inherit its memory usage (peak RSS survives fork & exec).
+        stub = subprocess.Popen(
+            [sys.executable, '-m', 'benchmarks.stub', pathname, '--port', '0',
+             '--latency', str(args.latency)], stdout=subprocess.PIPE, env=env)
+        stub_url = stub.stdout.readline().split()[-1]
+        results = []
+
+        for name, arguments, setup in get_cases(pathname, stub_url):
+            if args.filter and not re.search(args.filter, name):
+                continue
+
+            runs = []
+
+            for _ in xrange(args.repeat):
+                if setup is not None:
+                    setup()
+
+                runs.append(measure(arguments, env))
+
+            seconds, peak_rss, status = min(runs)
+            results.append({'name': name,
+                            'seconds': round(seconds, 4),
+                            'peak_rss_kb': peak_rss,
+                            'status': status})
+            print >> sys.stderr, '%-25s %8.3fs %8d kB%s' % (
+                name, seconds, peak_rss,
+                ' (exit status %d)' % status if status else '')
+
+        stub.terminate()
+        stub.wait()
+    finally:
+        shutil.rmtree(directory)
+
+    report = {
+        'events': args.events,
+        'seed': args.seed,
+        'config': vars(config),
+        'python': platform.python_version(),
+        'platform': platform.platform(),
+        'results': results,
+    }
+
+    if args.output:
+        with open(args.output, 'w') as f:
+            json.dump(report, f, indent=2)
+    else:
+        print json.dumps(report, indent=2)
+
+    if args.baseline:
+        with open(args.baseline) as f:
+            regressions = compare(report, json.load(f))
+
+        if regressions:
+            print >> sys.stderr, 'Slower: %s' % ', '.join(regressions)
+            sys.exit(1)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,98 @@
+"""
+Check that sentrycli commands import only modules they need and that it
+fits in time budget (seconds spent on imports before command is run).
+
+    python -m benchmarks.startup
+    python -m benchmarks.startup --factor 2 --repeat 10
+"""
+import argparse
+import json
+import os
+import subprocess
+import sys
+
+
+# Imports modules needed to handle command line, prints time it took and
+# names of loaded modules.
+IMPORT_SCRIPT = ('import sys, time\n'
+                 'start = time.time()\n'
+                 'from sentrycli.main import load_commands\n'
+                 'load_commands(sys.argv[1:])\n'
+                 'elapsed = time.time() - start\n'
+                 'import json\n'
+                 'print json.dumps([elapsed, sorted(name for name, module in '
+                 'sys.modules.iteritems() if module is not None)])\n')
+HEAVY = ('requests', 'dateutil', 'sqlite3', 'multiprocessing')
+# (name, arguments, budget in seconds, modules which mustn't be imported)
+CASES = [
+    ('version', ['--version'], 0.05,
+     HEAVY + ('cached_property', 'prettytable', 'sentrycli.group',
+              'sentrycli.query', 'sentrycli.breadcrumbs')),
+    ('group', ['group', 'events.json', '--tags', 'server_name'], 0.12,
+     HEAVY + ('sentrycli.query', 'sentrycli.breadcrumbs',
+              'sentrycli.store')),
+    ('group-profile', ['--profile-dump', 'group.prof', 'group', 'events.json',
+                       '--ctime', 'daily'], 0.12,
+     HEAVY + ('sentrycli.query', 'sentrycli.breadcrumbs')),
+    ('breadcrumbs', ['breadcrumbs', 'events.json', '-a', 'requests:url'],
+     0.12, HEAVY + ('sentrycli.query', 'sentrycli.group', 'sentrycli.store')),
+    ('query', ['query', '1', '--api-key', 'key'], 0.25,
+     ('sqlite3', 'sentrycli.group', 'sentrycli.breadcrumbs')),
+]
+
+
+def run(arguments, env):
+    """
+    :param arguments: arguments of sentrycli
+    :type: list(str)
+    :type env: dict
+    :return: import time in seconds and names of imported modules
+    :rtype: (float, list(str))
+    """
+    output = subprocess.check_output(
+        [sys.executable, '-c', IMPORT_SCRIPT] + arguments, env=env)
+    return json.loads(output)
+
+
+def main():
+    parser = argparse.ArgumentParser(
+        description=__doc__.strip(),
+        formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--repeat', type=int, default=5,
+                        help='run each case that many times and take the '
+                             'fastest run')
+    parser.add_argument('--factor', type=float, default=1.0,
+                        help='multiply time budgets (for slow machines)')
+    args = parser.parse_args()
+    root = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+    env = dict(os.environ)
+    env['PYTHONPATH'] = os.pathsep.join(
+        filter(None, [root, os.environ.get('PYTHONPATH')]))
+    failures = []
+
+    for name, arguments, budget, forbidden in CASES:
+        runs = [run(arguments, env) for _ in xrange(args.repeat)]
+        elapsed = min(seconds for seconds, _ in runs)
+        modules = set(runs[0][1])
+        imported = sorted(module for module in modules
+                          if module in forbidden or
+                          module.split('.')[0] in forbidden)
+        budget *= args.factor
+        print >> sys.stderr, '%-15s %8.3fs (budget %.3fs) %4d modules' % (
+            name, elapsed, budget, len(modules))
+
+        if elapsed > budget:
+            failures.append('%s: over budget' % name)
+
+        if imported:
+            failures.append('%s: imports %s' % (name, ', '.join(imported)))
+
+    for failure in failures:
+        print >> sys.stderr, failure
+
+    if failures:
+        sys.exit(1)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,86 @@
+"""
+Compare grouping events from JSON file with grouping them from SQLite
+store.
+
+    python -m benchmarks.store --events 200000
+"""
+import argparse
+import os
+import shutil
+import tempfile
+import time
+
+from benchmarks.events import generate_events, write_events
+from sentrycli.grouping import scan_files
+from sentrycli.store import scan_store, Store
+
+
+SPECS = [
+    [{'tags': ['server_name']}],
+    [{'headers': ['User-Agent'], 'tags': ['release']}],
+    [{'ctime': 'daily'}],
+    [{'attributes': [('requests', 'data.status_code')]}],
+]
+# Number of events inserted in a single transaction (page size of API).
+BATCH_SIZE = 100
+
+
+def fill_store(pathname, count):
+    """
+    :param pathname: path to database file
+    :type: str
+    :param count: number of events
+    :type: int
+    """
+    with Store(pathname, create=True) as store:
+        batch = []
+
+        for event in generate_events(count):
+            batch.append(event)
+
+            if len(batch) == BATCH_SIZE:
+                store.add('1', batch)
+                batch = []
+
+        store.add('1', batch)
+
+
+def measure(function, *args):
+    """
+    :return: number of seconds function took
+    :rtype: float
+    """
+    start = time.time()
+    function(*args)
+    return time.time() - start
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip())
+    parser.add_argument('--events', type=int, default=100000,
+                        help='number of generated events')
+    args = parser.parse_args()
+    directory = tempfile.mkdtemp(prefix='sentrycli-benchmark-')
+
+    try:
+        json_path = os.path.join(directory, 'events.json')
+        store_path = os.path.join(directory, 'events.db')
+        print 'generate JSON: %.2fs' % measure(write_events, json_path,
+                                               args.events)
+        print 'fill store:    %.2fs' % measure(fill_store, store_path,
+                                               args.events)
+        print 'JSON %.1f MB, store %.1f MB' % (
+            os.path.getsize(json_path) / 1e6,
+            os.path.getsize(store_path) / 1e6)
+
+        for specs in SPECS:
+            json_time = measure(scan_files, [json_path], specs)
+            store_time = measure(scan_store, store_path, specs)
+            print '%-60s JSON %6.2fs  store %6.2fs  (%.1fx)' % (
+                specs, json_time, store_time, json_time / store_time)
+    finally:
+        shutil.rmtree(directory)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,148 @@
+"""
+Local stub of Sentry's API serving events of issues with pagination.
+
+    python -m benchmarks.stub events.json --port 8765 --latency 0.05
+"""
+from BaseHTTPServer import BaseHTTPRequestHandler, HTTPServer
+from hashlib import sha1
+from SocketServer import ThreadingMixIn
+from urlparse import parse_qs, urlparse
+import argparse
+import json
+import re
+import sys
+import threading
+import time
+
+
+ISSUE_EVENTS_RE = re.compile(r'^/api/0/issues/([^/]+)/events/$')
+PAGE_SIZE = 100
+
+
+class StubHandler(BaseHTTPRequestHandler):
+    protocol_version = 'HTTP/1.1'
+
+    def log_message(self, format, *args):
+        pass
+
+    def send(self, code, body, headers=()):
+        content = json.dumps(body)
+        etag = '"%s"' % sha1(content).hexdigest()
+
+        if code == 200 and self.headers.get('If-None-Match') == etag:
+            self.server.not_modified += 1
+            code, content = 304, ''
+
+        self.send_response(code)
+        self.send_header('Content-Type', 'application/json')
+        self.send_header('Content-Length', str(len(content)))
+        self.send_header('ETag', etag)
+
+        for name, value in headers:
+            self.send_header(name, value)
+
+        self.end_headers()
+        self.wfile.write(content)
+
+    def do_GET(self):
+        server = self.server
+        url = urlparse(self.path)
+        server.requests += 1
+
+        if server.latency:
+            time.sleep(server.latency)
+
+        if url.path == '/api/0/':
+            return self.send(200, {'version': '0'})
+
+        match = ISSUE_EVENTS_RE.match(url.path)
+
+        if match is None:
+            return self.send(404, {'detail': 'Not found'})
+
+        cursor = parse_qs(url.query).get('cursor', ['0:0:0'])[0]
+
+        try:
+            offset = int(cursor.split(':')[1])
+        except (IndexError, ValueError):
+            return self.send(400, {'detail': 'Invalid cursor'})
+
+        events = server.events
+        page_size = server.page_size
+        base = 'http://%s%s' % (self.headers['Host'], url.path)
+        previous = max(offset - page_size, 0)
+        following = offset + page_size
+        link = ('<{base}?cursor=0:{previous}:1>; rel="previous"; '
+                'results="{has_previous}"; cursor="0:{previous}:1", '
+                '<{base}?cursor=0:{following}:0>; rel="next"; '
+                'results="{has_next}"; cursor="0:{following}:0"').format(
+            base=base, previous=previous, following=following,
+            has_previous='true' if offset else 'false',
+            has_next='true' if following < len(events) else 'false')
+        self.send(200, events[offset:following], [('Link', link)])
+
+
+class StubServer(ThreadingMixIn, HTTPServer):
+    daemon_threads = True
+
+    def __init__(self, events, port=0, latency=0.0, page_size=PAGE_SIZE):
+        """
+        :param events: events served for every issue (newest first)
+        :type: list(dict)
+        :param port: port to listen on (any free if 0)
+        :type: int
+        :param latency: delay of each response in seconds
+        :type: float
+        :param page_size: number of events per page
+        :type: int
+        """
+        HTTPServer.__init__(self, ('127.0.0.1', port), StubHandler)
+        self.events = events
+        self.latency = latency
+        self.page_size = page_size
+        self.requests = 0
+        # Responses to conditional requests without body.
+        self.not_modified = 0
+
+    @property
+    def url(self):
+        return 'http://%s:%d' % self.server_address
+
+
+def start_stub(events, latency=0.0, page_size=PAGE_SIZE):
+    """
+    Start stub in background thread.
+
+    :type events: list(dict)
+    :type latency: float
+    :type page_size: int
+    :rtype: StubServer
+    """
+    server = StubServer(events, latency=latency, page_size=page_size)
+    thread = threading.Thread(target=server.serve_forever)
+    thread.daemon = True
+    thread.start()
+    return server
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip())
+    parser.add_argument('pathname', help='JSON file with events')
+    parser.add_argument('--port', type=int, default=8765)
+    parser.add_argument('--latency', type=float, default=0.0,
+                        help='delay of each response in seconds')
+    parser.add_argument('--page-size', type=int, default=PAGE_SIZE)
+    args = parser.parse_args()
+
+    with open(args.pathname) as f:
+        events = json.load(f)
+
+    server = StubServer(events, port=args.port, latency=args.latency,
+                        page_size=args.page_size)
+    print 'Serving %d events on %s' % (len(events), server.url)
+    sys.stdout.flush()
+    server.serve_forever()
+
+
+if __name__ == '__main__':
+    main()
@@ -1,20 +1,24 @@
 import logging
-from argparse import ArgumentTypeError
-from collections import Counter, defaultdict
+from collections import defaultdict
+from itertools import chain
 
 from argh import arg, CommandError
 
+from sentrycli.constants import DEFAULT_INTERVAL
 from sentrycli.event import load_from_file
-from sentrycli.table import Table
+from sentrycli.grouping import Plan, parse_attribute, scan_files
+from sentrycli.sampling import get_sampling
+from sentrycli.table import OUTPUT_FORMATS, OUTPUT_TABLE, Table
+from sentrycli.utils import get_sources, parse_datetime
+from sentrycli.where import compile_filter
 
-logging.basicConfig(level=logging.INFO)
 logger = logging.getLogger(__name__)
 
 
 def get_breadcrumbs_categories_with_attributes(events):
     """
     Get breadcrumbs attributes grouped by categories.
-    :type events: list<Event>
+    :type events: iterable<Event>
     :rtype: defaultdict<str: set>
     """
     categories = defaultdict(set)
@@ -42,8 +46,8 @@ def print_options(events):
     """
     Print available breadcrumbs aggregation options.
 
-    :param events: list of events from which gather attributes
-    :type: list
+    :param events: events from which gather attributes
+    :type: iterable
     """
     categories = get_breadcrumbs_categories_with_attributes(events)
     table = Table(['Categories', 'Attributes'], hrules=1)
@@ -53,82 +57,106 @@ def print_options(events):
     print table
 
 
-def parse_attribute(attr):
-    try:
-        category, attr = attr.split(':')
-    except ValueError:
-        raise ArgumentTypeError('should be in format <category>:<attribute>')
-    return category, attr
-
-
-@arg('pathname', help='path to input file')
+@arg('pathnames', nargs='*', metavar='pathname',
+     help='paths to input files (glob patterns are expanded)')
 @arg('--top', type=int, help='show only top x results')
 @arg('-o', '--options', help='list possible grouping options')
 @arg('-a', '--attributes', nargs='+', type=parse_attribute,
      help='attributes to group breadcrumbs, format: <category>:<attr>')
-def breadcrumbs(pathname, attributes=None, top=None, options=False):
+@arg('--per-file', help='break counts down by input file')
+@arg('-j', '--processes', type=int,
+     help='number of worker processes used for many input files '
+          '(defaults to number of CPUs)')
+@arg('--approx', help='count in fixed memory - only top groups (with error '
+                      'bounds) are tracked and number of distinct groups '
+                      'is estimated')
+@arg('--store', help='path to SQLite store (see query --store) to analyze '
+                     'events from instead of input files')
+@arg('--issue', nargs='+', help='analyze only events of these issues (store)')
+@arg('-s', '--since', type=parse_datetime,
+     help="analyze only events created since, format "
+          "'yyyy-mm-dd(Thh:mm:ss)' (store or --follow)")
+@arg('-t', '--to', type=parse_datetime,
+     help="analyze only events created until, format "
+          "'yyyy-mm-dd(Thh:mm:ss)' (store)")
+@arg('-w', '--where', action='append', metavar='PREDICATE',
+     help='analyze only events fulfilling predicate (all of them if repeated) '
+          'e.g. tag:release=5d74084, "tag:server_name in lati1,lati2", '
+          'header:User-Agent~Opera, var:user!=admin, ctime>=2016-04-19 or '
+          '!breadcrumb:requests')
+@arg('--output-format', choices=OUTPUT_FORMATS,
+     help='format of results - table or rows streamed as CSV, TSV or JSON '
+          'lines')
+@arg('--sample', type=int, metavar='N',
+     help='estimate counts from uniform random sample of N events of each '
+          'input file (with confidence intervals)')
+@arg('--sample-rate', type=float, metavar='P',
+     help='estimate counts from events each chosen with probability P '
+          '(0-1)')
+@arg('--stratify', help='sample each day of events separately (with '
+                        '--sample or --sample-rate)')
+@arg('--follow', metavar='ISSUE',
+     help="poll issue's events (host and API key saved by query) and "
+          "refresh results with every new batch until interrupted")
+@arg('--interval', type=float,
+     help='seconds between refreshes with --follow')
+@arg('--window', help='with --follow count only events created in that '
+                      'last period e.g. 15m, 1h')
+def breadcrumbs(pathnames, attributes=None, top=None, options=False,
+                per_file=False, processes=None, store=None, issue=None,
+                since=None, to=None, approx=False, where=None,
+                output_format=OUTPUT_TABLE, sample=None, sample_rate=None,
+                stratify=False, follow=None, interval=DEFAULT_INTERVAL,
+                window=None):
     """
     Analyze and filter event's attributes
     """
-    events = load_from_file(pathname)
+    pathnames = get_sources(pathnames, store, per_file, issue, since, to,
+                            follow)
+    event_filter = compile_filter(where)
+    sampling = get_sampling(sample, sample_rate, stratify)
 
     if options:
-        print_options(events)
+        if store is not None:
+            from sentrycli.store import Store
+
+            with Store(store) as events_store:
+                print_options(events_store.events(
+                    events_store.filter(issue, since, to),
+                    event_filter=event_filter))
+        else:
+            print_options(chain.from_iterable(
+                load_from_file(pathname, event_filter=event_filter)
+                for pathname in pathnames))
         return
 
     if attributes is None:
         raise CommandError('--attributes argument is mandatory')
 
-    if attributes:
-        group_by_attributes(events, attributes, top)
-
+    specs = [{'attributes': attributes, 'top': top, 'approx': approx}]
 
-def group_by_attributes(events, attributes, top):
-    """
-    Group events by specified breadcrumb attributes.
-    :param events: events to group
-    :type: list
-    :param attributes: attributes which we want to analyze
-    :type: list
-    :param top: show only that much results
-    :type: int
-    """
-    values = Counter()
-    column_order = [attribute[1] for attribute in attributes]
+    if sampling is not None:
+        if store is not None or follow is not None:
+            raise CommandError('Sampling cannot be used with --store nor '
+                               '--follow')
 
-    for event in events:
-        found = {}
+        if approx:
+            raise CommandError('Sampling cannot be used with --approx')
 
-        for attribute in attributes:
-            category, attribute_name = attribute
-            attribute_keys = attribute_name.split('.')
-            key = attribute_keys[0]
-            data_key = attribute_keys[1] if len(
-                attribute_keys) > 1 else None
+    if follow is not None:
+        from sentrycli.follow import follow_issue
 
-            for breadcrumb in event.breadcrumbs:
-                if breadcrumb['category'] != category:
-                    continue
-
-                if key not in breadcrumb:
-                    logger.error('Invalid breadcrumb attribute %s', key)
-                    exit(1)
-
-                value = breadcrumb.get(key)
-
-                if data_key is not None and value is not None:
-                    data = value.get('extra', value)
-                    value = data.get(data_key)
-                found[attribute_name] = value
-
-        for attribute in attributes:
-            category, attribute_name = attribute
-            if attribute_name not in found:
-                found[attribute_name] = '<NOT PRESENT>'
+        follow_issue(follow, Plan.from_specs(specs), interval=interval,
+                     window=window, since=since, event_filter=event_filter,
+                     output_format=output_format)
+        return
 
-        if found:
-            values[tuple(found[key] for key in column_order)] += 1
+    if attributes and store is not None:
+        from sentrycli.store import scan_store
 
-    table = Table(attributes + ['count', '%'])
-    table.add_rows(len(events), values.most_common(top))
-    print '\n' + table.by_count()
+        scan_store(store, specs, issue, since, to,
+                   event_filter).render(output_format)
+    elif attributes:
+        plan = scan_files(pathnames, specs, per_file=per_file,
+                          processes=processes, where=where, sample=sampling)
+        plan.render(output_format)
@@ -0,0 +1,246 @@
+from hashlib import sha1
+from urlparse import parse_qsl, urlparse
+import json
+import os
+import re
+import tempfile
+import threading
+
+from requests.adapters import HTTPAdapter
+from requests.structures import CaseInsensitiveDict
+import requests
+
+from sentrycli import profiling
+
+
+# ~/.sentrycli is the preferences file so cache lives next to other
+# applications' caches.
+DEFAULT_CACHE_DIR = os.path.expanduser('~/.cache/sentrycli')
+# Default max size of cache in megabytes.
+DEFAULT_CACHE_SIZE = 512
+ISSUE_EVENTS_RE = re.compile(r'/issues/[^/]+/events/$')
+# Headers of cached responses which are kept.
+HEADERS = ('Content-Type', 'ETag', 'Link')
+
+
+def get_cache_key(url):
+    """
+    :param url: URL of page of issue's events
+    :type: str
+    :return: host, issue's path and cursor of the page
+    :rtype: str
+    """
+    parts = urlparse(url)
+    cursor = dict(parse_qsl(parts.query)).get('cursor', '')
+    return '%s%s?cursor=%s' % (parts.netloc, parts.path, cursor)
+
+
+def is_stable(url):
+    """
+    Check if page never changes. Sentry's cursors are
+    `value:offset:is_prev` - page anchored at value (creation time of
+    events) has only older events. Head page (without cursor) and cursors
+    counted from the newest event (value 0) shift when new events come.
+
+    :param url: URL of page of issue's events
+    :type: str
+    :rtype: bool
+    """
+    cursor = dict(parse_qsl(urlparse(url).query)).get('cursor', '')
+    parts = cursor.split(':')
+    return (len(parts) == 3 and parts[0] not in ('', '0') and
+            parts[2] == '0')
+
+
+class PageCache(object):
+    """
+    Pages of issues' events stored in directory, one file per page
+    (metadata in the first line, body after it). The least recently used
+    ones are evicted when total size exceeds limit.
+    """
+
+    def __init__(self, directory=DEFAULT_CACHE_DIR,
+                 max_size=DEFAULT_CACHE_SIZE * 1024 * 1024):
+        """
+        :param directory: path to directory with cached pages (created if
+        missing)
+        :type: str
+        :param max_size: max total size of cached pages in bytes
+        :type: int
+        """
+        self.directory = directory
+        self.max_size = max_size
+        self.lock = threading.Lock()
+        # Total size of cached pages, computed on the first write.
+        self.size = None
+
+    def get_path(self, key):
+        """
+        :type key: str
+        :rtype: str
+        """
+        return os.path.join(self.directory, sha1(key).hexdigest())
+
+    def get(self, key):
+        """
+        :type key: str
+        :return: metadata (status, headers) and body of cached page
+        :rtype: (dict, str) or None if page isn't cached
+        """
+        path = self.get_path(key)
+
+        try:
+            with open(path, 'rb') as f:
+                meta = json.loads(f.readline())
+                content = f.read()
+        except (IOError, ValueError):
+            return None
+
+        if meta.get('key') != key:
+            return None
+
+        # Modification time is the time of the last use.
+        try:
+            os.utime(path, None)
+        except OSError:
+            pass
+
+        return meta, content
+
+    def put(self, key, status, headers, content):
+        """
+        :type key: str
+        :type status: int
+        :type headers: dict
+        :param content: body of response
+        :type: str
+        """
+        meta = json.dumps({'key': key, 'status': status, 'headers': headers})
+
+        with self.lock:
+            if not os.path.isdir(self.directory):
+                os.makedirs(self.directory)
+
+            if self.size is None:
+                self.size = sum(size for _, size, _ in self.entries())
+
+            path = self.get_path(key)
+            previous = os.path.getsize(path) if os.path.exists(path) else 0
+            descriptor, temporary = tempfile.mkstemp(dir=self.directory,
+                                                     suffix='.tmp')
+
+            with os.fdopen(descriptor, 'wb') as f:
+                f.write(meta + '\n')
+                f.write(content)
+
+            os.rename(temporary, path)
+            self.size += len(meta) + 1 + len(content) - previous
+
+            if self.size > self.max_size:
+                self.evict()
+
+    def entries(self):
+        """
+        :return: modification time, size and path of each cached page
+        :rtype: list(float, int, str)
+        """
+        entries = []
+
+        for name in os.listdir(self.directory):
+            if name.endswith('.tmp'):
+                continue
+
+            path = os.path.join(self.directory, name)
+
+            try:
+                stat = os.stat(path)
+            except OSError:
+                continue
+
+            entries.append((stat.st_mtime, stat.st_size, path))
+
+        return entries
+
+    def evict(self):
+        """
+        Remove the least recently used pages until cache fits its limit.
+        """
+        for _, size, path in sorted(self.entries()):
+            if self.size <= self.max_size:
+                break
+
+            try:
+                os.remove(path)
+            except OSError:
+                continue
+
+            self.size -= size
+            profiling.count('cache evictions')
+
+
+class CachingAdapter(HTTPAdapter):
+    """
+    Transport adapter serving pages of issues' events from `PageCache`.
+    Stable pages (see `is_stable`) are served without touching network,
+    the others are revalidated with If-None-Match if server gave them
+    ETag.
+    """
+
+    def __init__(self, cache, **kwargs):
+        """
+        :type cache: PageCache
+        """
+        super(CachingAdapter, self).__init__(**kwargs)
+        self.cache = cache
+
+    def send(self, request, **kwargs):
+        if (request.method != 'GET' or
+                not ISSUE_EVENTS_RE.search(urlparse(request.url).path)):
+            return super(CachingAdapter, self).send(request, **kwargs)
+
+        key = get_cache_key(request.url)
+        cached = self.cache.get(key)
+
+        if cached is not None and is_stable(request.url):
+            profiling.count('cache hits')
+            return self.build_cached_response(request, cached)
+
+        etag = cached and cached[0]['headers'].get('ETag')
+
+        if etag is not None:
+            request.headers['If-None-Match'] = etag
+
+        response = super(CachingAdapter, self).send(request, **kwargs)
+
+        if response.status_code == 304 and cached is not None:
+            profiling.count('cache revalidations')
+            return self.build_cached_response(request, cached)
+
+        # Other pages could be neither served nor revalidated.
+        if response.status_code == 200 and (
+                is_stable(request.url) or 'ETag' in response.headers):
+            headers = {name: response.headers[name] for name in HEADERS
+                       if name in response.headers}
+            self.cache.put(key, response.status_code, headers,
+                           response.content)
+
+        return response
+
+    def build_cached_response(self, request, cached):
+        """
+        :type request: requests.PreparedRequest
+        :param cached: metadata and body of cached page
+        :type: (dict, str)
+        :rtype: requests.Response
+        """
+        meta, content = cached
+        response = requests.Response()
+        response.status_code = meta['status']
+        response.reason = 'OK'
+        response.headers = CaseInsensitiveDict(meta['headers'])
+        response._content = content
+        response.url = request.url
+        response.request = request
+        response.connection = self
+        response.from_cache = True
+        return response
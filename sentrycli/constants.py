@@ -1 +1,3 @@
 DEFAULT_API_VERSION = 0
+# Default number of seconds between refreshes of followed issue.
+DEFAULT_INTERVAL = 10.0
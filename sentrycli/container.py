@@ -0,0 +1,266 @@
+from bisect import bisect_left, bisect_right
+import json
+import mmap
+import os
+import struct
+
+from sentrycli.utils import parse_timestamp
+
+
+# Layout of binary container of events (integers are little-endian):
+#   header - magic, offset of offset table and number of events,
+#   records - length (uint32) followed by compact JSON of event,
+#   offset table - creation times of events (int64, seconds since epoch)
+#   sorted ascending, followed by offsets of their records (uint64).
+# Offset table is written when writer is closed - until then offset of
+# table in header is 0 and records have to be scanned.
+MAGIC = 'SCLIBIN1'
+HEADER = struct.Struct('<8sQQ')
+LENGTH = struct.Struct('<I')
+TIMESTAMP = struct.Struct('<q')
+OFFSET = struct.Struct('<Q')
+# Number of values of offset table packed at once.
+CHUNK_SIZE = 4096
+
+
+def write_values(f, values, item):
+    """
+    :param f: file object
+    :type: file
+    :type values: list(int)
+    :param item: format of values
+    :type: struct.Struct
+    """
+    code = item.format[-1]
+
+    for start in xrange(0, len(values), CHUNK_SIZE):
+        chunk = values[start:start + CHUNK_SIZE]
+        f.write(struct.pack('<%d%s' % (len(chunk), code), *chunk))
+
+
+def write_header(f, table_offset=0, count=0):
+    """
+    :param f: file object (position is left at the end of header)
+    :type: file
+    :type table_offset: int
+    :type count: int
+    """
+    f.seek(0)
+    f.write(HEADER.pack(MAGIC, table_offset, count))
+
+
+def write_record(f, event):
+    """
+    :param f: file object positioned at the end of records
+    :type: file
+    :type event: dict
+    """
+    record = json.dumps(event, separators=(',', ':'))
+    f.write(LENGTH.pack(len(record)))
+    f.write(record)
+
+
+def write_table(f, timestamps, offsets):
+    """
+    Append offset table after the last record and point header to it.
+
+    :param f: file object
+    :type: file
+    :param timestamps: creation times of events in order of records
+    :type: list(int)
+    :param offsets: offsets of records
+    :type: list(int)
+    """
+    order = sorted(xrange(len(timestamps)), key=timestamps.__getitem__)
+    f.seek(0, os.SEEK_END)
+    table_offset = f.tell()
+    write_values(f, [timestamps[i] for i in order], TIMESTAMP)
+    write_values(f, [offsets[i] for i in order], OFFSET)
+    write_header(f, table_offset, len(timestamps))
+    f.flush()
+
+
+def read_table(f):
+    """
+    Read offset table to keep appending records.
+
+    :param f: file object
+    :type: file
+    :return: offset of table (end of records), creation times and offsets
+    of records
+    :rtype: (int, list(int), list(int))
+    :raises: ValueError if file isn't binary container
+    """
+    with EventContainer(f) as container:
+        if container.timestamps is None:
+            # Table wasn't written - creation times have to be decoded.
+            timestamps = [parse_timestamp(container[i]['dateCreated'])
+                          for i in xrange(len(container))]
+        else:
+            timestamps = list(container.timestamps)
+
+        return container.end, timestamps, list(container.offsets)
+
+
+class Column(object):
+    """
+    Read-only view of array of integers stored in memory-mapped file -
+    values are unpacked on access so nothing is copied when it's opened.
+    """
+
+    def __init__(self, buf, offset, item, count):
+        """
+        :type buf: mmap.mmap
+        :param offset: offset of the first value
+        :type: int
+        :param item: format of values
+        :type: struct.Struct
+        :param count: number of values
+        :type: int
+        """
+        self.buf = buf
+        self.offset = offset
+        self.item = item
+        self.count = count
+
+    def __len__(self):
+        return self.count
+
+    def __getitem__(self, i):
+        if not 0 <= i < self.count:
+            raise IndexError(i)
+
+        return self.item.unpack_from(self.buf,
+                                     self.offset + i * self.item.size)[0]
+
+
+class EventContainer(object):
+    """
+    Memory-mapped binary container of events. Opening it costs the same
+    regardless of its size - events are decoded lazily, one at a time and
+    ranges of creation time are found by binary search in offset table.
+    """
+
+    def __init__(self, f):
+        """
+        :param f: file object
+        :type: file
+        :raises: ValueError if file isn't binary container
+        """
+        try:
+            self.buf = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+        except (ValueError, mmap.error):
+            raise ValueError('Expected binary container of events')
+
+        # Number of bytes of records accessed so far.
+        self.bytes_read = 0
+
+        if len(self.buf) < HEADER.size:
+            self.close()
+            raise ValueError('Expected binary container of events')
+
+        magic, table_offset, count = HEADER.unpack_from(self.buf, 0)
+
+        if magic != MAGIC:
+            self.close()
+            raise ValueError('Expected binary container of events')
+
+        if table_offset:
+            self.end = table_offset
+            self.timestamps = Column(self.buf, table_offset, TIMESTAMP,
+                                     count)
+            self.offsets = Column(self.buf,
+                                  table_offset + count * TIMESTAMP.size,
+                                  OFFSET, count)
+        else:
+            self.scan()
+
+    def scan(self):
+        """
+        Find records of file without offset table (writing was
+        interrupted). Creation times of such events aren't known.
+        """
+        self.offsets = []
+        self.timestamps = None
+        offset = HEADER.size
+        size = len(self.buf)
+
+        while offset + LENGTH.size <= size:
+            length = LENGTH.unpack_from(self.buf, offset)[0]
+
+            if offset + LENGTH.size + length > size:
+                break
+
+            self.offsets.append(offset)
+            offset += LENGTH.size + length
+
+        self.end = offset
+
+    def __len__(self):
+        return len(self.offsets)
+
+    def record(self, i):
+        """
+        :param i: position of event in offset table
+        :type: int
+        :return: JSON of event
+        :rtype: str
+        """
+        offset = self.offsets[i]
+        length = LENGTH.unpack_from(self.buf, offset)[0]
+        self.bytes_read += LENGTH.size + length
+        start = offset + LENGTH.size
+        return self.buf[start:start + length]
+
+    def __getitem__(self, i):
+        return json.loads(self.record(i))
+
+    def select(self, since=None, to=None):
+        """
+        Find events created in given time range.
+
+        :param since: min creation time (seconds since epoch)
+        :type: int
+        :param to: max creation time (seconds since epoch)
+        :type: int
+        :return: range of positions in offset table (all events if
+        creation times aren't known)
+        :rtype: (int, int)
+        """
+        if self.timestamps is None:
+            return 0, len(self)
+
+        start = 0 if since is None else bisect_left(self.timestamps, since)
+        stop = len(self) if to is None else bisect_right(self.timestamps, to)
+        return start, max(start, stop)
+
+    def iter_events(self, since=None, to=None, accept=None):
+        """
+        Decode events one by one (from the oldest if offset table is
+        present).
+
+        :param since: min creation time (seconds since epoch)
+        :type: int
+        :param to: max creation time (seconds since epoch)
+        :type: int
+        :param accept: records for which it returns False are skipped
+        without decoding
+        :type: callable
+        :rtype: iterator<dict>
+        """
+        start, stop = self.select(since, to)
+
+        for i in xrange(start, stop):
+            record = self.record(i)
+
+            if accept is None or accept(record):
+                yield json.loads(record)
+
+    def close(self):
+        self.buf.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *args):
+        self.close()
@@ -1,10 +1,69 @@
 import json
 
 from cached_property import cached_property
-from dateutil.parser import parse
 
+from sentrycli import profiling
+from sentrycli.container import EventContainer, MAGIC
+from sentrycli.orders import intern_category, match_orders, OrderPattern
+from sentrycli.utils import parse_datetime, parse_timestamp
 
-class Event(object):
+
+# Canonical instances of strings seen in compacted events.
+STRINGS = {}
+# Max number of canonical strings - new ones aren't kept once it's reached
+# so memory doesn't grow with number of distinct values.
+MAX_STRINGS = 1 << 16
+
+
+def intern_value(value):
+    """
+    Get canonical instance of string so equal values share memory.
+    Other values are returned untouched.
+
+    :rtype: same as value
+    """
+    if isinstance(value, basestring):
+        interned = STRINGS.get(value)
+
+        if interned is not None:
+            return interned
+
+        if len(STRINGS) < MAX_STRINGS:
+            STRINGS[value] = value
+
+    return value
+
+
+class BreadcrumbsOrdersMixin(object):
+    """
+    Breadcrumbs orders checks. Requires `breadcrumbs_tokens` and
+    `breadcrumbs_categories` attributes.
+    """
+    __slots__ = ()
+
+    def is_breadcrumbs_order_preserved(self, order):
+        """
+        Check if given breadcrumbs order is preserved.
+        :param order: order of categories which should be preserved
+        between ones specified in order.
+        :type: re.SRE_Pattern or sentrycli.orders.OrderPattern
+        :rtype: bool
+        """
+        if isinstance(order, OrderPattern):
+            return match_orders([order], self)
+
+        return bool(order.search(self.breadcrumbs_categories))
+
+    def are_breadcrumbs_orders_preserved(self, orders):
+        """
+        Check if all given breadcrumbs orders are preserved.
+        :type orders: list(sentrycli.orders.OrderPattern)
+        :rtype: bool
+        """
+        return match_orders(orders, self)
+
+
+class Event(BreadcrumbsOrdersMixin):
     def __init__(self, raw):
         self.raw = raw
 
@@ -18,7 +77,17 @@ class Event(object):
 
         :rtype: datetime.datetime
         """
-        return parse(self.raw['dateCreated'])
+        return parse_datetime(self.raw['dateCreated'])
+
+    @cached_property
+    def timestamp(self):
+        """
+        Get event's creation time as number of seconds since epoch (wall
+        time, time zone offset is ignored).
+
+        :rtype: int
+        """
+        return parse_timestamp(self.raw['dateCreated'])
 
     @cached_property
     def headers(self):
@@ -62,30 +131,46 @@ class Event(object):
     @cached_property
     def frames(self):
         """
-        Get event's stack frames.
+        Get event's stack frames - frames of all exceptions in the chain.
 
         :rtype: list
         """
+        frames = []
+
         for entry in self:
             if entry['type'] == 'exception':
-                # TODO does `entry['data']['values']` have always 1 element?
-                return entry['data']['values'][0]['stacktrace']['frames']
+                for value in entry['data'].get('values') or []:
+                    stacktrace = value.get('stacktrace') or {}
+                    frames.extend(stacktrace.get('frames') or [])
 
-        return []
+        return frames
 
     @cached_property
-    def vars(self):
+    def variables(self):
         """
-        Get event's variables from all its stack frames.
+        Get event's variables with values from the first stack frame having
+        them set, built in a single pass over frames. Frames without
+        variables (e.g. from libraries) are skipped.
 
-        :rtype: set
+        :rtype: dict
         """
-        values = set()
+        variables = {}
 
         for frame in self.frames:
-            values |= set(frame.get('vars', []))
+            for name, value in (frame.get('vars') or {}).iteritems():
+                if variables.get(name) is None:
+                    variables[name] = value
 
-        return values
+        return variables
+
+    @cached_property
+    def vars(self):
+        """
+        Get names of event's variables from all its stack frames.
+
+        :rtype: set
+        """
+        return set(self.variables)
 
     @cached_property
     def tags(self):
@@ -111,27 +196,361 @@ class Event(object):
 
         return breadcrumbs
 
-    def is_breadcrumbs_order_preserved(self, order):
+    @cached_property
+    def breadcrumbs_by_category(self):
         """
-        Check if given breadcrumbs order is preserved.
-        :param order: order of categories which should be preserved
-        between ones specified in order.
-        :type: re.SRE_Pattern
-        :rtype: bool
+        Get event's last breadcrumb of each category.
+
+        :rtype: dict
+        """
+        return {breadcrumb['category']: breadcrumb
+                for breadcrumb in self.breadcrumbs}
+
+    @cached_property
+    def breadcrumbs_tokens(self):
+        """
+        Get event's breadcrumbs categories interned as integer tokens.
+
+        :rtype: tuple
         """
-        categories = (breadcrumb['category'] for breadcrumb in self.breadcrumbs)
-        categories_str = ' '.join(categories)
-        return bool(order.search(categories_str))
+        return tuple(intern_category(breadcrumb['category'])
+                     for breadcrumb in self.breadcrumbs)
+
+    @cached_property
+    def breadcrumbs_categories(self):
+        """
+        Get event's breadcrumbs categories joined with spaces.
+
+        :rtype: str
+        """
+        return ' '.join(breadcrumb['category']
+                        for breadcrumb in self.breadcrumbs)
+
+    def get_var(self, name):
+        """
+        Get value of variable from the first stack frame having it.
+
+        :type name: str
+        :rtype: anything or None if not found
+        """
+        return self.variables.get(name)
+
+    def get_vars(self, names):
+        """
+        Get values of many variables in a single pass over stack frames
+        which stops as soon as all of them are found. Unlike `variables`
+        doesn't index all variables of all frames.
+
+        :type names: set(str)
+        :return: values by names of found variables
+        :rtype: dict
+        """
+        if 'variables' in self.__dict__:
+            variables = self.variables
+            return {name: variables[name] for name in names
+                    if variables.get(name) is not None}
+
+        values = {}
+        missing = set(names)
+
+        for frame in self.frames:
+            variables = frame.get('vars')
+
+            if not variables:
+                continue
+
+            for name in missing:
+                value = variables.get(name)
+
+                if value is not None:
+                    values[name] = value
+
+            if len(values) == len(names):
+                break
 
+            missing.difference_update(values)
 
-def load_from_file(pathname):
+        return values
+
+
+class CompactEvent(BreadcrumbsOrdersMixin):
+    """
+    Event holding only fields needed by a command (see `Projection`) with
+    interned strings. Raw payload isn't kept.
+    """
+    __slots__ = ('timestamp', 'headers', 'context', 'params', 'tags',
+                 'variables', 'breadcrumbs_by_category', 'breadcrumbs_tokens',
+                 'breadcrumbs_categories')
+
+    def get_var(self, name):
+        """
+        :type name: str
+        :rtype: anything or None if not found
+        """
+        return self.variables.get(name)
+
+
+class Projection(object):
+    """
+    Fields of events needed by a command.
+    """
+
+    def __init__(self):
+        self.ctime = False
+        self.headers = set()
+        self.context = set()
+        self.params = set()
+        self.tags = set()
+        self.variables = set()
+        # Breadcrumbs' keys by category.
+        self.attributes = {}
+        self.tokens = False
+        self.categories = False
+        # Share memory of equal values (pointless when compacted events
+        # aren't kept e.g. by approximate counting).
+        self.intern_values = True
+
+    def compact(self, event):
+        """
+        Extract needed fields from event.
+
+        :type event: Event
+        :rtype: CompactEvent
+        """
+        compact = CompactEvent()
+        compact.timestamp = event.timestamp if self.ctime else None
+        compact.headers = self.select(event.headers, self.headers)
+        compact.context = self.select(event.context, self.context)
+        compact.params = self.select(event.params, self.params)
+        compact.tags = self.select(event.tags, self.tags)
+        compact.variables = {}
+
+        if self.variables:
+            for name, value in event.get_vars(self.variables).iteritems():
+                if self.intern_values:
+                    value = intern_value(value)
+
+                compact.variables[intern_value(name)] = value
+
+        compact.breadcrumbs_by_category = {}
+
+        if self.attributes:
+            by_category = event.breadcrumbs_by_category
+
+            for category, keys in self.attributes.iteritems():
+                breadcrumb = by_category.get(category)
+
+                if breadcrumb is not None:
+                    compact.breadcrumbs_by_category[category] = {
+                        key: breadcrumb[key] for key in keys
+                        if key in breadcrumb}
+
+        compact.breadcrumbs_tokens = (event.breadcrumbs_tokens
+                                      if self.tokens else ())
+        compact.breadcrumbs_categories = (event.breadcrumbs_categories
+                                          if self.categories else '')
+        return compact
+
+    def select(self, values, keys):
+        """
+        :param values: event's property
+        :type: dict
+        :param keys: needed keys
+        :type: set
+        :rtype: dict
+        """
+        if not keys or not values:
+            return {}
+
+        if not self.intern_values:
+            return {intern_value(key): values[key]
+                    for key in keys if key in values}
+
+        return {intern_value(key): intern_value(values[key])
+                for key in keys if key in values}
+
+
+CHUNK_SIZE = 1 << 16
+WHITESPACE = ' \t\n\r'
+
+
+def iter_json_array(f, chunk_size=CHUNK_SIZE):
+    """
+    Incrementally decode elements of top-level JSON array.
+    Only a single element is held in memory at once (plus read buffer).
+
+    :param f: file object positioned before the opening bracket
+    :type: file
+    :param chunk_size: number of bytes read at once
+    :type: int
+    :rtype: iterator<dict>
+    """
+    decoder = json.JSONDecoder()
+    buf = ''
+
+    while not buf:
+        chunk = f.read(chunk_size)
+
+        if not chunk:
+            break
+
+        buf = chunk.lstrip(WHITESPACE)
+
+    if not buf.startswith('['):
+        raise ValueError('Expected JSON array')
+
+    pos = 1
+    eof = False
+
+    while True:
+        while pos < len(buf) and buf[pos] in WHITESPACE + ',':
+            pos += 1
+
+        if pos == len(buf):
+            if eof:
+                raise ValueError('Unterminated JSON array')
+
+            chunk = f.read(chunk_size)
+            eof = not chunk
+            buf = buf[pos:] + chunk
+            pos = 0
+            continue
+
+        if buf[pos] == ']':
+            return
+
+        try:
+            element, end = decoder.raw_decode(buf, pos)
+        except ValueError:
+            if eof:
+                raise
+            end = None
+
+        # Scalar touching the end of buffer might be cut in half.
+        if end is None or (end == len(buf) and not eof):
+            # Element doesn't fit into buffer yet. Grow reads geometrically
+            # so huge events don't get decoded over and over again.
+            chunk = f.read(max(chunk_size, len(buf) - pos))
+            eof = not chunk
+            buf = buf[pos:] + chunk
+            pos = 0
+            continue
+
+        yield element
+        pos = end
+
+        if pos > chunk_size:
+            buf = buf[pos:]
+            pos = 0
+
+
+def iter_json_lines(f, accept=None):
+    """
+    Decode newline-delimited JSON (one element per line).
+
+    :param f: file object
+    :type: file
+    :param accept: lines for which it returns False are skipped without
+    decoding
+    :type: callable
+    :rtype: iterator<dict>
     """
-    Load events from file.
+    for line in f:
+        line = line.strip()
+
+        if line and (accept is None or accept(line)):
+            yield json.loads(line)
+
+
+def detect_format(f):
+    """
+    Detect if file holds JSON array, newline-delimited JSON or binary
+    container (see `sentrycli.container`). File position is left unchanged.
+
+    :param f: file object
+    :type: file
+    :rtype: str ('json', 'ndjson' or 'binary')
+    """
+    start = f.tell()
+    head = f.read(CHUNK_SIZE)
+
+    if head.startswith(MAGIC):
+        f.seek(start)
+        return 'binary'
+
+    head = head.lstrip(WHITESPACE)
+
+    while not head:
+        chunk = f.read(CHUNK_SIZE)
+
+        if not chunk:
+            break
+
+        head = chunk.lstrip(WHITESPACE)
+
+    f.seek(start)
+    return 'json' if head.startswith('[') else 'ndjson'
+
+
+def load_from_file(pathname, projection=None, event_filter=None):
+    """
+    Load events from file lazily, one event at a time.
+    JSON array, newline-delimited JSON and binary container files are
+    supported - the last is memory-mapped and only events in range of
+    creation time allowed by filter are decoded.
+
     :param pathname: path to the file containing events.
     :type: str
-    :rtype: list<Event>
+    :param projection: if specified, only needed fields are kept
+    :type: Projection
+    :param event_filter: if specified, only events passing it are loaded -
+    it's checked before fields are extracted (and for newline-delimited
+    JSON partially even before decoding)
+    :type: sentrycli.where.Filter
+    :rtype: iterator<Event> or iterator<CompactEvent>
     """
-    with open(pathname) as f:
-        events = json.load(f)
+    with open(pathname, 'rb') as f:
+        file_format = detect_format(f)
+        container = None
+
+        if file_format == 'binary':
+            container = EventContainer(f)
+
+            if event_filter is not None:
+                since, to = event_filter.get_ctime_range()
+                events = container.iter_events(
+                    since, to, accept=event_filter.accepts_text)
+            else:
+                events = container.iter_events()
+        elif file_format == 'json':
+            events = iter_json_array(f)
+        elif event_filter is not None:
+            events = iter_json_lines(f, accept=event_filter.accepts_text)
+        else:
+            events = iter_json_lines(f)
+
+        if projection is not None:
+            compact = profiling.wrap(projection.compact, 'extract')
+
+        if event_filter is not None:
+            event_filter = profiling.wrap(event_filter, 'filter')
+
+        number = 0
+
+        try:
+            for number, event in enumerate(profiling.timed(events, 'decode'),
+                                           1):
+                event = Event(event)
+
+                if event_filter is not None and not event_filter(event):
+                    continue
+
+                yield event if projection is None else compact(event)
+        finally:
+            # Counted also when generator is closed before the end.
+            profiling.count('events', number)
+            profiling.count('bytes read', f.tell() if container is None
+                            else container.bytes_read)
 
-    return [Event(event) for event in events]
+            if container is not None:
+                container.close()
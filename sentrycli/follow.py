@@ -0,0 +1,274 @@
+from collections import deque
+from datetime import datetime
+import logging
+import sys
+import time
+
+from argh import CommandError
+
+from sentrycli import profiling
+from sentrycli.constants import DEFAULT_API_VERSION, DEFAULT_INTERVAL
+from sentrycli.event import Event
+from sentrycli.preferences import Preferences
+from sentrycli.query import (Backoff, check_api_key, create_session,
+                             get_issue_url, get_next_url, get_page,
+                             KnownEvents)
+from sentrycli.table import OUTPUT_TABLE
+from sentrycli.utils import (parse_datetime, parse_duration,
+                             parse_timestamp, to_timestamp, to_utc)
+
+
+logger = logging.getLogger(__name__)
+
+# Moves cursor to the top left corner and clears terminal.
+CLEAR_SCREEN = '\x1b[H\x1b[2J'
+
+
+def fetch_new_events(url, session, backoff, known=None, start=None):
+    """
+    Download issue's events page by page (without prefetching - usually
+    all new events fit in the first page) until already seen one is
+    reached.
+
+    :param url: URL of the first page
+    :type: str
+    :type session: requests.Session
+    :type backoff: sentrycli.query.Backoff
+    :param known: newest already seen event
+    :type: sentrycli.query.KnownEvents
+    :param start: ignore events created before (seconds since epoch)
+    :type: int
+    :return: new events sorted from the newest
+    :rtype: list(dict)
+    :raises: argh.CommandError if server returned error
+    """
+    events = []
+
+    while url is not None:
+        response = get_page(session, url, backoff)
+
+        if not response.ok:
+            raise CommandError('Server returned %d' % response.status_code)
+
+        with profiling.stage('decode'):
+            page = response.json()
+
+        for event in page:
+            if start is not None and (
+                    parse_timestamp(event['dateCreated']) < start):
+                return events
+
+            if known is not None:
+                created = parse_datetime(event['dateCreated'])
+
+                if known.is_older(created):
+                    return events
+
+                if event['id'] in known.ids:
+                    continue
+
+            events.append(event)
+
+        url = get_next_url(response)
+
+    return events
+
+
+class Follower(object):
+    """
+    Keeps groupings of issue's events up to date - each poll adds only
+    events newer than the last seen one. With time window, events which
+    get older than that are removed from counts.
+    """
+
+    def __init__(self, plan, url, session, window=None, since=None,
+                 event_filter=None):
+        """
+        :param plan: groupings to update
+        :type: sentrycli.grouping.Plan
+        :param url: URL of the first page of issue's events
+        :type: str
+        :type session: requests.Session
+        :param window: count only events created in that many last seconds
+        :type: int
+        :param since: ignore events created before (seconds since epoch)
+        :type: int
+        :type event_filter: sentrycli.where.Filter
+        """
+        self.plan = plan
+        self.url = url
+        self.session = session
+        self.window = window
+        self.since = since
+        self.event_filter = event_filter
+        self.projection = plan.projection()
+        self.backoff = Backoff()
+        self.known = None
+        # Counted events in order of creation (only kept with window).
+        self.events = deque()
+        self.total = 0
+
+        if window is not None:
+            self.projection.ctime = True
+
+    def get_start(self, now):
+        """
+        :param now: seconds since epoch
+        :type: int
+        :return: creation time of the oldest event which should be counted
+        (seconds since epoch)
+        :rtype: int or None
+        """
+        if self.window is None:
+            return self.since
+
+        start = now - self.window
+        return start if self.since is None else max(self.since, start)
+
+    def poll(self, now):
+        """
+        Get new events and add them to counts.
+
+        :param now: seconds since epoch
+        :type: int
+        :return: number of new events (not only the ones passing filter)
+        :rtype: int
+        """
+        events = fetch_new_events(self.url, self.session, self.backoff,
+                                  known=self.known,
+                                  start=self.get_start(now))
+
+        if not events:
+            return 0
+
+        known = KnownEvents.from_newest(events)
+
+        # The newest event can be created in the same second as the last
+        # seen ones.
+        if self.known is not None and known.ctime == self.known.ctime:
+            known.ids |= self.known.ids
+
+        self.known = known
+        compacted = []
+
+        with profiling.stage('extract'):
+            for event in reversed(events):
+                event = Event(event)
+
+                if (self.event_filter is not None and
+                        not self.event_filter(event)):
+                    continue
+
+                compacted.append(self.projection.compact(event))
+
+        self.plan.scan(compacted)
+        self.total += len(compacted)
+        profiling.count('events', len(events))
+
+        if self.window is not None:
+            self.events.extend(compacted)
+
+        return len(events)
+
+    def expire(self, now):
+        """
+        Remove events which got out of window from counts.
+
+        :param now: seconds since epoch
+        :type: int
+        :return: number of removed events
+        :rtype: int
+        """
+        if self.window is None:
+            return 0
+
+        start = now - self.window
+        expired = []
+
+        while self.events and self.events[0].timestamp < start:
+            expired.append(self.events.popleft())
+
+        self.plan.discard(expired)
+        self.total -= len(expired)
+        return len(expired)
+
+
+def follow_issue(issue, plan, interval=None, window=None,
+                 since=None, event_filter=None, output_format=OUTPUT_TABLE):
+    """
+    Poll issue's events and print updated groupings until interrupted.
+    Host and API key are taken from saved preferences (see `query`).
+
+    :param issue: issue's identifier
+    :type: str
+    :type plan: sentrycli.grouping.Plan
+    :param interval: seconds between refreshes (`DEFAULT_INTERVAL` if not
+    specified)
+    :type: float
+    :param window: count only events created in that period e.g. 15m
+    :type: str
+    :param since: ignore events created before
+    :type: datetime
+    :type event_filter: sentrycli.where.Filter
+    :param output_format: one of `sentrycli.table.OUTPUT_FORMATS`
+    :type: str
+    :raises: argh.CommandError if arguments are invalid
+    """
+    if interval is None:
+        interval = DEFAULT_INTERVAL
+
+    if interval <= 0:
+        raise CommandError('--interval has to be positive')
+
+    if window is not None:
+        try:
+            window = parse_duration(window)
+        except ValueError:
+            raise CommandError('--window should be duration e.g. 15m')
+
+        if any(grouping.approx for grouping in plan.groupings):
+            raise CommandError('--window cannot be used with --approx')
+
+    if since is not None:
+        since = to_timestamp(to_utc(since))
+
+    preferences = Preferences()
+
+    if preferences.host is None or preferences.api_key is None:
+        raise CommandError('Host and API key not found in saved preferences '
+                           '(run query with --host and --api-key first)')
+
+    session = create_session(preferences.api_key)
+
+    if not check_api_key(key=preferences.api_key,
+                         host=preferences.host,
+                         version=DEFAULT_API_VERSION,
+                         session=session):
+        return
+
+    url = get_issue_url(preferences.host, DEFAULT_API_VERSION, issue)
+    follower = Follower(plan, url, session, window=window, since=since,
+                        event_filter=event_filter)
+    logger.info('Following issue %s, refreshing every %.1fs (Ctrl+C to '
+                'stop)', issue, interval)
+
+    # Streamed rows are kept apart from status.
+    status = sys.stdout if output_format == OUTPUT_TABLE else sys.stderr
+
+    try:
+        while True:
+            now = int(time.time())
+            new = follower.poll(now)
+            expired = follower.expire(now)
+
+            if sys.stdout.isatty():
+                sys.stdout.write(CLEAR_SCREEN)
+
+            plan.render(output_format)
+            print >> status, 'Updated %s: %d new, %d expired, %d counted ' \
+                'events' % (datetime.now().strftime('%H:%M:%S'), new, expired,
+                            follower.total)
+            sys.stdout.flush()
+            time.sleep(interval)
+    except KeyboardInterrupt:
+        pass
@@ -1,55 +1,67 @@
-import logging
-import re
 from collections import Counter
-from datetime import datetime
-from itertools import izip_longest
+from itertools import chain, compress, izip, izip_longest
 
-from argh import arg
+from argh import arg, CommandError
 
+from sentrycli import profiling
+from sentrycli.constants import DEFAULT_INTERVAL
 from sentrycli.event import load_from_file
-from sentrycli.table import Table
-from sentrycli.utils import check_required_keys_present
+from sentrycli.grouping import (count_buckets, CTIME_MODES, get_bucket_width,
+                                Plan, load_specs, parse_grouping,
+                                print_ctime_grouping, print_grouping,
+                                scan_files, T_CONTEXT, T_HEADER, T_PARAM,
+                                T_TAG, T_VAR)
+from sentrycli.index import get_index
+from sentrycli.sampling import get_sampling
+from sentrycli.table import OUTPUT_FORMATS, OUTPUT_TABLE, Table
+from sentrycli.utils import (check_required_keys_present, get_sources,
+                             parse_datetime)
+from sentrycli.where import compile_filter
 
-logging.basicConfig(level=logging.INFO)
 
+# Event's properties holding values of given key type.
+PROPS = {
+    T_HEADER: 'headers',
+    T_CONTEXT: 'context',
+    T_PARAM: 'params',
+    T_TAG: 'tags',
+}
 
-T_HEADER = 'header'
-T_CONTEXT = 'context'
-T_PARAM = 'param'
-T_VAR = 'var'
-T_TAG = 'tag'
-ORDER_META_KEY = ('breadcrumb', 'breadcrumbs in order')
 
+OPTIONS_PROPS = ('headers', 'context', 'params', 'variables', 'tags')
 
-def get_keys(prop, events):
+
+def get_keys(props, events):
     """
-    Get all distinct keys from events' property.
-    :rtype: set
+    Get all distinct keys from events' properties in a single pass.
+
+    :param props: names of events' properties
+    :type: list(str)
+    :param events: events from which gather keys
+    :type: iterable
+    :rtype: list(list)
     """
-    keys = set()
+    keys = [set() for _ in props]
 
     for event in events:
-        res = getattr(event, prop)
+        for prop_keys, prop in zip(keys, props):
+            res = getattr(event, prop)
 
-        if res is not None:
-            keys |= set(res)
+            if res is not None:
+                prop_keys.update(res)
 
-    keys = sorted(keys)
-    return keys
+    return [sorted(prop_keys) for prop_keys in keys]
 
 
 def print_options(events):
     """
     Print available aggregration options (headers, context, tags etc.)
 
-    :param events: list of events from which gather attributes
-    :type: list
+    :param events: events from which gather attributes
+    :type: iterable
     """
-    headers = get_keys('headers', events)
-    context = get_keys('context', events)
-    params = get_keys('params', events)
-    variables = get_keys('vars', events)
-    tags = get_keys('tags', events)
+    headers, context, params, variables, tags = get_keys(OPTIONS_PROPS,
+                                                         events)
 
     table = Table(['Headers', 'Context', 'Params', 'Vars', 'Tags'])
 
@@ -59,12 +71,15 @@ def print_options(events):
     print table
 
 
-@arg('pathname', help='path to input file')
+@arg('pathnames', nargs='*', metavar='pathname',
+     help='paths to input files (glob patterns are expanded)')
 @arg('--headers', help='headers', nargs='+')
 @arg('--context', help='context', nargs='+')
 @arg('--params', help='params', nargs='+')
 @arg('--variables', help='variables', nargs='+')
-@arg('--ctime', help='creation time', choices=('daily', 'monthly'))
+@arg('--ctime', help='creation time', choices=sorted(CTIME_MODES))
+@arg('--bucket', help='group by creation time using buckets of given width '
+                      'e.g. 30s, 15m, 2h, 1d')
 @arg('--breadcrumbs', nargs='+',
      help='analyze if events order of breadcrumbs categories is fullfiled. '
           'Order should be in Python regex format. Use `.*` for any number of'
@@ -72,29 +87,92 @@ def print_options(events):
 @arg('--tags', help='tags', nargs='+')
 @arg('--top', type=int, help='show only top x results')
 @arg('-o', '--options', help='list possible grouping options')
-def group(pathname, headers=None, context=None, params=None, breadcrumbs=None,
-          variables=None, tags=None, options=False, ctime=None, top=None):
-
-    events = load_from_file(pathname)
+@arg('--no-index', help="don't use (nor build) sidecar index file")
+@arg('-g', '--grouping', action='append', type=parse_grouping,
+     help='compute additional grouping in the same pass over events, '
+          'format: "key=value[,value...] ..." where keys are named after '
+          'group and breadcrumbs arguments e.g. "tags=server_name top=5", '
+          '"ctime=daily" or "attributes=requests:data.status_code"; '
+          'can be repeated')
+@arg('--spec', help='path to JSON file with list of groupings e.g. '
+                    '[{"tags": ["release"]}, {"ctime": "daily"}]')
+@arg('--per-file', help='break counts down by input file')
+@arg('-j', '--processes', type=int,
+     help='number of worker processes used for many input files '
+          '(defaults to number of CPUs)')
+@arg('--approx', help='count in fixed memory - only top groups (with error '
+                      'bounds) are tracked and number of distinct groups '
+                      'is estimated')
+@arg('--store', help='path to SQLite store (see query --store) to group '
+                     'events from instead of input files')
+@arg('--issue', nargs='+', help='group only events of these issues (store)')
+@arg('-s', '--since', type=parse_datetime,
+     help="group only events created since, format 'yyyy-mm-dd(Thh:mm:ss)' "
+          "(store or --follow)")
+@arg('-t', '--to', type=parse_datetime,
+     help="group only events created until, format "
+          "'yyyy-mm-dd(Thh:mm:ss)' (store)")
+@arg('-w', '--where', action='append', metavar='PREDICATE',
+     help='group only events fulfilling predicate (all of them if repeated) '
+          'e.g. tag:release=5d74084, "tag:server_name in lati1,lati2", '
+          'header:User-Agent~Opera, var:user!=admin, ctime>=2016-04-19 or '
+          '!breadcrumb:requests')
+@arg('--output-format', choices=OUTPUT_FORMATS,
+     help='format of results - table or rows streamed as CSV, TSV or JSON '
+          'lines')
+@arg('--sample', type=int, metavar='N',
+     help='estimate counts from uniform random sample of N events of each '
+          'input file (with confidence intervals)')
+@arg('--sample-rate', type=float, metavar='P',
+     help='estimate counts from events each chosen with probability P '
+          '(0-1)')
+@arg('--stratify', help='sample each day of events separately (with '
+                        '--sample or --sample-rate)')
+@arg('--follow', metavar='ISSUE',
+     help="poll issue's events (host and API key saved by query) and "
+          "refresh results with every new batch until interrupted")
+@arg('--interval', type=float,
+     help='seconds between refreshes with --follow')
+@arg('--window', help='with --follow count only events created in that '
+                      'last period e.g. 15m, 1h')
+def group(pathnames, headers=None, context=None, params=None,
+          breadcrumbs=None, variables=None, tags=None, options=False,
+          ctime=None, top=None, no_index=False, grouping=None, spec=None,
+          per_file=False, processes=None, bucket=None, store=None,
+          issue=None, since=None, to=None, approx=False, where=None,
+          output_format=OUTPUT_TABLE, sample=None, sample_rate=None,
+          stratify=False, follow=None, interval=DEFAULT_INTERVAL,
+          window=None):
+
+    pathnames = get_sources(pathnames, store, per_file, issue, since, to,
+                            follow)
+    ctime = bucket or ctime
+    event_filter = compile_filter(where)
+    sampling = get_sampling(sample, sample_rate, stratify)
 
     if options:
-        print_options(events)
+        if store is not None:
+            from sentrycli.store import Store
+
+            with Store(store) as events_store:
+                print_options(events_store.events(
+                    events_store.filter(issue, since, to),
+                    event_filter=event_filter))
+        else:
+            print_options(chain.from_iterable(
+                load_from_file(pathname, event_filter=event_filter)
+                for pathname in pathnames))
         return
 
     check_required_keys_present([
         'headers', 'context', 'params', 'variables', 'tags', 'ctime',
-        'breadcrumbs'], locals())
+        'bucket', 'breadcrumbs', 'grouping', 'spec'], locals())
 
     headers = headers or []
     context = context or []
     params = params or []
     variables = variables or []
     tags = tags or []
-    breadcrumbs = [re.compile(breadcrumb) for breadcrumb in breadcrumbs or []]
-
-    if ctime is not None:
-        group_by_ctime(events, ctime)
-        return
 
     keys = []
     keys.extend([(T_HEADER, header) for header in headers])
@@ -103,103 +181,98 @@ def group(pathname, headers=None, context=None, params=None, breadcrumbs=None,
     keys.extend([(T_VAR, var) for var in variables])
     keys.extend([(T_TAG, tag) for tag in tags])
 
-    if len(breadcrumbs):
-        keys.extend([ORDER_META_KEY])
-
-    values = Counter()
-
-    for event in events:
-        meta = {}
-
-        for header in headers:
-            meta[(T_HEADER, header)] = event.headers.get(header)
-
-        for var in context:
-            meta[(T_CONTEXT, var)] = event.context.get(var)
+    specs = []
 
-        for param in params:
-            meta[(T_PARAM, param)] = event.params.get(param)
-
-        for tag in tags:
-            meta[(T_TAG, tag)] = event.tags.get(tag)
-
-        for var in variables:
-            for frame in event.frames:
-                res = frame['vars'].get(var)
+    if ctime is not None:
+        specs.append({'ctime': ctime, 'top': top})
+    elif keys or breadcrumbs:
+        specs.append({'headers': headers, 'context': context,
+                      'params': params, 'variables': variables,
+                      'tags': tags, 'breadcrumbs': breadcrumbs, 'top': top,
+                      'approx': approx})
 
-                if res is not None:
-                    meta[(T_VAR, var)] = res
-                    break
+    specs.extend(grouping or [])
 
-        if len(breadcrumbs):
-            meta[ORDER_META_KEY] = False
+    if spec is not None:
+        specs.extend(load_specs(spec))
 
-            for breadcrumb in breadcrumbs:
-                if not event.is_breadcrumbs_order_preserved(breadcrumb):
-                    break
-            else:
-                meta[ORDER_META_KEY] = True
+    if sampling is not None:
+        if store is not None or follow is not None:
+            raise CommandError('Sampling cannot be used with --store nor '
+                               '--follow')
 
-        value = tuple(meta.get(key) for key in keys)
-        values[value] += 1
+        if any(item.get('approx') for item in specs):
+            raise CommandError('Sampling cannot be used with --approx')
 
-    print_grouping([key[1] for key in keys], values, top)
+    if follow is not None:
+        from sentrycli.follow import follow_issue
 
+        follow_issue(follow, Plan.from_specs(specs), interval=interval,
+                     window=window, since=since, event_filter=event_filter,
+                     output_format=output_format)
+        return
 
-def group_by_ctime(events, mode):
-    """
-    Group events by creation time.
-    :param events: events to group
-    :type: list
-    :param mode: grouping mode (daily or monthly)
-    :type: str
-    """
-    counter = Counter()
-    total = 0
+    if store is not None:
+        from sentrycli.store import scan_store
 
-    for event in events:
-        if mode == 'daily':
-            day = event.ctime.day
-        elif mode == 'monthly':
-            day = 1
+        scan_store(store, specs, issue, since, to,
+                   event_filter).render(output_format)
+        return
 
-        key = datetime(event.ctime.year, event.ctime.month, day)
+    indexable = not (no_index or variables or breadcrumbs or grouping or
+                     spec or per_file or (approx and ctime is None) or
+                     sampling is not None)
 
-        counter[key] += 1
-        total += 1
+    if indexable and len(pathnames) == 1:
+        pathname = pathnames[0]
+        with profiling.stage('index'):
+            index = get_index(pathname, load_from_file(pathname))
 
-    if mode == 'daily':
-        fmt = '%Y-%m-%d'
-        title = 'day'
-    elif mode == 'monthly':
-        fmt = '%Y-%m'
-        title = 'month'
+        with profiling.stage('filter'):
+            mask = None if event_filter is None else event_filter.select(index)
 
-    table = Table([title, 'count', '%'])
-    total = sum(counter.values())
+        # Predicates on fields which aren't indexed need events.
+        if event_filter is None or mask is not None:
+            if ctime is not None:
+                ctimes = (index.ctimes if mask is None
+                          else compress(index.ctimes, mask))
+                print_ctime_grouping(
+                    count_buckets(ctimes, get_bucket_width(ctime)), ctime,
+                    output_format=output_format)
+                return
 
-    for item in sorted(counter.items()):
-        table.add_row((item[0].strftime(fmt),
-                       item[1],
-                       item[1] * 100.0 / total))
+            if all(index.has(PROPS[kind], name) for kind, name in keys):
+                print_grouping([key[1] for key in keys],
+                               group_by_index(index, keys, mask), top,
+                               output_format=output_format)
+                return
 
-    print table
+    plan = scan_files(pathnames, specs, per_file=per_file,
+                      processes=processes, where=where, sample=sampling)
+    plan.render(output_format)
 
 
-def print_grouping(attributes, grouping, top):
+def group_by_index(index, keys, mask=None):
     """
-    Print computed groups.
+    Group events using columnar index - values are counted by their codes
+    and decoded once per distinct combination.
 
-    :param attributes: list of grouped attributes
-    :type: list(str)
-    :param grouping: counter for each combination of attributes' values
-    :type: Counter
-    :type top: int
+    :type index: sentrycli.index.ColumnIndex
+    :param keys: (type, name) pairs of grouped attributes
+    :type: list
+    :param mask: 1 for each event to count, 0 for skipped ones (all are
+    counted if not specified)
+    :type: bytearray
+    :rtype: Counter
     """
-    total = sum(grouping.values())
+    with profiling.stage('group'):
+        columns = [index.column(PROPS[kind], name) for kind, name in keys]
+        rows = izip(*[column.codes for column in columns])
+        codes = Counter(rows if mask is None else compress(rows, mask))
+        values = Counter()
 
-    table = Table(attributes + ['count', '%'])
-    table.add_rows(total, grouping.most_common(top))
+        for row, count in codes.iteritems():
+            values[tuple(column.values[code]
+                         for column, code in izip(columns, row))] += count
 
-    print '\n' + table.by_count()
-    print 'Total:', total
+    return values
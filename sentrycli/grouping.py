@@ -0,0 +1,998 @@
+import json
+import os
+import shlex
+from argparse import ArgumentTypeError
+from collections import Counter
+from datetime import datetime, timedelta
+
+from argh import CommandError
+
+from sentrycli import profiling
+from sentrycli.event import load_from_file, Projection
+from sentrycli.orders import compile_orders
+from sentrycli.sampling import (CONFIDENCE, confidence_interval,
+                                create_sampler, sample_file)
+from sentrycli.sketches import get_capacity, HyperLogLog, SpaceSaving
+from sentrycli.table import OUTPUT_TABLE, Table, write_rows
+from sentrycli.utils import parse_duration
+from sentrycli.where import compile_filter
+
+
+T_HEADER = 'header'
+T_CONTEXT = 'context'
+T_PARAM = 'param'
+T_VAR = 'var'
+T_TAG = 'tag'
+ORDER_META_KEY = ('breadcrumb', 'breadcrumbs in order')
+# Grouping specification keys holding names of attributes of given type.
+SPEC_KEYS = (
+    ('headers', T_HEADER),
+    ('context', T_CONTEXT),
+    ('params', T_PARAM),
+    ('variables', T_VAR),
+    ('tags', T_TAG),
+)
+SPEC_OPTIONS = ('breadcrumbs', 'ctime', 'attributes', 'top', 'approx')
+# Width of creation time buckets (in seconds) by grouping mode.
+CTIME_MODES = {
+    'minutely': 60,
+    'hourly': 3600,
+    'daily': 86400,
+    'monthly': 86400,
+}
+# Title and format of creation time column by grouping mode.
+CTIME_FORMATS = {
+    'minutely': ('minute', '%Y-%m-%d %H:%M'),
+    'hourly': ('hour', '%Y-%m-%d %H:00'),
+    'daily': ('day', '%Y-%m-%d'),
+    'monthly': ('month', '%Y-%m'),
+}
+EPOCH = datetime(1970, 1, 1)
+FILE_COLUMN = 'file'
+# Column with max overestimation of approximate counts.
+ERROR_COLUMN = '+/-'
+# Column with half-width of confidence interval of percentage estimated
+# from sample.
+CI_COLUMN = '+/- %'
+
+
+def get_bucket_width(mode):
+    """
+    :param mode: creation time grouping mode or bucket's width e.g. 15m
+    :type: str
+    :rtype: int
+    :raises: argh.CommandError if mode is invalid
+    """
+    if mode in CTIME_MODES:
+        return CTIME_MODES[mode]
+
+    try:
+        return parse_duration(mode)
+    except ValueError:
+        raise CommandError('ctime should be one of %s or duration e.g. 15m'
+                           % '|'.join(sorted(CTIME_MODES)))
+
+
+def count_buckets(timestamps, width):
+    """
+    Count timestamps by buckets.
+
+    :param timestamps: seconds since epoch
+    :type: iterable<int> (e.g. array)
+    :param width: bucket's width in seconds
+    :type: int
+    :rtype: Counter
+    """
+    return Counter(timestamp // width * width for timestamp in timestamps)
+
+
+def parse_attribute(attr):
+    try:
+        category, attr = attr.split(':')
+    except ValueError:
+        raise ArgumentTypeError('should be in format <category>:<attribute>')
+    return category, attr
+
+
+class Grouping(object):
+    """
+    Counts events by key computed for each of them.
+    """
+
+    def __init__(self, top=None, approx=False):
+        """
+        :param top: show only that much results
+        :type: int
+        :param approx: count in fixed memory - only the most frequent keys
+        (with error bounds) and estimated number of distinct keys
+        :type: bool
+        """
+        self.top = top
+        self.approx = approx
+        self.total = 0
+
+        if approx:
+            self.counter = SpaceSaving(get_capacity(top))
+            self.distinct = HyperLogLog()
+        else:
+            self.counter = Counter()
+            self.distinct = None
+        # Name of extra column breaking counts down by source (e.g. file).
+        self.label_column = None
+        # Variances of counts by key if they're estimated from sample.
+        self.variances = None
+
+    def key(self, event):
+        """
+        :type event: sentrycli.event.Event
+        :rtype: hashable
+        """
+        raise NotImplementedError
+
+    def add(self, event):
+        self.add_count(self.key(event), 1)
+
+    def add_count(self, key, count):
+        """
+        Add events having the same key.
+
+        :type key: hashable
+        :type count: int
+        """
+        self.counter[key] += count
+        self.total += count
+
+        if self.distinct is not None:
+            self.distinct.add(key)
+
+    def discard(self, event):
+        """
+        Remove event added before (e.g. when it leaves time window). Not
+        supported by approximate counting.
+
+        :type event: sentrycli.event.Event
+        """
+        key = self.key(event)
+        self.counter[key] -= 1
+        self.total -= 1
+
+        if self.counter[key] <= 0:
+            del self.counter[key]
+
+    def merge(self, other, label=None):
+        """
+        Add counts computed by other grouping of the same kind.
+
+        :type other: Grouping
+        :param label: if specified, other's counts are kept apart from
+        the rest in an extra column with that value
+        :type: str
+        """
+        if label is None:
+            self.counter.update(other.counter)
+        else:
+            for key, count in other.counter.iteritems():
+                self.counter[label_key(key, label)] += count
+
+        self.total += other.total
+
+        if self.distinct is not None:
+            self.distinct.update(other.distinct)
+
+        if other.variances is not None:
+            if self.variances is None:
+                self.variances = Counter()
+
+            for key, variance in other.variances.iteritems():
+                self.variances[label_key(key, label)] += variance
+
+    def merge_sample(self, other, weight, fpc, size):
+        """
+        Add counts estimated from other grouping of the same kind computed
+        for simple random sample of events.
+
+        :type other: Grouping
+        :param weight: number of all events per sampled one
+        :type: float
+        :param fpc: finite population correction (1 - sampled fraction)
+        :type: float
+        :param size: number of sampled events (including filtered out ones)
+        :type: int
+        """
+        if self.variances is None:
+            self.variances = Counter()
+
+        # Variance of N * c / n where c is hypergeometric.
+        factor = weight ** 2 * fpc / (size - 1) if size > 1 else 0.0
+
+        for key, count in self.rows(other.counter).iteritems():
+            self.variances[key] += factor * count * (size - count)
+
+        for key, count in other.counter.iteritems():
+            self.counter[key] += count * weight
+
+        self.total += other.total * weight
+
+    def rows(self, counter):
+        """
+        :param counter: counts by keys
+        :type: Counter
+        :return: counts by rows they're rendered in
+        :rtype: Counter
+        """
+        return counter
+
+    def get_columns(self, columns):
+        """
+        :param columns: names of columns with grouped values
+        :type: list
+        :rtype: list
+        """
+        if self.label_column is None:
+            return columns
+
+        return [self.label_column] + columns
+
+    def project(self, projection):
+        """
+        Add fields of events needed by grouping to projection.
+
+        :type projection: sentrycli.event.Projection
+        """
+        raise NotImplementedError
+
+    def errors(self):
+        """
+        Get problems found while scanning events.
+
+        :rtype: list(str)
+        """
+        return []
+
+    def render(self, output_format=OUTPUT_TABLE):
+        """
+        Print results.
+
+        :param output_format: one of `sentrycli.table.OUTPUT_FORMATS`
+        :type: str
+        """
+        raise NotImplementedError
+
+
+class KeysGrouping(Grouping):
+    """
+    Groups events by values of headers, context, params, variables or tags
+    and optionally by fulfilling breadcrumbs orders.
+    """
+
+    def __init__(self, keys, breadcrumbs=None, top=None, approx=False):
+        """
+        :param keys: (type, name) pairs of grouped attributes
+        :type: list
+        :param breadcrumbs: orders of breadcrumbs' categories
+        :type: list(str)
+        """
+        super(KeysGrouping, self).__init__(top, approx)
+        self.keys = list(keys)
+        self.breadcrumbs = compile_orders(breadcrumbs or [])
+
+        if self.breadcrumbs:
+            self.keys.append(ORDER_META_KEY)
+
+    def key(self, event):
+        meta = {}
+
+        for kind, name in self.keys:
+            if kind == T_HEADER:
+                meta[(kind, name)] = event.headers.get(name)
+            elif kind == T_CONTEXT:
+                meta[(kind, name)] = event.context.get(name)
+            elif kind == T_PARAM:
+                meta[(kind, name)] = event.params.get(name)
+            elif kind == T_TAG:
+                meta[(kind, name)] = event.tags.get(name)
+            elif kind == T_VAR:
+                meta[(kind, name)] = event.get_var(name)
+
+        if self.breadcrumbs:
+            meta[ORDER_META_KEY] = event.are_breadcrumbs_orders_preserved(
+                self.breadcrumbs)
+
+        return tuple(meta.get(key) for key in self.keys)
+
+    def project(self, projection):
+        props = {
+            T_HEADER: projection.headers,
+            T_CONTEXT: projection.context,
+            T_PARAM: projection.params,
+            T_VAR: projection.variables,
+            T_TAG: projection.tags,
+        }
+
+        for kind, name in self.keys:
+            if kind in props:
+                props[kind].add(name)
+
+        for order in self.breadcrumbs:
+            if order.segments is None:
+                projection.categories = True
+            else:
+                projection.tokens = True
+
+    def render(self, output_format=OUTPUT_TABLE):
+        print_grouping(self.get_columns([key[1] for key in self.keys]),
+                       self.counter, self.top, self.distinct,
+                       output_format=output_format, variances=self.variances)
+
+
+class CtimeGrouping(Grouping):
+    """
+    Groups events by creation time. Events are counted by buckets of
+    seconds since epoch so no datetime is built per event.
+    """
+
+    def __init__(self, mode, top=None):
+        """
+        :param mode: grouping mode (see `CTIME_MODES`) or bucket's width
+        e.g. 15m
+        :type: str
+        """
+        super(CtimeGrouping, self).__init__(top)
+        self.mode = mode
+        self.width = get_bucket_width(mode)
+
+    def key(self, event):
+        return event.timestamp // self.width * self.width
+
+    def rows(self, counter):
+        # Buckets shown in the same row (e.g. days of month) aren't
+        # independent so variances are kept by rows.
+        _, fmt = get_ctime_format(self.mode)
+        rows = Counter()
+
+        for timestamp, count in counter.iteritems():
+            rows[format_ctime(timestamp, fmt)] += count
+
+        return rows
+
+    def project(self, projection):
+        projection.ctime = True
+
+    def render(self, output_format=OUTPUT_TABLE):
+        print_ctime_grouping(self.counter, self.mode, self.label_column,
+                             output_format, self.variances)
+
+
+class AttributeAccessor(object):
+    """
+    Gets value of breadcrumb's attribute - either top-level one (e.g.
+    `message`) or from breadcrumb's data (e.g. `data.url` looked up in
+    `data.extra` first).
+    """
+
+    def __init__(self, category, attribute):
+        """
+        :type category: str
+        :param attribute: attribute's name
+        :type: str
+        """
+        self.category = category
+        self.attribute = attribute
+        keys = attribute.split('.')
+        self.key = keys[0]
+        self.data_key = keys[1] if len(keys) > 1 else None
+
+    def __call__(self, breadcrumb):
+        """
+        :type breadcrumb: dict
+        :raises: KeyError if breadcrumb doesn't have such attribute
+        """
+        value = breadcrumb[self.key]
+
+        if self.data_key is not None and value is not None:
+            data = value.get('extra', value)
+
+            if isinstance(data, dict):
+                value = data.get(self.data_key)
+            else:
+                value = None
+
+        return value
+
+
+class AttributesGrouping(Grouping):
+    """
+    Groups events by values of breadcrumbs' attributes (taken from the last
+    breadcrumb of given category).
+    """
+
+    def __init__(self, attributes, top=None, approx=False):
+        """
+        :param attributes: (category, attribute) pairs
+        :type: list
+        """
+        super(AttributesGrouping, self).__init__(top, approx)
+        self.attributes = attributes
+        self.accessors = [AttributeAccessor(category, attribute)
+                          for category, attribute in attributes]
+        self.invalid = set()
+
+    def key(self, event):
+        by_category = event.breadcrumbs_by_category
+        values = []
+
+        for accessor in self.accessors:
+            breadcrumb = by_category.get(accessor.category)
+
+            if breadcrumb is None:
+                values.append('<NOT PRESENT>')
+                continue
+
+            try:
+                values.append(accessor(breadcrumb))
+            except KeyError:
+                self.invalid.add((accessor.category, accessor.attribute))
+                values.append('<NOT PRESENT>')
+
+        return tuple(values)
+
+    def project(self, projection):
+        for accessor in self.accessors:
+            keys = projection.attributes.setdefault(accessor.category, set())
+            keys.add(accessor.key)
+
+    def merge(self, other, label=None):
+        super(AttributesGrouping, self).merge(other, label=label)
+        self.invalid |= other.invalid
+
+    def merge_sample(self, other, weight, fpc, size):
+        super(AttributesGrouping, self).merge_sample(other, weight, fpc, size)
+        self.invalid |= other.invalid
+
+    def errors(self):
+        return ['Invalid breadcrumb attribute %s:%s' % attribute
+                for attribute in sorted(self.invalid)]
+
+    def render(self, output_format=OUTPUT_TABLE):
+        attributes = self.attributes
+
+        # Rows streamed for machines get attributes as given on command line.
+        if output_format != OUTPUT_TABLE:
+            attributes = ['%s:%s' % attribute for attribute in attributes]
+
+        print_grouping(self.get_columns(attributes), self.counter,
+                       self.top, self.distinct, show_total=False,
+                       output_format=output_format, variances=self.variances)
+
+
+def label_key(key, label):
+    """
+    :param label: value of extra column (key is returned as is if None)
+    :type: str
+    :rtype: hashable
+    """
+    if label is None:
+        return key
+
+    if not isinstance(key, tuple):
+        key = (key,)
+
+    return (label,) + key
+
+
+def create_grouping(spec):
+    """
+    Create grouping from its specification - dictionary with keys named
+    after `group` and `breadcrumbs` subcommands' arguments e.g.
+    {"tags": ["server_name"], "headers": ["User-Agent"], "top": 10},
+    {"ctime": "daily"} or {"attributes": ["requests:data.status_code"]}.
+
+    :type spec: dict
+    :rtype: Grouping
+    """
+    unknown = set(spec) - {name for name, _ in SPEC_KEYS} - set(SPEC_OPTIONS)
+
+    if unknown:
+        raise CommandError('unknown grouping keys: %s' %
+                           ', '.join(sorted(unknown)))
+
+    keys = []
+
+    for name, kind in SPEC_KEYS:
+        keys.extend((kind, value) for value in spec.get(name) or [])
+
+    breadcrumbs = spec.get('breadcrumbs') or []
+    top = spec.get('top')
+    approx = bool(spec.get('approx'))
+
+    if spec.get('attributes'):
+        if keys or breadcrumbs or spec.get('ctime'):
+            raise CommandError('attributes cannot be mixed with other keys')
+
+        attributes = [parse_attribute(attribute)
+                      if not isinstance(attribute, (tuple, list))
+                      else tuple(attribute)
+                      for attribute in spec['attributes']]
+        return AttributesGrouping(attributes, top=top, approx=approx)
+
+    if spec.get('ctime'):
+        if keys or breadcrumbs:
+            raise CommandError('ctime cannot be mixed with other keys')
+
+        return CtimeGrouping(spec['ctime'], top=top)
+
+    if not (keys or breadcrumbs):
+        raise CommandError('one of %s has to be specified' % '|'.join(
+            [name for name, _ in SPEC_KEYS] + list(SPEC_OPTIONS[:3])))
+
+    return KeysGrouping(keys, breadcrumbs, top=top, approx=approx)
+
+
+def parse_grouping(value):
+    """
+    Parse grouping specification given as command line argument -
+    space separated `key=value[,value...]` items e.g.
+    "tags=server_name,release top=5" or "attributes=requests:data.url".
+
+    :type value: str
+    :rtype: dict
+    """
+    spec = {}
+
+    for item in shlex.split(value):
+        try:
+            name, values = item.split('=', 1)
+        except ValueError:
+            raise ArgumentTypeError('should be in format key=value[,value...]')
+
+        if name == 'top':
+            try:
+                spec[name] = int(values)
+            except ValueError:
+                raise ArgumentTypeError('top should be integer')
+        elif name == 'ctime':
+            spec[name] = values
+        elif name == 'approx':
+            spec[name] = values.lower() in ('1', 'true', 'yes')
+        else:
+            spec.setdefault(name, []).extend(values.split(','))
+
+    return spec
+
+
+def load_specs(pathname):
+    """
+    Load groupings' specifications from JSON file (list of dictionaries).
+
+    :param pathname: path to JSON file
+    :type: str
+    :rtype: list(dict)
+    """
+    with open(pathname) as f:
+        try:
+            specs = json.load(f)
+        except ValueError as error:
+            raise CommandError('Invalid spec file: %s' % error)
+
+    if not isinstance(specs, list):
+        raise CommandError('Spec file should contain list of groupings')
+
+    return specs
+
+
+class Plan(object):
+    """
+    Set of groupings computed in a single pass over events.
+    """
+
+    def __init__(self, groupings):
+        """
+        :type groupings: list(Grouping)
+        """
+        self.groupings = groupings
+
+    @classmethod
+    def from_specs(cls, specs):
+        """
+        :param specs: groupings' specifications
+        :type: list(dict)
+        :rtype: Plan
+        """
+        return cls([create_grouping(spec) for spec in specs])
+
+    def projection(self):
+        """
+        Get fields of events needed by all groupings.
+
+        :rtype: sentrycli.event.Projection
+        """
+        projection = Projection()
+
+        for grouping in self.groupings:
+            grouping.project(projection)
+
+            if grouping.approx:
+                projection.intern_values = False
+
+        return projection
+
+    def scan(self, events):
+        """
+        :type events: iterable<Event>
+        """
+        groupings = self.groupings
+
+        with profiling.stage('group'):
+            for event in events:
+                for grouping in groupings:
+                    grouping.add(event)
+
+    def discard(self, events):
+        """
+        Remove events scanned before.
+
+        :type events: iterable<Event>
+        """
+        groupings = self.groupings
+
+        with profiling.stage('group'):
+            for event in events:
+                for grouping in groupings:
+                    grouping.discard(event)
+
+    def merge(self, other, label=None):
+        """
+        Add counts computed by other plan created from the same
+        specifications.
+
+        :type other: Plan
+        :param label: keep other's counts apart in an extra column
+        :type: str
+        """
+        for grouping, other_grouping in zip(self.groupings, other.groupings):
+            grouping.merge(other_grouping, label=label)
+
+            if label is not None:
+                grouping.label_column = FILE_COLUMN
+
+    def merge_sample(self, other, population, size):
+        """
+        Add counts estimated from other plan computed for a sample of
+        events (e.g. of a single stratum).
+
+        :type other: Plan
+        :param population: number of all events sample was drawn from
+        :type: int
+        :param size: number of sampled events (including filtered out ones)
+        :type: int
+        """
+        if not size:
+            return
+
+        weight = float(population) / size
+        fpc = 1 - float(size) / population
+
+        for grouping, other_grouping in zip(self.groupings, other.groupings):
+            grouping.merge_sample(other_grouping, weight, fpc, size)
+
+    def render(self, output_format=OUTPUT_TABLE):
+        """
+        :param output_format: one of `sentrycli.table.OUTPUT_FORMATS`
+        :type: str
+        :raises: argh.CommandError if any grouping found problems
+        """
+        errors = [error for grouping in self.groupings
+                  for error in grouping.errors()]
+
+        if errors:
+            raise CommandError('\n'.join(errors))
+
+        with profiling.stage('render'):
+            for grouping in self.groupings:
+                grouping.render(output_format)
+
+
+def scan_file(job):
+    """
+    Compute groupings for a single file. Meant to be run in worker process.
+
+    :param job: path to file, groupings' specifications, predicates
+    events have to fulfill and sampling options (see
+    `sentrycli.sampling.create_sampler`)
+    :type: (str, list(dict), list(str), dict)
+    :rtype: Plan
+    """
+    pathname, specs, where, sample = job
+    plan = Plan.from_specs(specs)
+
+    if sample is None:
+        plan.scan(load_from_file(pathname, projection=plan.projection(),
+                                 event_filter=compile_filter(where)))
+        return plan
+
+    sampler = create_sampler(sample)
+    sample_file(pathname, sampler, projection=plan.projection(),
+                event_filter=compile_filter(where))
+
+    for items, population in sampler.strata():
+        stratum = Plan.from_specs(specs)
+        stratum.scan(item for item in items if item is not None)
+        plan.merge_sample(stratum, population, len(items))
+
+    return plan
+
+
+def scan_file_in_worker(job):
+    """
+    Run `scan_file` in worker process and collect its profile (counters and
+    times of stages of worker aren't seen by the parent process otherwise).
+
+    :param job: `scan_file`'s job and whether profiler is enabled
+    :type: (tuple, bool)
+    :return: result and worker's measurements (see `Profiler.dump`) or None
+    if profiler isn't enabled
+    :rtype: (Plan, dict or None)
+    """
+    job, profile = job
+
+    if not profile:
+        return scan_file(job), None
+
+    # Forked worker starts with copy of parent's measurements.
+    profiling.PROFILER.reset()
+    profiling.PROFILER.enable()
+    plan = scan_file(job)
+    return plan, profiling.PROFILER.dump()
+
+
+def scan_files(pathnames, specs, per_file=False, processes=None, where=None,
+               sample=None):
+    """
+    Compute groupings for many files. Each file is processed by a separate
+    worker process and results are merged.
+
+    :param pathnames: paths to files with events
+    :type: list(str)
+    :param specs: groupings' specifications
+    :type: list(dict)
+    :param per_file: break counts down by file
+    :type: bool
+    :param processes: number of worker processes (defaults to number of
+    CPUs)
+    :type: int
+    :param where: predicates events have to fulfill (see `sentrycli.where`)
+    :type: list(str)
+    :param sample: estimate counts from sample of each file's events (see
+    `sentrycli.sampling.create_sampler`)
+    :type: dict
+    :rtype: Plan
+    """
+    plan = Plan.from_specs(specs)
+    jobs = [(pathname, specs, where, sample) for pathname in pathnames]
+
+    if len(jobs) == 1:
+        results = [scan_file(jobs[0])]
+        pool = None
+    else:
+        from multiprocessing import cpu_count, Pool
+
+        pool = Pool(min(processes or cpu_count(), len(jobs)))
+        results = pool.imap(scan_file_in_worker,
+                            [(job, profiling.PROFILER.enabled)
+                             for job in jobs])
+
+    try:
+        for pathname, result in zip(pathnames, results):
+            if pool is not None:
+                result, measurements = result
+
+                if measurements is not None:
+                    profiling.PROFILER.merge(measurements)
+
+            label = os.path.basename(pathname) if per_file else None
+            plan.merge(result, label=label)
+    finally:
+        if pool is not None:
+            pool.close()
+            pool.join()
+
+    return plan
+
+
+def print_ctime_grouping(counter, mode, label_column=None,
+                         output_format=OUTPUT_TABLE, variances=None):
+    """
+    Print events' counts by creation time.
+
+    :param counter: counts by buckets' starts (seconds since epoch)
+    :type: Counter
+    :param mode: grouping mode (see `CTIME_MODES`) or bucket's width
+    :type: str
+    :param label_column: name of extra column if counter's keys are
+    (label, bucket) pairs
+    :type: str
+    :param output_format: one of `sentrycli.table.OUTPUT_FORMATS`
+    :type: str
+    :param variances: variances of counts estimated from sample by
+    formatted creation time (or (label, formatted creation time) pairs)
+    :type: Counter
+    """
+    with profiling.stage('render'):
+        _print_ctime_grouping(counter, mode, label_column, output_format,
+                              variances)
+
+
+def get_ctime_format(mode):
+    """
+    :param mode: grouping mode (see `CTIME_MODES`) or bucket's width
+    :type: str
+    :return: title of creation time column and format of its values
+    :rtype: (str, str)
+    """
+    if mode in CTIME_FORMATS:
+        return CTIME_FORMATS[mode]
+
+    width = get_bucket_width(mode)
+
+    if width % 86400 == 0:
+        return 'time', '%Y-%m-%d'
+
+    if width % 60 == 0:
+        return 'time', '%Y-%m-%d %H:%M'
+
+    return 'time', '%Y-%m-%d %H:%M:%S'
+
+
+def format_ctime(timestamp, fmt):
+    """
+    :param timestamp: seconds since epoch
+    :type: int
+    :param fmt: strftime format
+    :type: str
+    :rtype: str
+    """
+    return (EPOCH + timedelta(seconds=timestamp)).strftime(fmt)
+
+
+def _print_ctime_grouping(counter, mode, label_column, output_format,
+                          variances):
+    title, fmt = get_ctime_format(mode)
+    total = sum(counter.values())
+    rows = Counter()
+
+    for key, count in counter.iteritems():
+        label, timestamp = key if label_column is not None else (None, key)
+        rows[(label, format_ctime(timestamp, fmt))] += count
+
+    columns = [title, 'count', '%']
+    skip = 0
+
+    if label_column is not None:
+        columns.insert(0, label_column)
+    else:
+        skip = 1
+
+    rows = [(row[skip:], count) for row, count in sorted(rows.iteritems())]
+    errors = None
+
+    # Variances are kept by rows (see `CtimeGrouping.rows`).
+    if variances is not None:
+        errors = {row if isinstance(row, tuple) else (row,):
+                  confidence_interval(variance, total)
+                  for row, variance in variances.iteritems()}
+
+    if output_format != OUTPUT_TABLE:
+        write_rows(*get_machine_rows(columns[:-2], rows, total, errors),
+                   output_format=output_format)
+        return
+
+    table = Table(columns)
+    table.add_rows(total, rows, errors)
+    print table
+
+    if errors is not None:
+        print_sample_note()
+
+
+def get_machine_rows(columns, rows, total, errors=None):
+    """
+    :param columns: names of columns with grouped values
+    :type: list
+    :param rows: (grouped values, count) pairs
+    :type: iterable
+    :type total: float
+    :param errors: half-widths of percentages' confidence intervals by
+    grouped values (if counts are estimated from sample)
+    :type: dict
+    :return: columns and rows for `sentrycli.table.write_rows`
+    :rtype: (list, iterator<list>)
+    """
+    if errors is None:
+        return columns + ['count', '%'], (
+            list(key) + [count, count * 100.0 / total] for key, count in rows)
+
+    return columns + ['count', '%', CI_COLUMN], (
+        list(key) + [int(round(count)), count * 100.0 / total, errors[key]]
+        for key, count in rows)
+
+
+def print_sample_note():
+    print 'Counts estimated from sample, percentages with %d%% confidence ' \
+        'intervals' % CONFIDENCE
+
+
+def print_grouping(attributes, grouping, top, distinct=None,
+                   show_total=True, output_format=OUTPUT_TABLE,
+                   variances=None):
+    """
+    Print computed groups.
+
+    :param attributes: list of grouped attributes
+    :type: list(str)
+    :param grouping: counter for each combination of attributes' values
+    :type: Counter or sentrycli.sketches.SpaceSaving
+    :type top: int
+    :param distinct: estimated number of distinct combinations
+    :type: sentrycli.sketches.HyperLogLog
+    :type show_total: bool
+    :param output_format: one of `sentrycli.table.OUTPUT_FORMATS` - rows of
+    other formats than table are streamed in order of `most_common` without
+    totals
+    :type: str
+    :param variances: variances of counts estimated from sample (by the
+    same keys as counts)
+    :type: Counter
+    """
+    with profiling.stage('render'):
+        _print_grouping(attributes, grouping, top, distinct, show_total,
+                        output_format, variances)
+
+
+def _print_grouping(attributes, grouping, top, distinct, show_total,
+                    output_format, variances):
+    # Space-Saving keeps sum of counts equal to number of events.
+    total = sum(grouping.values())
+    errors = None
+
+    if variances is not None:
+        errors = {key: confidence_interval(variance, total)
+                  for key, variance in variances.iteritems()}
+
+    if output_format != OUTPUT_TABLE:
+        if isinstance(grouping, SpaceSaving):
+            columns = attributes + ['count', ERROR_COLUMN, '%']
+            rows = (list(key) + [count, grouping.error(key),
+                                 count * 100.0 / total]
+                    for key, count in grouping.most_common(top))
+        else:
+            columns, rows = get_machine_rows(
+                attributes, grouping.most_common(top), total, errors)
+
+        write_rows(columns, rows, output_format)
+        return
+
+    if not isinstance(grouping, SpaceSaving):
+        table = Table(attributes + ['count', '%'])
+        table.add_rows(total, grouping.most_common(top), errors)
+    else:
+        table = Table(attributes + ['count', ERROR_COLUMN, '%'])
+        table.align[ERROR_COLUMN] = 'r'
+
+        for key, count in grouping.most_common(top):
+            table.add_row(list(key) + [count, grouping.error(key),
+                                       count * 100.0 / total])
+
+    print '\n' + table.by_count()
+
+    if show_total:
+        print 'Total:', total if errors is None else int(round(total))
+
+    if errors is not None:
+        print_sample_note()
+
+    if isinstance(grouping, SpaceSaving):
+        print 'Max error of untracked groups:', grouping.max_error
+
+    if distinct is not None:
+        print 'Distinct (approx.): %d (+/- %.1f%%)' % (
+            len(distinct), distinct.relative_error * 100)
@@ -0,0 +1,309 @@
+from array import array
+import hashlib
+import json
+import logging
+import marshal
+import os
+
+
+logger = logging.getLogger(__name__)
+
+MAGIC = 'sentrycli-index'
+VERSION = 1
+EXTENSION = '.idx'
+# Event properties stored in index.
+PROPS = ('headers', 'tags', 'context', 'params')
+# Number of bytes from the beginning and the end of input file used to
+# detect modifications.
+DIGEST_BLOCK = 1 << 16
+
+
+def get_index_path(pathname):
+    """
+    :param pathname: path to file with events
+    :type: str
+    :rtype: str
+    """
+    return pathname + EXTENSION
+
+
+def get_signature(pathname):
+    """
+    Get signature of file with events - index is valid as long as it
+    doesn't change.
+
+    :param pathname: path to file with events
+    :type: str
+    :rtype: dict
+    """
+    stat = os.stat(pathname)
+    digest = hashlib.md5()
+
+    with open(pathname, 'rb') as f:
+        digest.update(f.read(DIGEST_BLOCK))
+
+        if stat.st_size > DIGEST_BLOCK:
+            f.seek(max(stat.st_size - DIGEST_BLOCK, DIGEST_BLOCK))
+            digest.update(f.read())
+
+    return {
+        'size': stat.st_size,
+        'mtime': stat.st_mtime,
+        'digest': digest.hexdigest(),
+    }
+
+
+class Column(object):
+    """
+    Dictionary encoded column - each distinct value is stored once and rows
+    hold codes of values. Code 0 stands for missing value (`None`).
+    """
+
+    def __init__(self, values=None, codes=None):
+        self.values = values or [None]
+        self.codes = codes if codes is not None else array('i')
+        self._lookup = None
+
+    def set(self, row, value):
+        """
+        :param row: row number, rows have to be set in ascending order
+        :type: int
+        :param value: hashable value
+        :raises: TypeError if value is not hashable
+        """
+        if self._lookup is None:
+            self._lookup = {value: code for code, value in
+                            enumerate(self.values)}
+
+        code = self._lookup.get(value)
+
+        if code is None:
+            code = len(self.values)
+            self._lookup[value] = code
+            self.values.append(value)
+
+        self.pad(row)
+        self.codes.append(code)
+
+    def pad(self, count):
+        """
+        Fill rows up to `count` with missing values.
+
+        :type count: int
+        """
+        missing = count - len(self.codes)
+
+        if missing > 0:
+            self.codes.extend(array('i', [0]) * missing)
+
+
+class ColumnIndex(object):
+    """
+    Columnar sidecar index of events' fields (headers, tags, context and
+    params) plus their creation times.
+    """
+
+    def __init__(self, count, ctimes, columns, dropped):
+        """
+        :param count: number of events
+        :type: int
+        :param ctimes: creation times (seconds since epoch)
+        :type: array
+        :param columns: columns by (property, key)
+        :type: dict
+        :param dropped: (property, key) pairs having unhashable values
+        :type: set
+        """
+        self.count = count
+        self.ctimes = ctimes
+        self.columns = columns
+        self.dropped = dropped
+
+    def has(self, prop, key):
+        """
+        Check if index can answer queries about given field.
+
+        :type prop: str
+        :type key: str
+        :rtype: bool
+        """
+        return prop in PROPS and (prop, key) not in self.dropped
+
+    def column(self, prop, key):
+        """
+        :type prop: str
+        :type key: str
+        :rtype: Column
+        """
+        column = self.columns.get((prop, key))
+
+        if column is None:
+            column = Column()
+
+        if callable(column):
+            column = column()
+
+        column.pad(self.count)
+        self.columns[(prop, key)] = column
+        return column
+
+    @classmethod
+    def build(cls, events):
+        """
+        Build index in a single pass over events.
+
+        :type events: iterable<Event>
+        :rtype: ColumnIndex
+        """
+        ctimes = array('l')
+        columns = {}
+        dropped = set()
+
+        for row, event in enumerate(events):
+            ctimes.append(event.timestamp)
+
+            for prop in PROPS:
+                for key, value in (getattr(event, prop) or {}).iteritems():
+                    name = (prop, key)
+
+                    if name in dropped:
+                        continue
+
+                    column = columns.get(name)
+
+                    if column is None:
+                        column = columns[name] = Column()
+
+                    try:
+                        column.set(row, value)
+                    except TypeError:
+                        del columns[name]
+                        dropped.add(name)
+
+        return cls(len(ctimes), ctimes, columns, dropped)
+
+    def save(self, pathname, signature):
+        """
+        Save index. Layout is a magic line, JSON header line and then blobs
+        with columns' values (marshal) and codes (raw array).
+
+        :param pathname: path to index file
+        :type: str
+        :param signature: signature of file with events
+        :type: dict
+        """
+        blobs = []
+        offset = [0]
+
+        def add(blob):
+            blobs.append(blob)
+            offset[0] += len(blob)
+            return [offset[0] - len(blob), len(blob)]
+
+        header = {
+            'version': VERSION,
+            'signature': signature,
+            'count': self.count,
+            'typecodes': [self.ctimes.typecode, array('i').typecode],
+            'ctimes': add(self.ctimes.tostring()),
+            'columns': [],
+            'dropped': sorted(self.dropped),
+        }
+
+        for (prop, key), column in self.columns.iteritems():
+            column.pad(self.count)
+            header['columns'].append([prop, key,
+                                      add(marshal.dumps(column.values)),
+                                      add(column.codes.tostring())])
+
+        tmp = pathname + '.tmp'
+
+        with open(tmp, 'wb') as f:
+            f.write(MAGIC + '\n')
+            f.write(json.dumps(header) + '\n')
+
+            for blob in blobs:
+                f.write(blob)
+
+        os.rename(tmp, pathname)
+
+    @classmethod
+    def load(cls, pathname, signature):
+        """
+        Load index. Columns are read lazily, only when asked for.
+
+        :param pathname: path to index file
+        :type: str
+        :param signature: signature of file with events
+        :type: dict
+        :rtype: ColumnIndex or None if index is missing or stale
+        """
+        if not os.path.isfile(pathname):
+            return None
+
+        with open(pathname, 'rb') as f:
+            if f.readline() != MAGIC + '\n':
+                return None
+
+            try:
+                header = json.loads(f.readline())
+            except ValueError:
+                return None
+
+            if (header.get('version') != VERSION or
+                    header.get('signature') != signature):
+                return None
+
+            start = f.tell()
+
+        ctimes_type, codes_type = header['typecodes']
+
+        def read(position):
+            offset, length = position
+
+            with open(pathname, 'rb') as f:
+                f.seek(start + offset)
+                return f.read(length)
+
+        def loader(values, codes):
+            def load_column():
+                column_codes = array(codes_type)
+                column_codes.fromstring(read(codes))
+                return Column(marshal.loads(read(values)), column_codes)
+
+            return load_column
+
+        ctimes = array(ctimes_type)
+        ctimes.fromstring(read(header['ctimes']))
+        columns = {(prop, key): loader(values, codes)
+                   for prop, key, values, codes in header['columns']}
+        dropped = {tuple(name) for name in header['dropped']}
+        return cls(header['count'], ctimes, columns, dropped)
+
+
+def get_index(pathname, events):
+    """
+    Get index for file with events, build it if it's missing or stale.
+
+    :param pathname: path to file with events
+    :type: str
+    :param events: events from that file (used only if index is built)
+    :type: iterable<Event>
+    :rtype: ColumnIndex
+    """
+    signature = get_signature(pathname)
+    index_path = get_index_path(pathname)
+    index = ColumnIndex.load(index_path, signature)
+
+    if index is not None:
+        return index
+
+    logger.info('Building index %s', index_path)
+    index = ColumnIndex.build(events)
+
+    try:
+        index.save(index_path, signature)
+    except (IOError, OSError) as error:
+        logger.warning('Cannot save index: %s', error)
+
+    return index
@@ -1,20 +1,85 @@
+from importlib import import_module
 import argparse
+import logging
+import sys
 
 from argh.constants import PARSER_FORMATTER
 import argh
 
 from sentrycli import __version__
-from sentrycli.breadcrumbs import breadcrumbs
-from sentrycli.group import group
-from sentrycli.query import query
+from sentrycli.profiling import CommandProfile
+
+
+# Commands and modules defining them. Module is imported only when its
+# command is run (or when all of them have to be listed e.g. in help).
+COMMANDS = (
+    ('breadcrumbs', 'sentrycli.breadcrumbs'),
+    ('query', 'sentrycli.query'),
+    ('group', 'sentrycli.group'),
+)
+# Global options followed by value.
+OPTIONS_WITH_VALUE = ('--profile-dump',)
+
+
+def get_command_name(argv):
+    """
+    :param argv: command line arguments (without program's name)
+    :type: list(str)
+    :return: name of command (first positional argument) if any
+    :rtype: str or None
+    """
+    arguments = iter(argv)
+
+    for argument in arguments:
+        if argument in OPTIONS_WITH_VALUE:
+            next(arguments, None)
+        elif not argument.startswith('-'):
+            return argument
+
+    return None
+
+
+def load_commands(argv):
+    """
+    Import only modules needed to handle command line.
+
+    :param argv: command line arguments (without program's name)
+    :type: list(str)
+    :return: functions of commands
+    :rtype: list(callable)
+    """
+    name = get_command_name(argv)
+    modules = dict(COMMANDS)
+
+    if name in modules:
+        names = [name]
+    elif name is None and '--version' in argv:
+        names = []
+    else:
+        names = [command for command, _ in COMMANDS]
+
+    return [getattr(import_module(modules[command]), command)
+            for command in names]
 
 
 def main():
+    logging.basicConfig(level=logging.INFO)
     parser = argparse.ArgumentParser(formatter_class=PARSER_FORMATTER)
     parser.add_argument('--version', action='version',
                         version='%(prog)s ' + __version__)
-    argh.add_commands(parser, [breadcrumbs, query, group])
-    argh.dispatch(parser)
+    parser.add_argument('--profile', action='store_true',
+                        help='report time spent in each stage of the command, '
+                             'counters and peak memory usage (to stderr)')
+    parser.add_argument('--profile-dump', metavar='PATH',
+                        help='save cProfile statistics of the command to file '
+                             '(pstats format)')
+    argh.add_commands(parser, load_commands(sys.argv[1:]))
+    profile = CommandProfile()
+
+    try:
+        argh.dispatch(parser, pre_call=profile.start)
+    finally:
+        profile.finish()
 
 
 if __name__ == '__main__':
@@ -0,0 +1,244 @@
+import re
+
+
+# Breadcrumbs' categories interned as integer tokens.
+CATEGORIES = {}
+CATEGORY_NAMES = []
+# Tokens of categories containing spaces - they break boundaries of
+# categories joined with spaces so such events are matched with regex.
+SPACED_TOKENS = set()
+# Tokens of order patterns which are literal (part of) categories - only
+# they mean the same in regex and when matched against single category.
+TOKEN_RE = re.compile(r'^(?:[\w\-]|\\\.)+$')
+# How token has to match category depending on its position in segment.
+M_ANY = 'any'
+M_PREFIX = 'prefix'
+M_SUFFIX = 'suffix'
+M_FULL = 'full'
+
+
+def intern_category(category):
+    """
+    Get integer token of breadcrumbs' category.
+
+    :type category: str
+    :rtype: int
+    """
+    token = CATEGORIES.get(category)
+
+    if token is None:
+        token = CATEGORIES[category] = len(CATEGORY_NAMES)
+        CATEGORY_NAMES.append(category)
+
+        if ' ' in category:
+            SPACED_TOKENS.add(token)
+
+    return token
+
+
+class TokenMatcher(object):
+    """
+    Checks if category matches pattern's token. Result is computed once per
+    distinct category (unless match has to start past given offset).
+    """
+
+    def __init__(self, token, mode):
+        """
+        :param token: literal (part of) category with dots escaped
+        :type: str
+        :param mode: how token has to match category
+        :type: str
+        """
+        self.text = token.replace('\\.', '.')
+        self.mode = mode
+        self.cache = {}
+
+    def find(self, name, offset=0):
+        """
+        :param name: category
+        :type: str
+        :param offset: min position of match in category
+        :type: int
+        :return: position of match in category or -1
+        :rtype: int
+        """
+        text = self.text
+
+        if self.mode == M_ANY:
+            return name.find(text, offset)
+
+        if self.mode == M_PREFIX:
+            return 0 if not offset and name.startswith(text) else -1
+
+        if self.mode == M_FULL:
+            return 0 if not offset and name == text else -1
+
+        position = len(name) - len(text)
+        return position if position >= offset and name.endswith(text) else -1
+
+    def __call__(self, token, offset=0):
+        """
+        :param token: interned category
+        :type: int
+        :param offset: min position of match in category
+        :type: int
+        :return: position of match in category or -1
+        :rtype: int
+        """
+        if offset:
+            return self.find(CATEGORY_NAMES[token], offset)
+
+        position = self.cache.get(token)
+
+        if position is None:
+            position = self.cache[token] = self.find(CATEGORY_NAMES[token])
+
+        return position
+
+
+class Segment(object):
+    """
+    Categories which have to appear next to each other.
+    """
+
+    def __init__(self, tokens):
+        """
+        :type tokens: list(str)
+        """
+        if len(tokens) == 1:
+            modes = [M_ANY]
+        else:
+            modes = [M_SUFFIX] + [M_FULL] * (len(tokens) - 2) + [M_PREFIX]
+
+        self.matchers = [TokenMatcher(token, mode)
+                         for token, mode in zip(tokens, modes)]
+
+    def __len__(self):
+        return len(self.matchers)
+
+    def match(self, tokens, position, offset=0):
+        """
+        Check if segment starts at given position.
+
+        :param tokens: interned categories
+        :type: sequence<int>
+        :type position: int
+        :param offset: min position of match in the first category
+        :type: int
+        :return: where the earliest match ends - index of category and
+        position in it, None if there's no match
+        :rtype: (int, int)
+        """
+        last = position + len(self.matchers) - 1
+
+        if last >= len(tokens):
+            return None
+
+        for index, matcher in enumerate(self.matchers):
+            start = matcher(tokens[position + index],
+                            offset if not index else 0)
+
+            if start < 0:
+                return None
+
+        return last, start + len(matcher.text)
+
+
+class OrderPattern(object):
+    """
+    Order of breadcrumbs' categories.
+
+    Patterns consisting only of literal categories (dots escaped) separated
+    by ` ` (strict order) and `.*` (anything between) are matched against
+    sequence of interned categories - each segment of adjacent categories
+    is looked up after the end of the previous one, with the same result as
+    regex search in categories joined with spaces. Every other regex is
+    searched in the joined categories.
+    """
+
+    def __init__(self, pattern):
+        """
+        :param pattern: order in Python regex format
+        :type: str
+        """
+        self.pattern = pattern
+        self.regex = re.compile(pattern)
+        self.segments = None
+        segments = [segment.split(' ') for segment in pattern.split('.*')]
+
+        # Leading and trailing `.*` don't change anything.
+        if len(segments) > 1 and segments[0] == ['']:
+            segments.pop(0)
+
+        if len(segments) > 1 and segments[-1] == ['']:
+            segments.pop()
+
+        if all(TOKEN_RE.match(token) for segment in segments
+               for token in segment):
+            self.segments = [Segment(tokens) for tokens in segments]
+
+    def __repr__(self):
+        return '<OrderPattern %r>' % self.pattern
+
+
+def compile_orders(orders):
+    """
+    :param orders: orders of categories in Python regex format
+    :type: list(str)
+    :rtype: list(OrderPattern)
+    """
+    return [OrderPattern(order) for order in orders]
+
+
+def match_orders(orders, event):
+    """
+    Check if all orders are preserved in event's breadcrumbs. Token based
+    orders are matched in a single pass over interned categories.
+
+    :type orders: list(OrderPattern)
+    :type event: sentrycli.event.Event
+    :rtype: bool
+    """
+    pending = []
+    tokens = event.breadcrumbs_tokens
+    spaced = SPACED_TOKENS and not SPACED_TOKENS.isdisjoint(tokens)
+
+    for order in orders:
+        if order.segments is None or spaced:
+            if not order.regex.search(event.breadcrumbs_categories):
+                return False
+        else:
+            pending.append(order)
+
+    if not pending:
+        return True
+
+    states = [0] * len(pending)
+    # Where the next segment of each order can start - index of category
+    # and min position in it.
+    starts = [0] * len(pending)
+    offsets = [0] * len(pending)
+    remaining = len(pending)
+
+    for position in xrange(len(tokens)):
+        for i, order in enumerate(pending):
+            state = states[i]
+
+            # Segment can start in the same category the previous one ended.
+            while state < len(order.segments) and position >= starts[i]:
+                offset = offsets[i] if position == starts[i] else 0
+                end = order.segments[state].match(tokens, position, offset)
+
+                if end is None:
+                    break
+
+                state = states[i] = state + 1
+                starts[i], offsets[i] = end
+
+                if state == len(order.segments):
+                    remaining -= 1
+
+                    if not remaining:
+                        return True
+
+    return False
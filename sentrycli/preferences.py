@@ -3,7 +3,6 @@ import logging
 import os
 
 
-logging.basicConfig(level=logging.INFO)
 logger = logging.getLogger(__name__)
 
 
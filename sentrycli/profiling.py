@@ -0,0 +1,343 @@
+from collections import defaultdict
+from contextlib import contextmanager
+import sys
+import threading
+import time
+
+
+# Stages are reported in this order, unknown ones after them.
+STAGES = ('index', 'download', 'backoff', 'decode', 'filter', 'extract',
+          'write', 'group', 'sql', 'render')
+PERCENTILES = (50, 90, 99)
+
+
+def percentile(values, p):
+    """
+    :param values: sorted values
+    :type: list
+    :param p: percentile (0-100)
+    :type: int
+    :rtype: float
+    """
+    if not values:
+        return 0.0
+
+    index = min(len(values) - 1, int(round(p / 100.0 * (len(values) - 1))))
+    return values[index]
+
+
+def get_peak_rss():
+    """
+    :return: peak resident set size of the process in kilobytes
+    :rtype: int or None if unknown
+    """
+    try:
+        import resource
+    except ImportError:
+        return None
+
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+
+    # Bytes on macOS, kilobytes elsewhere.
+    if sys.platform == 'darwin':
+        peak //= 1024
+
+    return peak
+
+
+class Profiler(object):
+    """
+    Measures time spent in stages of a command (exclusive - time of nested
+    stage isn't counted in the outer one) plus counters and samples (e.g.
+    latencies). Does nothing until enabled.
+
+    Only stages of the thread which enabled profiler are shares of command's
+    time - stages of background threads (e.g. downloading pages) and worker
+    processes overlap with them and are reported apart as busy time.
+    """
+
+    def __init__(self):
+        self.enabled = False
+        self.start = None
+        self.thread = None
+        self.times = defaultdict(float)
+        # Times of stages in background threads (summed over threads).
+        self.background = defaultdict(float)
+        self.counters = defaultdict(int)
+        self.samples = defaultdict(list)
+        self.lock = threading.Lock()
+        self.local = threading.local()
+
+    def enable(self):
+        self.enabled = True
+        self.start = time.time()
+        self.thread = threading.current_thread()
+
+    def reset(self):
+        """
+        Drop all measurements (e.g. the ones inherited by forked worker
+        process) and disable profiler.
+        """
+        self.__init__()
+
+    def dump(self):
+        """
+        :return: measurements which can be sent from worker process and
+        merged in the parent one (see `merge`)
+        :rtype: dict
+        """
+        with self.lock:
+            return {
+                'times': dict(self.times),
+                'background': dict(self.background),
+                'counters': dict(self.counters),
+                'samples': dict(self.samples),
+            }
+
+    def merge(self, measurements):
+        """
+        Add measurements of worker process. Its stages ran in parallel with
+        command so they are counted as busy time of background stages.
+
+        :param measurements: result of `dump` in worker process
+        :type: dict
+        """
+        if not self.enabled:
+            return
+
+        with self.lock:
+            for times in (measurements['times'],
+                          measurements['background']):
+                for name, value in times.iteritems():
+                    self.background[name] += value
+
+            for name, value in measurements['counters'].iteritems():
+                self.counters[name] += value
+
+            for name, values in measurements['samples'].iteritems():
+                self.samples[name].extend(values)
+
+    def _stack(self):
+        stack = getattr(self.local, 'stack', None)
+
+        if stack is None:
+            stack = self.local.stack = []
+
+        return stack
+
+    def enter(self, name):
+        self._stack().append([name, time.time(), 0.0])
+
+    def exit(self):
+        stack = self._stack()
+        name, start, nested = stack.pop()
+        elapsed = time.time() - start
+
+        if threading.current_thread() is self.thread:
+            times = self.times
+        else:
+            times = self.background
+
+        with self.lock:
+            times[name] += elapsed - nested
+
+        if stack:
+            stack[-1][2] += elapsed
+
+    @contextmanager
+    def stage(self, name):
+        """
+        Measure time spent in block.
+
+        :param name: stage's name
+        :type: str
+        """
+        if not self.enabled:
+            yield
+            return
+
+        self.enter(name)
+
+        try:
+            yield
+        finally:
+            self.exit()
+
+    def timed(self, iterable, name):
+        """
+        Measure time spent on getting items from iterable (e.g. decoding).
+
+        :type iterable: iterable
+        :param name: stage's name
+        :type: str
+        :rtype: iterator
+        """
+        if not self.enabled:
+            return iterable
+
+        return self._timed(iter(iterable), name)
+
+    def _timed(self, iterator, name):
+        while True:
+            self.enter(name)
+
+            try:
+                item = next(iterator)
+            finally:
+                self.exit()
+
+            yield item
+
+    def wrap(self, function, name):
+        """
+        Measure time spent in calls of function.
+
+        :type function: callable
+        :param name: stage's name
+        :type: str
+        :rtype: callable
+        """
+        if not self.enabled:
+            return function
+
+        def wrapper(*args, **kwargs):
+            self.enter(name)
+
+            try:
+                return function(*args, **kwargs)
+            finally:
+                self.exit()
+
+        return wrapper
+
+    def count(self, name, value=1):
+        """
+        :param name: counter's name
+        :type: str
+        :type value: int
+        """
+        if self.enabled:
+            with self.lock:
+                self.counters[name] += value
+
+    def sample(self, name, value):
+        """
+        :param name: name of measured value
+        :type: str
+        :type value: float
+        """
+        if self.enabled:
+            self.samples[name].append(value)
+
+    @staticmethod
+    def get_names(times):
+        """
+        :param times: times by stage
+        :type: dict
+        :return: names of stages in order of reporting
+        :rtype: list(str)
+        """
+        names = [name for name in STAGES if name in times]
+        names.extend(sorted(set(times) - set(STAGES)))
+        return names
+
+    def report(self, stream=None):
+        """
+        Print measurements.
+
+        :param stream: file to print to (standard error by default)
+        :type: file
+        """
+        from sentrycli.table import Table
+
+        stream = stream or sys.stderr
+        total = time.time() - self.start
+        table = Table(['stage', 'seconds', '%'])
+        table.align['seconds'] = 'r'
+        table.float_format['seconds'] = '.3'
+
+        for name in self.get_names(self.times):
+            table.add_row([name, self.times[name],
+                           self.times[name] * 100 / max(total, 1e-9)])
+
+        other = total - sum(self.times.values())
+        table.add_row(['other', max(other, 0.0),
+                       max(other, 0.0) * 100 / max(total, 1e-9)])
+        print >> stream, table
+        print >> stream, 'Total: %.3fs' % total
+
+        if self.background:
+            table = Table(['background stage', 'busy seconds'])
+            table.align['busy seconds'] = 'r'
+            table.float_format['busy seconds'] = '.3'
+
+            for name in self.get_names(self.background):
+                table.add_row([name, self.background[name]])
+
+            print >> stream, table
+
+        for name, value in sorted(self.counters.iteritems()):
+            print >> stream, '%s: %d' % (name.capitalize(), value)
+
+        events = self.counters.get('events')
+
+        if events:
+            print >> stream, 'Events/s: %.1f' % (events / max(total, 1e-9))
+
+        for name, values in sorted(self.samples.iteritems()):
+            values = sorted(values)
+            print >> stream, '%s (ms): %s' % (name.capitalize(), ', '.join(
+                'p%d %.1f' % (p, percentile(values, p) * 1000)
+                for p in PERCENTILES))
+
+        peak = get_peak_rss()
+
+        if peak is not None:
+            print >> stream, 'Peak RSS: %.1f MB' % (peak / 1024.0)
+
+
+PROFILER = Profiler()
+stage = PROFILER.stage
+timed = PROFILER.timed
+wrap = PROFILER.wrap
+count = PROFILER.count
+sample = PROFILER.sample
+
+
+class CommandProfile(object):
+    """
+    Profiling of the whole command requested with global options.
+    """
+
+    def __init__(self):
+        self.report = False
+        self.dump = None
+        self.profile = None
+
+    def start(self, namespace):
+        """
+        Enable profiling if requested. Meant to be called just before the
+        command (argh's `pre_call`).
+
+        :type namespace: argparse.Namespace
+        """
+        self.report = getattr(namespace, 'profile', False)
+        self.dump = getattr(namespace, 'profile_dump', None)
+
+        if self.report:
+            PROFILER.enable()
+
+        if self.dump is not None:
+            import cProfile
+
+            self.profile = cProfile.Profile()
+            self.profile.enable()
+
+    def finish(self):
+        if self.profile is not None:
+            self.profile.disable()
+            self.profile.dump_stats(self.dump)
+            print >> sys.stderr, 'Profile saved to %s' % self.dump
+
+        if self.report:
+            PROFILER.report()
@@ -1,10 +1,15 @@
 from datetime import datetime
-from urlparse import urljoin
+from email.utils import mktime_tz, parsedate_tz
+from multiprocessing.pool import ThreadPool
+from urllib import urlencode
+from urlparse import parse_qsl, urljoin, urlparse, urlunparse
+import Queue
 import json
 import logging
 import os
-import pickle
 import sys
+import threading
+import time
 
 from argh import arg
 from argh.exceptions import CommandError
@@ -12,15 +17,62 @@ from dateutil.parser import parse as datetime_parse
 from dateutil.tz import tzlocal
 import requests
 
+from sentrycli import profiling
+from sentrycli.cache import (CachingAdapter, DEFAULT_CACHE_DIR,
+                             DEFAULT_CACHE_SIZE, PageCache)
 from sentrycli.constants import DEFAULT_API_VERSION
+from sentrycli.event import load_from_file
 from sentrycli.preferences import Preferences
+from sentrycli.utils import parse_datetime
+from sentrycli.writers import get_writer, WRITERS
 
 
-logging.basicConfig(level=logging.INFO)
 logger = logging.getLogger(__name__)
 
+# Max number of downloaded pages waiting to be decoded.
+PAGE_QUEUE_SIZE = 4
+# Max number of seconds to wait for background download of pages to finish
+# once no more pages are needed.
+FETCHER_JOIN_TIMEOUT = 10.0
+# Max number of attempts to get a page while being rate limited.
+MAX_ATTEMPTS = 10
+# Default number of issues downloaded concurrently.
+DEFAULT_WORKERS = 4
 
-def check_api_key(key, version, host):
+
+def create_session(api_key, pool_size=None, cache=None):
+    """
+    Create HTTP session reusing connections (keep-alive) between requests.
+    Session can be shared between threads.
+
+    :param api_key: API key
+    :type: str
+    :param pool_size: max number of connections kept per host (requests'
+    default if not specified)
+    :type: int
+    :param cache: cache of pages of issues' events
+    :type: sentrycli.cache.PageCache
+    :rtype: requests.Session
+    """
+    session = requests.Session()
+    session.auth = (api_key, '')
+
+    if pool_size is None and cache is None:
+        return session
+
+    options = {} if pool_size is None else {'pool_maxsize': pool_size}
+
+    if cache is None:
+        adapter = requests.adapters.HTTPAdapter(**options)
+    else:
+        adapter = CachingAdapter(cache, **options)
+
+    session.mount('http://', adapter)
+    session.mount('https://', adapter)
+    return session
+
+
+def check_api_key(key, version, host, session=None):
     """
     Check if API key is valid.
 
@@ -30,10 +82,13 @@ def check_api_key(key, version, host):
     :type: int
     :param host:
     :type: str
+    :param session: session to use (new one is created if not specified)
+    :type: requests.Session
     :rtype: bool
     """
+    session = session or create_session(key)
     url = urljoin(host, 'api/%d/' % version)
-    response = requests.get(url, auth=(key, ''))
+    response = session.get(url)
 
     if not response.ok:
         detail = response.json()['detail']
@@ -44,7 +99,502 @@ def check_api_key(key, version, host):
         return True
 
 
-def get_events(url, api_key, limit, since=None, to=None):
+class Backoff(object):
+    """
+    Adaptive delay between requests.
+    Grows multiplicatively when server says we're too fast (HTTP 429) and
+    decays on every successful request so throughput stays close to the
+    server's limit.
+    """
+    MIN_DELAY = 0.5
+    MAX_DELAY = 120.0
+    DECAY = 0.75
+
+    def __init__(self):
+        self.delay = 0.0
+
+    def wait(self):
+        if self.delay:
+            time.sleep(self.delay)
+
+    def succeeded(self):
+        self.delay *= self.DECAY
+
+        if self.delay < self.MIN_DELAY / 4:
+            self.delay = 0.0
+
+    def throttled(self, retry_after=None):
+        """
+        :param retry_after: delay requested by server in seconds
+        :type: float
+        """
+        delay = max(self.delay * 2, self.MIN_DELAY, retry_after or 0)
+        self.delay = min(delay, self.MAX_DELAY)
+
+
+def parse_retry_after(value):
+    """
+    Parse value of Retry-After header (either seconds or HTTP date).
+
+    :type value: str
+    :rtype: float or None
+    """
+    if not value:
+        return None
+
+    try:
+        return max(float(value), 0)
+    except ValueError:
+        pass
+
+    date = parsedate_tz(value)
+
+    if date is None:
+        return None
+
+    return max(mktime_tz(date) - time.time(), 0)
+
+
+def get_page(session, url, backoff):
+    """
+    Get single page, retrying when rate limited.
+
+    :type session: requests.Session
+    :type url: str
+    :type backoff: Backoff
+    :rtype: requests.Response
+    """
+    for _ in xrange(MAX_ATTEMPTS):
+        with profiling.stage('backoff'):
+            backoff.wait()
+
+        with profiling.stage('download'):
+            start = time.time()
+            response = session.get(url)
+            profiling.sample('http latency', time.time() - start)
+            profiling.count('pages')
+
+            if not getattr(response, 'from_cache', False):
+                profiling.count('bytes downloaded', len(response.content))
+
+        if response.status_code != 429:
+            backoff.succeeded()
+            return response
+
+        backoff.throttled(parse_retry_after(
+            response.headers.get('Retry-After')))
+        logger.warning('Rate limited, next request in %.1fs', backoff.delay)
+
+    return response
+
+
+def get_cursor_offset(cursor):
+    """
+    :param cursor: Sentry's cursor `value:offset:is_prev`
+    :type: str
+    :rtype: int or None if cursor doesn't have offset
+    """
+    parts = cursor.split(':')
+
+    if len(parts) != 3 or not parts[1].isdigit():
+        return None
+
+    return int(parts[1])
+
+
+def get_next_url(response, step=1):
+    """
+    Get URL of the following page. With step greater than 1 pages in
+    between are skipped - cursor's offset is moved by that many pages
+    (their size is the difference of offsets of the current and the next
+    page).
+
+    :type response: requests.Response
+    :param step: get every step-th page
+    :type: int
+    :rtype: str or None if there are no more pages
+    """
+    next_page = response.links.get('next', {})
+
+    if next_page.get('results') != 'true':
+        return None
+
+    url = next_page['url']
+
+    if step == 1:
+        return url
+
+    cursor = dict(parse_qsl(urlparse(response.url).query)).get('cursor')
+    offset = 0 if cursor is None else get_cursor_offset(cursor)
+    next_cursor = next_page.get('cursor', '')
+    next_offset = get_cursor_offset(next_cursor)
+
+    if offset is None or next_offset is None or next_offset <= offset:
+        return url
+
+    return get_cursor_url(url, '%s:%d:0' % (
+        next_cursor.split(':')[0],
+        next_offset + (step - 1) * (next_offset - offset)))
+
+
+def fetch_pages(session, url, pages, stop, step=1):
+    """
+    Download pages following pagination and put responses into queue.
+    Meant to be run in separate thread. `None` is put when there are no more
+    pages, exception instance if something went wrong.
+
+    :type session: requests.Session
+    :param url: URL of the first page
+    :type: str
+    :param pages: queue for downloaded pages
+    :type: Queue.Queue
+    :param stop: set by consumer when no more pages are needed
+    :type: threading.Event
+    :param step: download every step-th page
+    :type: int
+    """
+    backoff = Backoff()
+
+    def put(item):
+        while not stop.is_set():
+            try:
+                pages.put(item, timeout=0.1)
+                return True
+            except Queue.Full:
+                pass
+
+        return False
+
+    try:
+        while url is not None and not stop.is_set():
+            response = get_page(session, url, backoff)
+
+            if not put(response):
+                return
+
+            if not response.ok:
+                return
+
+            url = get_next_url(response, step)
+    except Exception as error:
+        put(error)
+        return
+
+    put(None)
+
+
+class KnownEvents(object):
+    """
+    Boundary of already downloaded events - creation time of the newest
+    (or oldest) of them along with identifiers of events created exactly then.
+    """
+
+    def __init__(self, ctime, ids):
+        """
+        :type ctime: datetime
+        :type ids: set
+        """
+        self.ctime = ctime
+        self.ids = set(ids)
+
+    def is_older(self, created):
+        """
+        :param created: event's creation time
+        :type: datetime
+        :rtype: bool
+        """
+        return created < self.ctime
+
+    def is_newer(self, created):
+        """
+        :param created: event's creation time
+        :type: datetime
+        :rtype: bool
+        """
+        return created > self.ctime
+
+    def to_dict(self):
+        return {'ctime': self.ctime.isoformat(), 'ids': sorted(self.ids)}
+
+    @classmethod
+    def from_dict(cls, data):
+        if data is None:
+            return None
+
+        return cls(parse_datetime(data['ctime']), data['ids'])
+
+    @classmethod
+    def from_file(cls, pathname):
+        """
+        Find the newest event saved in file. Every event is checked - events
+        downloaded by updates are appended after older ones - so it's used
+        only if the newest event isn't recorded (see `load_newest`).
+
+        :param pathname: path to file with events
+        :type: str
+        :rtype: KnownEvents or None if there are no events
+        """
+        return cls.merge(None, (event.raw
+                                for event in load_from_file(pathname)))
+
+    @classmethod
+    def merge(cls, known, events):
+        """
+        Get the newest of already known and given events.
+
+        :param known: the newest event seen before (left unchanged)
+        :type: KnownEvents
+        :param events: events in any order
+        :type: iterable<dict>
+        :rtype: KnownEvents or None if there are no events
+        """
+        if known is not None:
+            known = cls(known.ctime, known.ids)
+
+        for event in events:
+            ctime = parse_datetime(event['dateCreated'])
+
+            if known is None or known.is_newer(ctime):
+                known = cls(ctime, [])
+
+            if ctime == known.ctime:
+                known.ids.add(event['id'])
+
+        return known
+
+    @classmethod
+    def from_newest(cls, events):
+        """
+        Get boundary of the newest event in page (events are sorted from the
+        newest).
+
+        :type events: list
+        :rtype: KnownEvents or None if page is empty
+        """
+        if not events:
+            return None
+
+        ctime = parse_datetime(events[0]['dateCreated'])
+        ids = [event['id'] for event in events
+               if parse_datetime(event['dateCreated']) == ctime]
+        return cls(ctime, ids)
+
+    @classmethod
+    def from_page(cls, events):
+        """
+        Get boundary of the oldest event in page (events are sorted from the
+        newest).
+
+        :type events: list
+        :rtype: KnownEvents or None if page is empty
+        """
+        if not events:
+            return None
+
+        ctime = parse_datetime(events[-1]['dateCreated'])
+        ids = [event['id'] for event in events
+               if parse_datetime(event['dateCreated']) == ctime]
+        return cls(ctime, ids)
+
+
+def iter_pages(url, session, since=None, to=None, known=None, skip=None,
+               step=1):
+    """
+    Get issue's events page by page.
+    Downloading happens in background thread so next page is fetched while
+    the current one is being decoded and filtered.
+
+    Yields pairs of (events, next_url) where `next_url` is URL of the
+    following page (`None` on the last one) so download can be resumed.
+
+    :param url: URL of the first page
+    :type: str
+    :type session: requests.Session
+    :param since: event's min creation datetime
+    :type: datetime
+    :param to: event's max creation datetime
+    :type: datetime
+    :param known: newest already downloaded event - pagination stops as soon
+    as it's reached
+    :type: KnownEvents
+    :param skip: oldest already downloaded event when resuming - everything
+    newer is skipped (new events shift cursors)
+    :type: KnownEvents
+    :param step: get every step-th page
+    :type: int
+    :rtype: iterator<(list, str)>
+    """
+    pages = Queue.Queue(maxsize=PAGE_QUEUE_SIZE)
+    stop = threading.Event()
+    fetcher = threading.Thread(target=fetch_pages,
+                               args=(session, url, pages, stop, step))
+    fetcher.daemon = True
+    fetcher.start()
+
+    try:
+        while True:
+            response = pages.get()
+
+            if response is None:
+                return
+
+            if isinstance(response, Exception):
+                raise response
+
+            if not response.ok:
+                code = response.status_code
+
+                if code == 404:
+                    logger.error('Issue not found (%s)', url)
+                    return
+
+                detail = response.json()['detail']
+                logger.error('Server returned %d: %s', code, detail)
+                return
+
+            next_url = get_next_url(response, step)
+
+            with profiling.stage('decode'):
+                page = response.json()
+
+            if (since or to or known or skip) is None:
+                yield page, next_url
+                continue
+
+            events = []
+
+            for event in page:
+                created = parse_datetime(event['dateCreated'])
+
+                if known is not None and known.is_older(created):
+                    # Everything from now on has been downloaded already.
+                    yield events, None
+                    return
+
+                if since is not None and created < since:
+                    # Events are sorted so no need to ask for more pages.
+                    yield events, None
+                    return
+
+                if to is not None and created > to:
+                    continue
+
+                if known is not None and event['id'] in known.ids:
+                    continue
+
+                if skip is not None and (skip.is_newer(created) or
+                                         event['id'] in skip.ids):
+                    continue
+
+                events.append(event)
+
+            yield events, next_url
+    finally:
+        stop.set()
+
+        # Unblock fetcher waiting for free space in queue and let its
+        # current request finish - otherwise it can be still running
+        # while interpreter shuts down.
+        deadline = time.time() + FETCHER_JOIN_TIMEOUT
+
+        while fetcher.is_alive() and time.time() < deadline:
+            try:
+                while True:
+                    pages.get_nowait()
+            except Queue.Empty:
+                pass
+
+            fetcher.join(0.1)
+
+
+def get_cursor_url(url, cursor):
+    """
+    Replace cursor in URL of a page.
+
+    :type url: str
+    :type cursor: str
+    :rtype: str
+    """
+    parts = urlparse(url)
+    query = [(key, value) for key, value in parse_qsl(parts.query)
+             if key != 'cursor']
+    query.append(('cursor', cursor))
+    return urlunparse(parts._replace(query=urlencode(query)))
+
+
+def seek_window(url, session, to):
+    """
+    Find the first page with events not newer than `to` so pages with
+    newer events aren't downloaded. Sentry's cursors are `value:offset:is_prev`
+    so pages are probed by offset - first galloping (1, 2, 4... pages) and
+    then bisecting using creation time of the oldest event on each page.
+
+    :param url: URL of the first page
+    :type: str
+    :type session: requests.Session
+    :param to: event's max creation datetime
+    :type: datetime
+    :return: URL to start downloading from (`url` if seeking isn't
+    possible)
+    :rtype: str
+    """
+    backoff = Backoff()
+    probes = [0]
+
+    def probe(page_url):
+        """
+        :return: whether page has events not newer than `to` (or no events)
+        """
+        probes[0] += 1
+        response = get_page(session, page_url, backoff)
+
+        if not response.ok:
+            raise ValueError(response.status_code)
+
+        events = response.json()
+        return (not events or
+                parse_datetime(events[-1]['dateCreated']) <= to), response
+
+    try:
+        found, response = probe(url)
+    except ValueError:
+        return url
+
+    cursor = response.links.get('next', {}).get('cursor', '')
+    parts = cursor.split(':')
+    size = len(response.json())
+
+    if found or len(parts) != 3 or not parts[1].isdigit() or not size:
+        return url
+
+    def page_url(number):
+        return get_cursor_url(
+            url, '%s:%d:0' % (parts[0], int(parts[1]) + (number - 1) * size))
+
+    # Page `low` has only newer events, page `high` has older ones.
+    low, high = 0, 1
+
+    try:
+        while not probe(page_url(high))[0]:
+            low, high = high, high * 2
+
+        while high - low > 1:
+            middle = (low + high) // 2
+
+            if probe(page_url(middle))[0]:
+                high = middle
+            else:
+                low = middle
+    except ValueError:
+        return url
+
+    logger.info('Skipped %d pages newer than %s (%d requests)', high,
+                to.isoformat(), probes[0])
+    return page_url(high)
+
+
+def get_events(url, api_key, limit, since=None, to=None, session=None,
+               seek=False):
     """
     Get issue's events by URL.
     Handle pagination automatically -
@@ -60,68 +610,519 @@ def get_events(url, api_key, limit, since=None, to=None):
     :type: datetime
     :param to: event's max creation datetime
     :type: datetime
+    :param session: session to use (new one is created if not specified)
+    :type: requests.Session
+    :param seek: skip pages newer than `to` without downloading them all
+    :type: bool
     :rtype: list
     """
-    response = requests.get(url, auth=(api_key, ''))
+    session = session or create_session(api_key)
+    events = []
 
-    if not response.ok:
-        code = response.status_code
+    if limit <= 0:
+        return events
 
-        if code == 404:
-            logger.error('Issue not found')
-            return []
+    if seek and to is not None:
+        url = seek_window(url, session, to)
 
-        detail = response.json()['detail']
-        logger.error('Server returned %d: %s', code, detail)
-        return []
+    for page, _ in iter_pages(url, session, since=since, to=to):
+        events.extend(page[:limit - len(events)])
 
-    if (since or to) is not None:
-        events = []
+        if len(events) >= limit:
+            break
 
-        for event in response.json():
-            created = datetime_parse(event['dateCreated'])
+    return events
 
-            if since is not None and created < since:
-                # Set limit to avoid asking for more pages.
-                limit = len(events)
-                break
 
-            if to is not None and created > to:
-                continue
+def get_state_path(output):
+    """
+    Get path to file holding state of interrupted download.
+
+    :param output: path to output file
+    :type: str
+    :rtype: str
+    """
+    return output + '.cursor'
+
+
+def load_state(output):
+    """
+    :param output: path to output file
+    :type: str
+    :rtype: dict or None if no download was interrupted
+    """
+    path = get_state_path(output)
+
+    if not os.path.isfile(path):
+        return None
+
+    with open(path) as f:
+        return json.load(f)
+
+
+def save_state(output, state):
+    """
+    Atomically save state of download.
+
+    :param output: path to output file
+    :type: str
+    :type state: dict
+    """
+    path = get_state_path(output)
+
+    with open(path + '.tmp', 'w') as f:
+        json.dump(state, f)
+
+    os.rename(path + '.tmp', path)
+
+
+def clear_state(output):
+    """
+    :param output: path to output file
+    :type: str
+    """
+    path = get_state_path(output)
+
+    if os.path.isfile(path):
+        os.remove(path)
+
+
+def get_newest_path(output):
+    """
+    Get path to file holding the newest event saved in output file.
+
+    :param output: path to output file
+    :type: str
+    :rtype: str
+    """
+    return output + '.newest'
+
+
+def load_newest(output):
+    """
+    :param output: path to output file
+    :type: str
+    :return: the newest event saved in output file or None if it isn't
+    known (file was changed after it was recorded)
+    :rtype: KnownEvents
+    """
+    path = get_newest_path(output)
+
+    try:
+        with open(path) as f:
+            record = json.load(f)
+
+        stat = os.stat(output)
+    except (IOError, OSError, ValueError):
+        return None
+
+    if (record.get('size') != stat.st_size or
+            record.get('mtime') != stat.st_mtime):
+        return None
+
+    return KnownEvents.from_dict(record.get('known'))
+
 
-            events.append(event)
+def save_newest(output, newest):
+    """
+    Record the newest event saved in output file (so `--update` doesn't
+    have to read the whole file to find it).
+
+    :param output: path to output file
+    :type: str
+    :param newest: the newest event saved in output file (record is removed
+    if it isn't known)
+    :type: KnownEvents
+    """
+    path = get_newest_path(output)
+
+    if newest is None or not os.path.isfile(output):
+        if os.path.isfile(path):
+            os.remove(path)
+
+        return
+
+    stat = os.stat(output)
+
+    with open(path + '.tmp', 'w') as f:
+        json.dump({'known': newest.to_dict(), 'size': stat.st_size,
+                   'mtime': stat.st_mtime}, f)
+
+    os.rename(path + '.tmp', path)
+
+
+def download_pages(url, session, writer, limit, since=None, to=None,
+                   known=None, skip=None, step=1, newest=None):
+    """
+    Write events to output file page by page as they arrive. Cursor of the
+    next page is saved after each of them, so interrupted download can be
+    resumed.
+
+    :param url: URL of the first page
+    :type: str
+    :type session: requests.Session
+    :param writer: writer of output file
+    :type: sentrycli.writers.Writer
+    :param limit: Maximum number of events to download
+    :type: int
+    :param since: event's min creation datetime
+    :type: datetime
+    :param to: event's max creation datetime
+    :type: datetime
+    :param known: newest already downloaded event
+    :type: KnownEvents
+    :param skip: oldest event downloaded before interruption
+    :type: KnownEvents
+    :param step: download every step-th page
+    :type: int
+    :param newest: the newest event already saved in output file
+    :type: KnownEvents
+    :return: number of downloaded events and the newest event saved in
+    output file
+    :rtype: (int, KnownEvents)
+    """
+    output = writer.pathname
+    count = 0
+    pages = iter_pages(url, session, since=since, to=to, known=known,
+                       skip=skip, step=step)
+
+    for events, next_url in pages:
+        if len(events) > limit - count:
+            # Rest of this page will be downloaded once resumed.
+            events = events[:limit - count]
+            next_url = url
+
+        count += len(events)
+        profiling.count('events', len(events))
+
+        with profiling.stage('write'):
+            size = writer.write(events)
+        skip = KnownEvents.from_page(events) or skip
+        newest = KnownEvents.merge(newest, events)
+
+        if next_url is None:
+            clear_state(output)
+            break
+
+        if writer.resumable:
+            save_state(output, {
+                'url': next_url,
+                'size': size,
+                'known': known and known.to_dict(),
+                'skip': skip and skip.to_dict(),
+                'newest': newest and newest.to_dict(),
+            })
+
+        if count >= limit:
+            if writer.resumable:
+                logger.info('Limit reached, use --update to continue')
+            else:
+                logger.warning('Limit reached, download cannot be resumed '
+                               'in this format (--update would get only '
+                               'newer events)')
+            break
+
+        url = next_url
     else:
-        events = response.json()
+        clear_state(output)
 
-    limit -= len(events)
+    return count, newest
 
-    if limit < 0:
-        events = events[:limit]
-        limit = 0
 
-    if limit > 0 and response.links['next']['results'] == 'true':
-        events.extend(get_events(url=response.links['next']['url'],
-                                 api_key=api_key,
-                                 limit=limit,
-                                 since=since,
-                                 to=to))
+def update_events(url, session, output, format, limit, since=None, to=None):
+    """
+    Download only events newer than the ones already saved in output file.
+    Interrupted download is resumed first.
 
-    return events
+    :param url: URL to get events
+    :type: str
+    :type session: requests.Session
+    :param output: path to output file
+    :type: str
+    :param format: output file format
+    :type: str
+    :param limit: Maximum number of events to download
+    :type: int
+    :param since: event's min creation datetime
+    :type: datetime
+    :param to: event's max creation datetime
+    :type: datetime
+    :return: number of downloaded events
+    :rtype: int
+    """
+    if not os.path.exists(output):
+        clear_state(output)
+
+    count = 0
+    state = load_state(output)
+
+    if state is not None:
+        logger.info('Resuming interrupted download')
+
+        # Drop anything written after the state was saved.
+        with open(output, 'r+b') as f:
+            f.truncate(state['size'])
+
+        with get_writer(format, output, append=True) as writer:
+            resumed, newest = download_pages(
+                url=state['url'],
+                session=session,
+                writer=writer,
+                limit=limit,
+                since=since,
+                to=to,
+                known=KnownEvents.from_dict(state['known']),
+                skip=KnownEvents.from_dict(state['skip']),
+                newest=KnownEvents.from_dict(state.get('newest')))
+
+        count += resumed
+        # State saved by older versions doesn't hold the newest event.
+        save_newest(output, newest if 'newest' in state else None)
+
+        if count >= limit or load_state(output) is not None:
+            return count
+
+    known = None
+
+    if os.path.exists(output):
+        known = load_newest(output)
+
+        if known is None:
+            known = KnownEvents.from_file(output)
+
+    if known is not None:
+        logger.info('Getting events newer than %s', known.ctime.isoformat())
+
+    with get_writer(format, output, append=True) as writer:
+        downloaded, newest = download_pages(url=url,
+                                            session=session,
+                                            writer=writer,
+                                            limit=limit - count,
+                                            since=since,
+                                            to=to,
+                                            known=known,
+                                            newest=known)
+
+    save_newest(output, newest)
+    return count + downloaded
+
+
+def read_issues(pathname):
+    """
+    Read issues' identifiers from file (one per line, blank lines and lines
+    starting with # are skipped).
+
+    :param pathname: path to file with identifiers
+    :type: str
+    :rtype: list
+    :raises: argh.CommandError if file cannot be read
+    """
+    try:
+        with open(pathname) as f:
+            lines = [line.strip() for line in f]
+    except IOError as error:
+        raise CommandError('cannot read issues: %s' % error)
+
+    return [line for line in lines if line and not line.startswith('#')]
 
 
-@arg('issue', help='Issue identifier')
+def get_output_path(output, issue, format):
+    """
+    :param output: path to output file, `{issue}` is replaced with issue's
+    identifier (defaults to <issue>.<format> in current directory)
+    :type: str
+    :type issue: str
+    :param format: output file format
+    :type: str
+    :rtype: str
+    """
+    if output is None:
+        return os.path.join(os.getcwd(), '%s.%s' % (issue, format))
+
+    return output.replace('{issue}', issue)
+
+
+def get_issue_url(host, api_version, issue):
+    """
+    :type host: str
+    :type api_version: int
+    :param issue: issue's identifier
+    :type: str
+    :return: URL of the first page of issue's events
+    :rtype: str
+    """
+    return urljoin(host, '/api/%d/issues/%s/events/' % (api_version, issue))
+
+
+def download_issue(issue, session, host, api_version, output, format, limit,
+                   since, to, update, seek=False, store=None, page_step=1):
+    """
+    Download issue's events into output file.
+
+    :param issue: issue's identifier
+    :type: str
+    :type session: requests.Session
+    :type host: str
+    :type api_version: int
+    :param output: path to output file
+    :type: str
+    :param format: output file format
+    :type: str
+    :param limit: Maximum number of events to download
+    :type: int
+    :param since: event's min creation datetime
+    :type: datetime
+    :param to: event's max creation datetime
+    :type: datetime
+    :param update: download only events newer than the ones already saved
+    :type: bool
+    :param seek: skip pages newer than `to` without downloading them all
+    :type: bool
+    :param store: path to SQLite store to insert events into (instead of
+    output file)
+    :type: str
+    :param page_step: download only every page_step-th page (sample of
+    events)
+    :type: int
+    :return: number of downloaded events
+    :rtype: int
+    """
+    url = get_issue_url(host, api_version, issue)
+    logger.info('Getting events for issue %s (may take a while)', issue)
+
+    if page_step > 1:
+        logger.info('Downloading every %d. page (about 1/%d of events)',
+                    page_step, page_step)
+    start = time.time()
+
+    if update:
+        count = update_events(url=url,
+                              session=session,
+                              output=output,
+                              format=format,
+                              limit=limit,
+                              since=since,
+                              to=to)
+        logger.info('%d new events saved to %s', count, output)
+        return count
+
+    if seek:
+        url = seek_window(url, session, to)
+
+    if store is not None:
+        from sentrycli.store import StoreWriter
+
+        with StoreWriter(store, issue) as writer:
+            count, _ = download_pages(url=url,
+                                   session=session,
+                                   writer=writer,
+                                   limit=limit,
+                                   since=since,
+                                   to=to,
+                                   step=page_step)
+
+        logger.info('%d events of issue %s downloaded, %d new saved to %s '
+                    '(%.1f events/s)', count, issue, writer.inserted, store,
+                    count / max(time.time() - start, 1e-6))
+        return count
+
+    clear_state(output)
+    save_newest(output, None)
+
+    with get_writer(format, output) as writer:
+        count, newest = download_pages(url=url,
+                                       session=session,
+                                       writer=writer,
+                                       limit=limit,
+                                       since=since,
+                                       to=to,
+                                       step=page_step)
+
+    if count == 0:
+        os.remove(output)
+        logger.info('No events found for issue %s', issue)
+        return count
+
+    save_newest(output, newest)
+
+    logger.info('%d events saved to %s (%.1f events/s)', count, output,
+                count / max(time.time() - start, 1e-6))
+    return count
+
+
+@arg('issues', nargs='*', help='Issues identifiers')
+@arg('-i', '--issues-file', help='path to file with issues identifiers '
+                                 '(one per line)')
 @arg('--api-key', help='API key')
 @arg('--host', help='Host')
 @arg('--api-version', help='API version')
 @arg('-s', '--since', help="format 'yyyy-mm-dd(Thh:mm:ss)'",
      type=datetime_parse)
 @arg('-t', '--to', help="format 'yyyy-mm-dd(Thh:mm:ss)'", type=datetime_parse)
-@arg('-o', '--output', help='path to output file')
-@arg('-f', '--format', help='output file format', choices=['json', 'pickle'])
-@arg('-l', '--limit', help='max number of downloaded events')
-def query(issue, api_key=None, host=None, api_version=DEFAULT_API_VERSION,
-          output=None, format='json', limit=sys.maxint,
-          to=datetime.now(tzlocal()), since=None):
+@arg('-o', '--output', help='path to output file, with many issues it has '
+                            'to contain {issue} e.g. dumps/{issue}.json')
+@arg('-f', '--format', help='output file format', choices=sorted(WRITERS))
+@arg('-l', '--limit', help='max number of downloaded events (per issue)')
+@arg('-u', '--update', help='download only events newer than the ones '
+                            'already saved in output file (resumes '
+                            'interrupted download) - they are appended '
+                            'so file is no longer sorted from the newest')
+@arg('--seek', help='jump over pages newer than --to instead of '
+                     'downloading them')
+@arg('--store', help='path to SQLite store to insert events into instead '
+                      'of output file (created if missing)')
+@arg('-j', '--workers', type=int,
+     help='max number of issues downloaded concurrently')
+@arg('--page-step', type=int, metavar='K',
+     help='download only every K-th page - sample of about 1/K of events')
+@arg('--cache-dir', help='directory with cached pages of events')
+@arg('--cache-size', type=int,
+     help='max size of cached pages in MB, the least recently used ones '
+          'are evicted')
+@arg('--no-cache', help="don't use (nor fill) cache of pages")
+def query(issues, issues_file=None, api_key=None, host=None,
+          api_version=DEFAULT_API_VERSION, output=None, format='json',
+          limit=sys.maxint, to=datetime.now(tzlocal()), since=None,
+          update=False, workers=DEFAULT_WORKERS, seek=False, store=None,
+          page_step=1, cache_dir=DEFAULT_CACHE_DIR,
+          cache_size=DEFAULT_CACHE_SIZE, no_cache=False):
+
+    if update and format == 'pickle':
+        raise CommandError('--update is not supported for pickle format')
+
+    if update and seek:
+        raise CommandError('--seek cannot be used with --update')
+
+    if page_step < 1:
+        raise CommandError('--page-step has to be positive')
+
+    if update and page_step > 1:
+        raise CommandError('--page-step cannot be used with --update')
+
+    if store is not None and (update or output is not None):
+        raise CommandError('--store cannot be used with --update nor '
+                           '--output')
+
+    issues = list(issues)
+
+    if issues_file is not None:
+        issues.extend(read_issues(issues_file))
+
+    if not issues:
+        raise CommandError('no issues specified')
+
+    # Preserve order, drop duplicates.
+    issues = sorted(set(issues), key=issues.index)
+
+    if len(issues) > 1 and output is not None and '{issue}' not in output:
+        raise CommandError('--output has to contain {issue} when '
+                           'downloading many issues')
+
+    if workers < 1:
+        raise CommandError('--workers has to be positive')
+
+    if cache_size < 1:
+        raise CommandError('--cache-size has to be positive')
 
     preferences = Preferences()
 
@@ -154,35 +1155,63 @@ def query(issue, api_key=None, host=None, api_version=DEFAULT_API_VERSION,
     else:
         preferences.api_key = api_key
 
-    if output is None:
-        file_name = issue
-        file_name += '.' + format
-        output = os.path.join(os.getcwd(), file_name)
+    workers = min(workers, len(issues))
+    cache = None
 
+    if not no_cache:
+        cache = PageCache(cache_dir, cache_size * 1024 * 1024)
+
+    # Every download has a background thread fetching pages.
+    session = create_session(api_key, pool_size=workers * 2, cache=cache)
     ret = check_api_key(key=api_key,
                         host=host,
-                        version=api_version)
+                        version=api_version,
+                        session=session)
 
     if not ret:
         return
 
-    path = '/api/%d/issues/%s/events/' % (api_version, issue)
-    url = urljoin(host, path)
-    logger.info('Getting events for issue %s (may take a while)', issue)
-    events = get_events(url=url,
-                        api_key=api_key,
-                        limit=limit,
-                        since=since,
-                        to=to)
-
-    if len(events) == 0:
-        logger.info('No events found')
+    def download(issue):
+        try:
+            return issue, download_issue(
+                issue=issue,
+                session=session,
+                host=host,
+                api_version=api_version,
+                output=get_output_path(output, issue, format),
+                format=format,
+                limit=limit,
+                since=since,
+                to=to,
+                update=update,
+                seek=seek,
+                store=store,
+                page_step=page_step)
+        except Exception as error:
+            if len(issues) == 1:
+                raise
+
+            logger.error('Download of issue %s failed: %s', issue, error)
+            return issue, None
+
+    if len(issues) == 1:
+        download(issues[0])
         return
 
-    with open(output, 'w+') as f:
-        if format == 'json':
-            json.dump(events, f, indent=2)
-        else:
-            pickle.dump(events, f)
+    start = time.time()
+    pool = ThreadPool(workers)
+
+    try:
+        results = list(pool.imap_unordered(download, issues))
+    finally:
+        pool.close()
+
+    elapsed = max(time.time() - start, 1e-6)
+    total = sum(count for _, count in results if count)
+    failed = sorted(issue for issue, count in results if count is None)
+    logger.info('%d events from %d issues in %.1fs (%.1f events/s)', total,
+                len(issues) - len(failed), elapsed, total / elapsed)
 
-    logger.info('%d events saved to %s', len(events), output)
+    if failed:
+        raise CommandError('failed to download issues: %s' %
+                           ' '.join(failed))
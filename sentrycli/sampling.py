@@ -0,0 +1,270 @@
+from collections import defaultdict
+from itertools import ifilter
+from math import exp, floor, log, sqrt
+import random
+
+from argh import CommandError
+
+from sentrycli import profiling
+from sentrycli.container import EventContainer
+from sentrycli.event import (detect_format, Event, iter_json_array,
+                             iter_json_lines)
+
+
+# Confidence level of intervals (%) and its normal distribution's quantile.
+CONFIDENCE = 95
+Z_95 = 1.96
+DAY = 86400
+
+
+def confidence_interval(variance, total):
+    """
+    :param variance: variance of estimated count of group
+    :type: float
+    :param total: estimated count of all events
+    :type: float
+    :return: half-width of 95% confidence interval of group's percentage
+    :rtype: float
+    """
+    if not total:
+        return 0.0
+
+    return Z_95 * sqrt(variance) * 100 / total
+
+
+class Sampler(object):
+    """
+    Chooses events in a single pass over them, separately in each stratum
+    (e.g. day). Each stream's event has to be first offered with `accept`
+    and if accepted, passed to `add` (None if it didn't pass the filter).
+    """
+
+    def __init__(self, stratify=False, seed=None):
+        """
+        :param stratify: sample each day of creation separately
+        :type: bool
+        :param seed: seed of random numbers generator
+        :type: int
+        """
+        self.stratify = stratify
+        self.random = random.Random(seed)
+        # Number of offered events by stratum.
+        self.seen = defaultdict(int)
+        self.items = defaultdict(list)
+
+    def accept(self, stratum=None):
+        """
+        :param stratum: stratum of offered event
+        :type: hashable
+        :return: whether event should be added to sample
+        :rtype: bool
+        """
+        raise NotImplementedError
+
+    def add(self, item, stratum=None):
+        """
+        :param item: accepted event (None if it was filtered out)
+        :type: stratum: hashable
+        """
+        raise NotImplementedError
+
+    def strata(self):
+        """
+        :return: (sampled items, number of all events) for each stratum
+        :rtype: iterator<(list, int)>
+        """
+        for stratum in sorted(self.seen):
+            yield self.items[stratum], self.seen[stratum]
+
+
+class RateSampler(Sampler):
+    """
+    Bernoulli sampling - each event is chosen with the same probability.
+    """
+
+    def __init__(self, rate, stratify=False, seed=None):
+        """
+        :param rate: probability of choosing event (0-1)
+        :type: float
+        """
+        super(RateSampler, self).__init__(stratify, seed)
+        self.rate = rate
+
+    def accept(self, stratum=None):
+        self.seen[stratum] += 1
+        return self.random.random() < self.rate
+
+    def add(self, item, stratum=None):
+        self.items[stratum].append(item)
+
+
+class ReservoirSampler(Sampler):
+    """
+    Keeps uniform random sample of fixed size of each stratum (reservoir
+    sampling, algorithm L) - after the reservoir fills up, number of events
+    skipped before the next accepted one is drawn at once.
+    """
+
+    def __init__(self, size, stratify=False, seed=None):
+        """
+        :param size: max number of events sampled in each stratum
+        :type: int
+        """
+        super(ReservoirSampler, self).__init__(stratify, seed)
+        self.size = size
+        # Per stratum - weight of algorithm L and number of the next
+        # accepted event.
+        self.weights = {}
+        self.next = {}
+
+    def accept(self, stratum=None):
+        self.seen[stratum] += 1
+        return (len(self.items[stratum]) < self.size or
+                self.seen[stratum] == self.next[stratum])
+
+    def add(self, item, stratum=None):
+        items = self.items[stratum]
+
+        if len(items) < self.size:
+            items.append(item)
+
+            if len(items) < self.size:
+                return
+
+            self.weights[stratum] = 1.0
+        else:
+            items[self.random.randrange(self.size)] = item
+
+        self.weights[stratum] *= exp(log(self.uniform()) / self.size)
+        remaining = 1 - self.weights[stratum]
+        skip = floor(log(self.uniform()) / log(remaining)) if remaining else 0
+        self.next[stratum] = self.seen[stratum] + int(skip) + 1
+
+    def uniform(self):
+        """
+        :return: random number from (0, 1)
+        :rtype: float
+        """
+        value = 0.0
+
+        while not value:
+            value = self.random.random()
+
+        return value
+
+
+def create_sampler(options):
+    """
+    :param options: sampling options - either `size` or `rate` and
+    optionally `stratify`
+    :type: dict
+    :rtype: Sampler
+    """
+    if options.get('size') is not None:
+        return ReservoirSampler(options['size'], options.get('stratify'))
+
+    return RateSampler(options['rate'], options.get('stratify'))
+
+
+def get_sampling(size, rate, stratify):
+    """
+    Check sampling arguments of a command.
+
+    :param size: --sample
+    :type: int
+    :param rate: --sample-rate
+    :type: float
+    :param stratify: --stratify
+    :type: bool
+    :return: sampling options (see `create_sampler`) or None if events
+    shouldn't be sampled
+    :rtype: dict
+    :raises: argh.CommandError if arguments are invalid
+    """
+    if size is None and rate is None:
+        if stratify:
+            raise CommandError('--stratify needs --sample or --sample-rate')
+
+        return None
+
+    if size is not None and rate is not None:
+        raise CommandError('--sample cannot be used with --sample-rate')
+
+    if size is not None and size < 1:
+        raise CommandError('--sample has to be positive')
+
+    if rate is not None and not 0 < rate <= 1:
+        raise CommandError('--sample-rate has to be in (0, 1]')
+
+    return {'size': size, 'rate': rate, 'stratify': stratify}
+
+
+def sample_file(pathname, sampler, projection=None, event_filter=None):
+    """
+    Offer events from file to sampler. Unless sampling is stratified,
+    events are chosen before they're turned into `Event` (lines of
+    newline-delimited JSON and records of binary container even before
+    decoding).
+
+    :param pathname: path to file with events
+    :type: str
+    :type sampler: Sampler
+    :param projection: if specified, only needed fields are kept
+    :type: sentrycli.event.Projection
+    :param event_filter: events not passing it are sampled as None
+    :type: sentrycli.where.Filter
+    """
+    # Stratum (day of creation) is known only once event is decoded.
+    early = not sampler.stratify
+
+    def accept(_):
+        return sampler.accept()
+
+    with open(pathname, 'rb') as f:
+        file_format = detect_format(f)
+        container = None
+
+        if file_format == 'binary':
+            container = EventContainer(f)
+            events = container.iter_events(accept=accept if early else None)
+        elif file_format == 'json':
+            events = iter_json_array(f)
+
+            if early:
+                events = ifilter(accept, events)
+        else:
+            events = iter_json_lines(f, accept=accept if early else None)
+
+        if projection is not None:
+            compact = profiling.wrap(projection.compact, 'extract')
+
+        if event_filter is not None:
+            event_filter = profiling.wrap(event_filter, 'filter')
+
+        stratum = None
+
+        try:
+            for event in profiling.timed(events, 'decode'):
+                event = Event(event)
+
+                if not early:
+                    stratum = event.timestamp // DAY
+
+                    if not sampler.accept(stratum):
+                        continue
+
+                if event_filter is not None and not event_filter(event):
+                    sampler.add(None, stratum)
+                elif projection is not None:
+                    sampler.add(compact(event), stratum)
+                else:
+                    sampler.add(event, stratum)
+        finally:
+            profiling.count('events', sum(sampler.seen.itervalues()))
+            profiling.count('events sampled', sum(
+                len(items) for items in sampler.items.itervalues()))
+            profiling.count('bytes read', f.tell() if container is None
+                            else container.bytes_read)
+
+            if container is not None:
+                container.close()
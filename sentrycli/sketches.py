@@ -0,0 +1,212 @@
+from heapq import heapify, heappop, heappush
+from math import log
+from operator import itemgetter
+
+
+# Number of keys tracked by default by `SpaceSaving`.
+DEFAULT_CAPACITY = 1000
+# Number of tracked keys per each requested top result.
+CAPACITY_PER_TOP = 10
+# Number of HyperLogLog's registers is 2^PRECISION (error ~1.04/sqrt(m)).
+PRECISION = 14
+MASK_64 = (1 << 64) - 1
+
+
+def get_capacity(top):
+    """
+    :param top: number of requested results
+    :type: int or None
+    :rtype: int
+    """
+    return max(DEFAULT_CAPACITY, CAPACITY_PER_TOP * (top or 0))
+
+
+def hash_64(key):
+    """
+    Get well mixed 64-bit hash of hashable value (finalizer of SplitMix64
+    applied to built-in hash).
+
+    :rtype: int
+    """
+    value = hash(key) & MASK_64
+    value = ((value ^ (value >> 30)) * 0xbf58476d1ce4e5b9) & MASK_64
+    value = ((value ^ (value >> 27)) * 0x94d049bb133111eb) & MASK_64
+    return value ^ (value >> 31)
+
+
+class SpaceSaving(object):
+    """
+    Counter of the most frequent keys in fixed memory (Space-Saving
+    algorithm). At most `capacity` keys are tracked - new key replaces the
+    one with the smallest count and inherits it as possible overestimation
+    (error). Count of any key which occurred more than total / capacity
+    times is guaranteed to be tracked.
+
+    Supports subset of `collections.Counter` interface so it can be used
+    in place of it (`sketch[key] += count`).
+    """
+
+    def __init__(self, capacity=DEFAULT_CAPACITY):
+        """
+        :param capacity: max number of tracked keys
+        :type: int
+        """
+        self.capacity = capacity
+        self.counts = {}
+        self.errors = {}
+        # (count, key) pairs, entries not matching `counts` are outdated.
+        self.heap = []
+
+    def __getitem__(self, key):
+        return self.counts.get(key, 0)
+
+    def __setitem__(self, key, value):
+        """
+        Set new (greater) count of key.
+        """
+        counts = self.counts
+
+        if key not in counts:
+            if len(counts) >= self.capacity:
+                minimum = self.evict()
+                self.errors[key] = minimum
+                value += minimum
+            else:
+                self.errors[key] = 0
+
+        counts[key] = value
+        heappush(self.heap, (value, key))
+
+        if len(self.heap) > 4 * self.capacity:
+            self.heap = [(count, item) for item, count in counts.iteritems()]
+            heapify(self.heap)
+
+    def __len__(self):
+        return len(self.counts)
+
+    def evict(self):
+        """
+        Stop tracking key with the smallest count.
+
+        :return: its count
+        :rtype: int
+        """
+        while True:
+            count, key = heappop(self.heap)
+
+            if self.counts.get(key) == count:
+                del self.counts[key]
+                del self.errors[key]
+                return count
+
+    def error(self, key):
+        """
+        :return: max overestimation of key's count
+        :rtype: int
+        """
+        return self.errors.get(key, 0)
+
+    @property
+    def max_error(self):
+        """
+        Max count of keys which aren't tracked.
+
+        :rtype: int
+        """
+        if len(self.counts) < self.capacity:
+            return 0
+
+        return min(self.counts.itervalues())
+
+    def update(self, other):
+        """
+        Add counts (and errors) of other counter.
+
+        :type other: SpaceSaving or collections.Counter
+        """
+        errors = getattr(other, 'errors', {})
+
+        for key, count in other.iteritems():
+            self[key] += count
+
+            if key in self.errors:
+                self.errors[key] += errors.get(key, 0)
+
+    def iteritems(self):
+        return self.counts.iteritems()
+
+    def items(self):
+        return self.counts.items()
+
+    def values(self):
+        return self.counts.values()
+
+    def most_common(self, n=None):
+        """
+        :param n: number of keys (all if not specified)
+        :type: int
+        :rtype: list - (key, count) pairs
+        """
+        pairs = sorted(self.counts.iteritems(), key=itemgetter(1),
+                       reverse=True)
+        return pairs if n is None else pairs[:n]
+
+
+class HyperLogLog(object):
+    """
+    Estimates number of distinct keys in fixed memory.
+    """
+
+    def __init__(self, precision=PRECISION):
+        """
+        :param precision: number of bits used to pick register
+        :type: int
+        """
+        self.precision = precision
+        self.registers = bytearray(1 << precision)
+
+    def add(self, key):
+        """
+        :param key: hashable value
+        """
+        value = hash_64(key)
+        register = value >> (64 - self.precision)
+        rest = value & ((1 << (64 - self.precision)) - 1)
+        rank = 64 - self.precision - rest.bit_length() + 1
+
+        if rank > self.registers[register]:
+            self.registers[register] = rank
+
+    def update(self, other):
+        """
+        Add keys counted by other estimator of the same precision.
+
+        :type other: HyperLogLog
+        """
+        self.registers = bytearray(max(pair) for pair in
+                                   zip(self.registers, other.registers))
+
+    def __len__(self):
+        """
+        :return: estimated number of distinct keys
+        :rtype: int
+        """
+        m = len(self.registers)
+        alpha = 0.7213 / (1 + 1.079 / m)
+        estimate = alpha * m * m / sum(2.0 ** -rank
+                                       for rank in self.registers)
+        zeros = self.registers.count('\0')
+
+        # Small cardinalities are estimated better with linear counting.
+        if estimate <= 2.5 * m and zeros:
+            estimate = m * log(float(m) / zeros)
+
+        return int(round(estimate))
+
+    @property
+    def relative_error(self):
+        """
+        :return: standard error of estimate
+        :rtype: float
+        """
+        return 1.04 / len(self.registers) ** 0.5
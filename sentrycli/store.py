@@ -0,0 +1,484 @@
+import json
+import os
+import re
+import sqlite3
+
+from argh import CommandError
+
+from sentrycli import profiling
+from sentrycli.event import Event
+from sentrycli.grouping import (AttributesGrouping, CtimeGrouping,
+                                KeysGrouping, Plan, ORDER_META_KEY,
+                                T_CONTEXT, T_HEADER, T_PARAM, T_TAG, T_VAR)
+from sentrycli.utils import to_timestamp, to_utc
+
+
+SCHEMA = '''
+CREATE TABLE IF NOT EXISTS events (
+    id INTEGER PRIMARY KEY,
+    event_id TEXT NOT NULL UNIQUE,
+    issue TEXT NOT NULL,
+    created INTEGER NOT NULL,
+    categories TEXT NOT NULL,
+    raw TEXT NOT NULL
+);
+CREATE INDEX IF NOT EXISTS events_issue_created ON events (issue, created);
+CREATE INDEX IF NOT EXISTS events_created ON events (created);
+
+-- Headers, context, params, tags and frame variables.
+CREATE TABLE IF NOT EXISTS fields (
+    event INTEGER NOT NULL REFERENCES events (id),
+    prop TEXT NOT NULL,
+    key TEXT NOT NULL,
+    value TEXT
+);
+CREATE INDEX IF NOT EXISTS fields_key_value ON fields (prop, key, value);
+CREATE INDEX IF NOT EXISTS fields_event ON fields (event, prop, key);
+
+-- Attributes of the last breadcrumb of each category, data's keys are
+-- prefixed with `data.`.
+CREATE TABLE IF NOT EXISTS breadcrumbs (
+    event INTEGER NOT NULL REFERENCES events (id),
+    category TEXT NOT NULL,
+    key TEXT NOT NULL,
+    value TEXT
+);
+CREATE INDEX IF NOT EXISTS breadcrumbs_key_value
+    ON breadcrumbs (category, key, value);
+CREATE INDEX IF NOT EXISTS breadcrumbs_event
+    ON breadcrumbs (event, category, key);
+'''
+# Properties stored in `fields` table by key type.
+FIELDS_PROPS = {
+    T_HEADER: 'headers',
+    T_CONTEXT: 'context',
+    T_PARAM: 'params',
+    T_TAG: 'tags',
+    T_VAR: 'vars',
+}
+NOT_PRESENT = '<NOT PRESENT>'
+# Max number of seconds to wait for other writer to finish.
+LOCK_TIMEOUT = 60
+# Reused as `json.dumps` creates new encoder on each call with options.
+ENCODER = json.JSONEncoder(sort_keys=True)
+
+
+def encode(value):
+    """
+    Encode value so it can be stored in the same column regardless of type.
+
+    :rtype: str or None
+    """
+    if value is None:
+        return None
+
+    return ENCODER.encode(value)
+
+
+def decode(value):
+    """
+    Decode stored value. Lists and dictionaries are left encoded so they
+    can be grouped.
+
+    :type value: str or None
+    """
+    if value is None:
+        return None
+
+    decoded = json.loads(value)
+
+    if isinstance(decoded, (list, dict)):
+        return value
+
+    return decoded
+
+
+def regexp(pattern, value, cache={}):
+    """
+    Implementation of SQLite's REGEXP operator (search semantics).
+
+    :type pattern: str
+    :type value: str
+    :rtype: bool
+    """
+    regex = cache.get(pattern)
+
+    if regex is None:
+        regex = cache[pattern] = re.compile(pattern)
+
+    return value is not None and regex.search(value) is not None
+
+
+def get_fields(event):
+    """
+    Get (prop, key, value) rows of event's fields.
+
+    :type event: Event
+    :rtype: iterator<tuple>
+    """
+    for prop in ('headers', 'context', 'params', 'tags'):
+        for key, value in (getattr(event, prop) or {}).iteritems():
+            yield prop, key, encode(value)
+
+    for name, value in event.variables.iteritems():
+        if value is not None:
+            yield 'vars', name, encode(value)
+
+
+def get_breadcrumbs_attributes(event):
+    """
+    Get (category, key, value) rows with attributes of the last breadcrumb
+    of each category (see `sentrycli.grouping.AttributeAccessor`).
+
+    :type event: Event
+    :rtype: iterator<tuple>
+    """
+    for category, breadcrumb in event.breadcrumbs_by_category.iteritems():
+        for key, value in breadcrumb.iteritems():
+            yield category, key, encode(value)
+
+            if isinstance(value, dict):
+                data = value.get('extra', value)
+
+                if isinstance(data, dict):
+                    for data_key, data_value in data.iteritems():
+                        yield (category, '%s.%s' % (key, data_key),
+                               encode(data_value))
+
+
+class Store(object):
+    """
+    SQLite database with events of many issues. Fields of events are kept
+    in normalised tables so groupings can be computed with SQL.
+    """
+
+    def __init__(self, pathname, create=False):
+        """
+        :param pathname: path to database file
+        :type: str
+        :param create: create database if it doesn't exist
+        :type: bool
+        :raises: argh.CommandError if database doesn't exist
+        """
+        if not create and not os.path.isfile(pathname):
+            raise CommandError('no such store: %s' % pathname)
+
+        self.pathname = pathname
+        self.connection = sqlite3.connect(pathname, timeout=LOCK_TIMEOUT)
+        self.connection.create_function('REGEXP', 2, regexp)
+
+        if create:
+            # Page per transaction - don't wait for disk on each of them.
+            self.connection.execute('PRAGMA journal_mode = WAL')
+            self.connection.execute('PRAGMA synchronous = NORMAL')
+            self.connection.executescript(SCHEMA)
+
+    def close(self):
+        self.connection.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *args):
+        self.close()
+
+    def add(self, issue, events):
+        """
+        Insert issue's events in a single transaction. Events already in
+        the store are skipped.
+
+        :type issue: str
+        :param events: raw events
+        :type: list(dict)
+        :return: number of inserted events
+        :rtype: int
+        """
+        count = 0
+        fields = []
+        attributes = []
+
+        with self.connection:
+            for raw in events:
+                event = Event(raw)
+                cursor = self.connection.execute(
+                    'INSERT OR IGNORE INTO events '
+                    '(event_id, issue, created, categories, raw) '
+                    'VALUES (?, ?, ?, ?, ?)',
+                    (raw['id'], issue, event.timestamp,
+                     event.breadcrumbs_categories, json.dumps(raw)))
+
+                if not cursor.rowcount:
+                    continue
+
+                row = cursor.lastrowid
+                count += 1
+                fields.extend((row,) + field for field in get_fields(event))
+                attributes.extend((row,) + attribute for attribute in
+                                  get_breadcrumbs_attributes(event))
+
+            self.connection.executemany(
+                'INSERT INTO fields VALUES (?, ?, ?, ?)', fields)
+            self.connection.executemany(
+                'INSERT INTO breadcrumbs VALUES (?, ?, ?, ?)', attributes)
+
+        return count
+
+    def filter(self, issues=None, since=None, to=None):
+        """
+        Get SQL condition selecting events.
+
+        :param issues: issues' identifiers (all if not specified)
+        :type: list(str)
+        :param since: event's min creation datetime
+        :type: datetime
+        :param to: event's max creation datetime
+        :type: datetime
+        :return: condition and its parameters
+        :rtype: (str, list)
+        """
+        conditions = ['1']
+        params = []
+
+        if issues:
+            conditions.append('e.issue IN (%s)' % ', '.join('?' * len(issues)))
+            params.extend(issues)
+
+        # Sentry's creation times are in UTC.
+        if since is not None:
+            conditions.append('e.created >= ?')
+            params.append(to_timestamp(to_utc(since)))
+
+        if to is not None:
+            conditions.append('e.created <= ?')
+            params.append(to_timestamp(to_utc(to)))
+
+        return ' AND '.join(conditions), params
+
+    def events(self, where, projection=None, event_filter=None):
+        """
+        :param where: condition and its parameters (see `filter`)
+        :type: (str, list)
+        :param projection: fields to keep (whole events if not specified)
+        :type: sentrycli.event.Projection
+        :param event_filter: if specified, only events passing it are
+        returned
+        :type: sentrycli.where.Filter
+        :rtype: iterator<Event or CompactEvent>
+        """
+        condition, params = where
+        cursor = self.connection.execute(
+            'SELECT e.raw FROM events e WHERE %s ORDER BY e.created DESC'
+            % condition, params)
+
+        for (raw,) in cursor:
+            if event_filter is not None and not event_filter.accepts_text(raw):
+                continue
+
+            event = Event(json.loads(raw))
+
+            if event_filter is not None and not event_filter(event):
+                continue
+
+            yield event if projection is None else projection.compact(event)
+
+    def count(self, where, columns, joins=(), params=()):
+        """
+        Count events grouped by given columns.
+
+        :param where: condition and its parameters (see `filter`)
+        :type: (str, list)
+        :param columns: SQL expressions to group by
+        :type: list(str)
+        :param joins: JOIN clauses
+        :type: list(str)
+        :param params: parameters of columns and joins (in that order)
+        :type: list
+        :rtype: iterator<tuple> - values of columns followed by count
+        """
+        condition, where_params = where
+        query = 'SELECT %s, count(*) FROM events e %s WHERE %s GROUP BY %s' % (
+            ', '.join(columns), ' '.join(joins), condition,
+            ', '.join(str(i + 1) for i in xrange(len(columns))))
+        return self.connection.execute(query,
+                                       list(params) + list(where_params))
+
+    def aggregate(self, grouping, where):
+        """
+        Compute grouping with SQL.
+
+        :type grouping: sentrycli.grouping.Grouping
+        :param where: condition and its parameters (see `filter`)
+        :type: (str, list)
+        :return: False if grouping cannot be computed with SQL
+        :rtype: bool
+        """
+        with profiling.stage('sql'):
+            return self._aggregate(grouping, where)
+
+    def _aggregate(self, grouping, where):
+        if isinstance(grouping, KeysGrouping):
+            self.aggregate_keys(grouping, where)
+        elif isinstance(grouping, CtimeGrouping):
+            rows = self.count(where, ['e.created / ? * ?'],
+                              params=[grouping.width] * 2)
+
+            for bucket, count in rows:
+                grouping.add_count(bucket, count)
+        elif isinstance(grouping, AttributesGrouping):
+            self.aggregate_attributes(grouping, where)
+        else:
+            return False
+
+        return True
+
+    def aggregate_keys(self, grouping, where):
+        """
+        :type grouping: sentrycli.grouping.KeysGrouping
+        :param where: condition and its parameters (see `filter`)
+        :type: (str, list)
+        """
+        columns = []
+        joins = []
+        params = []
+
+        for i, key in enumerate(grouping.keys):
+            if key == ORDER_META_KEY:
+                columns.append(' AND '.join(
+                    ['e.categories REGEXP ?'] * len(grouping.breadcrumbs)))
+                params.extend(order.pattern for order in grouping.breadcrumbs)
+                continue
+
+            kind, name = key
+            columns.append('f%d.value' % i)
+            joins.append('LEFT JOIN fields f%d ON f%d.event = e.id AND '
+                         'f%d.prop = ? AND f%d.key = ?' % ((i,) * 4))
+
+        # Parameters of joins follow parameters of columns.
+        params.extend(param for kind, name in grouping.keys
+                      if (kind, name) != ORDER_META_KEY
+                      for param in (FIELDS_PROPS[kind], name))
+
+        for row in self.count(where, columns, joins, params):
+            values = []
+
+            for key, value in zip(grouping.keys, row):
+                if key == ORDER_META_KEY:
+                    values.append(bool(value))
+                else:
+                    values.append(decode(value))
+
+            grouping.add_count(tuple(values), row[-1])
+
+    def aggregate_attributes(self, grouping, where):
+        """
+        :type grouping: sentrycli.grouping.AttributesGrouping
+        :param where: condition and its parameters (see `filter`)
+        :type: (str, list)
+        """
+        columns = []
+        joins = []
+        params = []
+
+        for i, accessor in enumerate(grouping.accessors):
+            # Category is present, attribute is present (data's key is
+            # optional) and attribute's value.
+            columns.extend(['c%d.event IS NOT NULL' % i,
+                            'k%d.event IS NOT NULL' % i,
+                            'a%d.value' % i])
+            join = ('LEFT JOIN breadcrumbs %s%d ON %s%d.event = e.id AND '
+                    '%s%d.category = ? AND %s%d.key = ?')
+            joins.extend(join % ((alias, i) * 4) for alias in 'cka')
+            params.extend([accessor.category, 'category',
+                           accessor.category, accessor.key,
+                           accessor.category, accessor.attribute])
+
+        for row in self.count(where, columns, joins, params):
+            values = []
+
+            for i, accessor in enumerate(grouping.accessors):
+                present, valid, value = row[i * 3:i * 3 + 3]
+
+                if not present:
+                    values.append(NOT_PRESENT)
+                elif not valid:
+                    grouping.invalid.add((accessor.category,
+                                          accessor.attribute))
+                    values.append(NOT_PRESENT)
+                else:
+                    values.append(decode(value))
+
+            grouping.add_count(tuple(values), row[-1])
+
+
+class StoreWriter(object):
+    """
+    Writes issue's events to store page by page (see
+    `sentrycli.writers.Writer`).
+    """
+    resumable = False
+
+    def __init__(self, pathname, issue):
+        """
+        :param pathname: path to database file
+        :type: str
+        :param issue: issue's identifier
+        :type: str
+        """
+        self.pathname = pathname
+        self.issue = issue
+        self.store = Store(pathname, create=True)
+        # Number of events not present in store before.
+        self.inserted = 0
+
+    def write(self, events):
+        self.inserted += self.store.add(self.issue, events)
+        return 0
+
+    def close(self):
+        self.store.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *args):
+        self.close()
+
+
+def scan_store(pathname, specs, issues=None, since=None, to=None,
+               event_filter=None):
+    """
+    Compute groupings over events from store. Groupings are computed with
+    SQL where possible (unless events are filtered with predicates), the
+    rest in a single pass over stored events.
+
+    :param pathname: path to database file
+    :type: str
+    :param specs: groupings' specifications
+    :type: list(dict)
+    :param issues: issues' identifiers (all if not specified)
+    :type: list(str)
+    :param since: event's min creation datetime
+    :type: datetime
+    :param to: event's max creation datetime
+    :type: datetime
+    :param event_filter: predicates events have to fulfill
+    :type: sentrycli.where.Filter
+    :rtype: sentrycli.grouping.Plan
+    """
+    plan = Plan.from_specs(specs)
+
+    with Store(pathname) as store:
+        where = store.filter(issues, since, to)
+
+        if event_filter is None:
+            rest = Plan([grouping for grouping in plan.groupings
+                         if not store.aggregate(grouping, where)])
+        else:
+            rest = plan
+
+        if rest.groupings:
+            rest.scan(store.events(where, projection=rest.projection(),
+                                   event_filter=event_filter))
+
+    return plan
+
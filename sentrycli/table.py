@@ -1,6 +1,16 @@
+from itertools import izip
+import csv
+import json
+import sys
+
 from prettytable import PrettyTable
 
 
+# Formats of results - human readable table or streamed rows.
+OUTPUT_TABLE = 'table'
+OUTPUT_FORMATS = (OUTPUT_TABLE, 'csv', 'tsv', 'jsonl')
+
+
 class Table(PrettyTable):
 
     def __init__(self, *args, **kwargs):
@@ -17,12 +27,72 @@ class Table(PrettyTable):
         """
         return self.get_string(sortby='count', reversesort=True)
 
-    def add_rows(self, total, rows):
+    def add_rows(self, total, rows, errors=None):
         """
         Add rows with values to the table along with count and percent columns.
         :param total: percentage will be calculated to this with this value
         :type: float
         :type rows: collections.Counter
+        :param errors: half-widths of percentages' confidence intervals by
+        grouped values - if given, counts are rounded estimates
+        :type: dict
         """
         for group_by, count in rows:
-            self.add_row(list(group_by) + [count, count * 100.0 / total])
+            percent = count * 100.0 / total
+
+            if errors is None:
+                self.add_row(list(group_by) + [count, percent])
+            else:
+                self.add_row(list(group_by) + [
+                    int(round(count)),
+                    '%.1f +/- %.1f' % (percent, errors.get(group_by, 0.0))])
+
+
+def encode(value):
+    """
+    Prepare value for CSV writer (it doesn't handle unicode).
+
+    :rtype: str
+    """
+    if value is None:
+        return ''
+
+    if isinstance(value, unicode):
+        return value.encode('utf-8')
+
+    return value
+
+
+def write_rows(columns, rows, output_format, stream=None):
+    """
+    Write rows one by one as they're produced, in given order (no table is
+    built and nothing is sorted).
+
+    :param columns: names of columns
+    :type: list(str)
+    :type rows: iterable<list>
+    :param output_format: one of `OUTPUT_FORMATS` except table
+    :type: str
+    :param stream: file to write to (standard output by default)
+    :type: file
+    """
+    stream = stream or sys.stdout
+
+    if output_format == 'jsonl':
+        # Objects are put together from encoded values to keep columns'
+        # order without building dictionary per row.
+        encode_value = json.JSONEncoder().encode
+        keys = [encode_value(str(column)) + ': ' for column in columns]
+
+        for row in rows:
+            stream.write('{%s}\n' % ', '.join(
+                key + encode_value(value) for key, value in izip(keys, row)))
+        return
+
+    writer = csv.writer(stream, lineterminator='\n',
+                        dialect='excel-tab' if output_format == 'tsv'
+                        else 'excel')
+    writer.writerow([encode(column) for column in columns])
+
+    for row in rows:
+        writer.writerow([encode(value) for value in row])
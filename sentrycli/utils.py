@@ -1,6 +1,22 @@
+import re
+from calendar import timegm
+from datetime import date, datetime
+from glob import glob
+
 from argh import CommandError
 
 
+# Fixed format used by Sentry e.g. 2016-04-19T10:02:41Z.
+ISO_8601_RE = re.compile(
+    r'^(\d{4})-(\d\d)-(\d\d)[T ](\d\d):(\d\d):(\d\d)(?:\.(\d{1,6})\d*)?'
+    r'(Z|[+-]\d\d:?\d\d)?$')
+DURATION_RE = re.compile(r'^(\d+)([smhdw])$')
+DURATION_UNITS = {'s': 1, 'm': 60, 'h': 3600, 'd': 86400, 'w': 604800}
+# dateutil's UTC time zone, set by `get_utc` (dateutil is imported lazily).
+UTC = None
+EPOCH_ORDINAL = date(1970, 1, 1).toordinal()
+
+
 def check_required_keys_present(required, dictionary):
     """
     Check if at least one of required values are present in dictionary.
@@ -11,3 +27,175 @@ def check_required_keys_present(required, dictionary):
     """
     if all([dictionary.get(param) is None for param in required]):
         raise CommandError('one of %s has to be specified' % '|'.join(required))
+
+
+def expand_pathnames(patterns):
+    """
+    Expand glob patterns into paths of files.
+    :param patterns: paths or glob patterns
+    :type: list
+    :rtype: list
+    :raises: argh.CommandError if pattern doesn't match anything
+    """
+    pathnames = []
+
+    for pattern in patterns:
+        matches = sorted(glob(pattern))
+
+        if not matches:
+            raise CommandError('no such file: %s' % pattern)
+
+        pathnames.extend(matches)
+
+    return pathnames
+
+
+def get_sources(pathnames, store, per_file, issues, since, to, follow=None):
+    """
+    Check that events are read either from input files, from store or
+    from followed issue.
+
+    :param pathnames: paths or glob patterns of input files
+    :type: list(str)
+    :param store: path to database file
+    :type: str
+    :type per_file: bool
+    :type issues: list(str)
+    :type since: datetime
+    :type to: datetime
+    :param follow: identifier of followed issue
+    :type: str
+    :return: paths to input files
+    :rtype: list(str)
+    :raises: argh.CommandError if arguments don't fit the source
+    """
+    if follow is not None:
+        if pathnames or store is not None:
+            raise CommandError('input files and --store cannot be used with '
+                               '--follow')
+
+        if per_file or issues or to:
+            raise CommandError('--per-file, --issue and --to cannot be used '
+                               'with --follow')
+
+        return []
+
+    if store is None:
+        if not pathnames:
+            raise CommandError('input files or --store has to be specified')
+
+        if issues or since or to:
+            raise CommandError('--issue, --since and --to need --store')
+
+        return expand_pathnames(pathnames)
+
+    if pathnames:
+        raise CommandError('input files cannot be used with --store')
+
+    if per_file:
+        raise CommandError('--per-file cannot be used with --store')
+
+    return []
+
+
+def get_utc():
+    """
+    :return: UTC time zone
+    :rtype: dateutil.tz.tzutc
+    """
+    global UTC
+
+    if UTC is None:
+        from dateutil.tz import tzutc
+
+        UTC = tzutc()
+
+    return UTC
+
+
+def to_utc(value):
+    """
+    :param value: naive datetime is in local time (as in `query`)
+    :type: datetime.datetime
+    :rtype: datetime.datetime
+    """
+    if value.tzinfo is None:
+        from dateutil.tz import tzlocal
+
+        value = value.replace(tzinfo=tzlocal())
+
+    return value.astimezone(get_utc())
+
+
+def parse_datetime(value):
+    """
+    Parse ISO 8601 datetime. Fixed format used by Sentry is parsed directly,
+    anything else by dateutil.
+    :type value: str
+    :rtype: datetime.datetime
+    """
+    match = ISO_8601_RE.match(value)
+
+    if match is None:
+        from dateutil.parser import parse
+        return parse(value)
+
+    (year, month, day, hour, minute, second, fraction,
+     zone) = match.groups()
+
+    if zone is None:
+        tzinfo = None
+    elif zone == 'Z':
+        tzinfo = UTC or get_utc()
+    else:
+        offset = (int(zone[1:3]) * 60 + int(zone[-2:])) * 60
+        from dateutil.tz import tzoffset
+
+        tzinfo = tzoffset(None, -offset if zone[0] == '-' else offset)
+
+    microsecond = int(fraction.ljust(6, '0')) if fraction else 0
+    return datetime(int(year), int(month), int(day), int(hour), int(minute),
+                    int(second), microsecond, tzinfo)
+
+
+def to_timestamp(ctime):
+    """
+    Convert datetime to number of seconds since epoch. Wall time is
+    preserved (time zone offset is ignored) so bucketing timestamps gives
+    the same results as bucketing datetimes.
+    :type ctime: datetime.datetime
+    :rtype: int
+    """
+    return timegm(ctime.replace(tzinfo=None).timetuple())
+
+
+def parse_timestamp(value):
+    """
+    Parse ISO 8601 datetime straight into number of seconds since epoch
+    (see `to_timestamp`) without building datetime object.
+    :type value: str
+    :rtype: int
+    """
+    match = ISO_8601_RE.match(value)
+
+    if match is None:
+        return to_timestamp(parse_datetime(value))
+
+    year, month, day, hour, minute, second = match.groups()[:6]
+    days = date(int(year), int(month), int(day)).toordinal() - EPOCH_ORDINAL
+    return days * 86400 + int(hour) * 3600 + int(minute) * 60 + int(second)
+
+
+def parse_duration(value):
+    """
+    Parse duration e.g. 30s, 15m, 2h, 1d or 1w.
+    :type value: str
+    :rtype: int
+    :raises: ValueError if format is invalid
+    """
+    match = DURATION_RE.match(value)
+
+    if match is None or not int(match.group(1)):
+        raise ValueError('duration should be in format <number>[smhdw]')
+
+    return int(match.group(1)) * DURATION_UNITS[match.group(2)]
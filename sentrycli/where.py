@@ -0,0 +1,397 @@
+from itertools import izip
+from operator import ge, gt, le, lt
+import re
+
+from argh import CommandError
+
+from sentrycli.utils import parse_datetime, to_timestamp, to_utc
+
+
+# Event's properties holding fields of given namespace.
+FIELD_PROPS = {
+    'header': 'headers',
+    'context': 'context',
+    'param': 'params',
+    'tag': 'tags',
+}
+VAR_NAMESPACE = 'var'
+FIELD_RE = re.compile(
+    r'^(?P<namespace>\w+):(?P<key>[^\s=!~]+)\s*'
+    r'(?:(?P<operator>!=|=|!~|~)|\s(?P<in>in)\s)\s*(?P<value>.*)$')
+CTIME_RE = re.compile(r'^ctime\s*(?P<operator>>=|<=|>|<)\s*(?P<value>.+)$')
+BREADCRUMB_RE = re.compile(r'^(?P<negate>!)?breadcrumb:(?P<category>\S+)$')
+# Values which are written the same way in raw JSON (if present there).
+PLAIN_VALUE_RE = re.compile(r'^[\w.:@-]+$')
+# Max number of distinct values with cached result per predicate.
+CACHE_SIZE = 10000
+# Predicates are checked from the cheapest to the most expensive (lazy
+# properties of `Event` get computed only for events passing the previous
+# ones).
+COSTS = {
+    'ctime': 0,
+    'tag': 1,
+    'context': 2,
+    'header': 3,
+    'param': 4,
+    'breadcrumb': 5,
+    VAR_NAMESPACE: 6,
+}
+
+
+def to_text(value):
+    """
+    :return: value as compared by predicates
+    :rtype: unicode
+    """
+    if isinstance(value, unicode):
+        return value
+
+    if isinstance(value, str):
+        return value.decode('utf-8', 'replace')
+
+    return unicode(value)
+
+
+def get_hint(value):
+    """
+    Get text which has to appear in raw JSON of event if any field has
+    given value - unless escaping or formatting (e.g. of booleans and
+    numbers) could differ.
+
+    :type value: str
+    :rtype: str or None
+    """
+    if not PLAIN_VALUE_RE.match(value) or value in ('True', 'False', 'None'):
+        return None
+
+    try:
+        float(value)
+    except ValueError:
+        return value
+
+    return None
+
+
+class FieldPredicate(object):
+    """
+    Checks value of event's header, context, param, tag or variable -
+    equality (`=`, `!=`), regex search (`~`, `!~`) or one of comma
+    separated values (`in`). Missing field doesn't equal nor match
+    anything. Result is computed once per distinct value.
+    """
+
+    def __init__(self, namespace, key, operator, value):
+        """
+        :param namespace: one of `FIELD_PROPS` keys or var
+        :type: str
+        :param key: field's name
+        :type: str
+        :param operator: =, !=, ~, !~ or in
+        :type: str
+        :param value: value, regex or comma separated values
+        :type: str
+        """
+        self.namespace = namespace
+        self.key = key
+        self.negate = operator.startswith('!')
+        self.cache = {}
+        self.hints = None
+
+        if operator.endswith('~'):
+            try:
+                self.regex = re.compile(value)
+            except re.error as error:
+                raise CommandError('Invalid regex %r: %s' % (value, error))
+
+            self.values = None
+        else:
+            self.regex = None
+            values = value.split(',') if operator == 'in' else [value]
+            self.values = {to_text(item.strip()) for item in values}
+
+            if not self.negate:
+                hints = [get_hint(item.strip()) for item in values]
+
+                if None not in hints:
+                    self.hints = hints
+
+    @property
+    def cost(self):
+        return COSTS[self.namespace]
+
+    def get(self, event):
+        """
+        :type event: sentrycli.event.Event
+        :return: value of field or None if event doesn't have it
+        """
+        if self.namespace == VAR_NAMESPACE:
+            return event.get_var(self.key)
+
+        return (getattr(event, FIELD_PROPS[self.namespace]) or {}).get(
+            self.key)
+
+    def test(self, value):
+        """
+        :param value: value of field (None if missing)
+        :rtype: bool
+        """
+        try:
+            result = self.cache.get(value)
+        except TypeError:
+            # Unhashable values (e.g. lists) aren't cached.
+            return self.match(value)
+
+        if result is None:
+            result = self.match(value)
+
+            if len(self.cache) < CACHE_SIZE:
+                self.cache[value] = result
+
+        return result
+
+    def match(self, value):
+        if value is None:
+            matches = False
+        elif self.regex is not None:
+            matches = self.regex.search(to_text(value)) is not None
+        else:
+            matches = to_text(value) in self.values
+
+        return matches != self.negate
+
+    def __call__(self, event):
+        return self.test(self.get(event))
+
+
+class CtimePredicate(object):
+    """
+    Checks event's creation time. Limit without time zone is in local time
+    (as --since and --to), events' times are in UTC.
+    """
+    cost = COSTS['ctime']
+    hints = None
+    OPERATORS = {'>=': ge, '<=': le, '>': gt, '<': lt}
+
+    def __init__(self, operator, value):
+        """
+        :param operator: >=, <=, > or <
+        :type: str
+        :param value: date and time e.g. 2016-04-19T10:00
+        :type: str
+        """
+        try:
+            ctime = parse_datetime(value)
+        except (ValueError, OverflowError):
+            raise CommandError('Invalid creation time %r' % value)
+
+        self.operator = operator
+        self.compare = self.OPERATORS[operator]
+        self.limit = to_timestamp(to_utc(ctime))
+
+    def bounds(self):
+        """
+        :return: min and max passing creation time (seconds since epoch),
+        None if not limited
+        :rtype: (int or None, int or None)
+        """
+        return {
+            '>=': (self.limit, None),
+            '>': (self.limit + 1, None),
+            '<=': (None, self.limit),
+            '<': (None, self.limit - 1),
+        }[self.operator]
+
+    def test(self, timestamp):
+        """
+        :param timestamp: seconds since epoch
+        :type: int
+        :rtype: bool
+        """
+        return self.compare(timestamp, self.limit)
+
+    def __call__(self, event):
+        return self.test(event.timestamp)
+
+
+class BreadcrumbPredicate(object):
+    """
+    Checks if event has (or doesn't have) breadcrumb of given category.
+    """
+    cost = COSTS['breadcrumb']
+
+    def __init__(self, category, negate=False):
+        """
+        :type category: str
+        :type negate: bool
+        """
+        self.category = category
+        self.negate = negate
+        hint = get_hint(category)
+        self.hints = [hint] if hint is not None and not negate else None
+
+    def __call__(self, event):
+        return (self.category in event.breadcrumbs_by_category) != self.negate
+
+
+def parse_predicate(expression):
+    """
+    Parse single predicate e.g. `tag:release=5d74084`,
+    `header:User-Agent~Opera`, `tag:server_name in lati1,lati2`,
+    `ctime>=2016-04-19` or `breadcrumb:requests`.
+
+    :type expression: str
+    :rtype: FieldPredicate or CtimePredicate or BreadcrumbPredicate
+    :raises: argh.CommandError if expression is invalid
+    """
+    expression = expression.strip()
+    match = CTIME_RE.match(expression)
+
+    if match is not None:
+        return CtimePredicate(match.group('operator'),
+                              match.group('value').strip())
+
+    match = BREADCRUMB_RE.match(expression)
+
+    if match is not None:
+        return BreadcrumbPredicate(match.group('category'),
+                                   bool(match.group('negate')))
+
+    match = FIELD_RE.match(expression)
+
+    if match is None:
+        raise CommandError(
+            'Invalid predicate %r, should be e.g. tag:release=5d74084, '
+            'header:User-Agent~Opera, tag:server_name in a,b, '
+            'ctime>=2016-04-19 or breadcrumb:requests' % expression)
+
+    namespace = match.group('namespace')
+
+    if namespace not in FIELD_PROPS and namespace != VAR_NAMESPACE:
+        raise CommandError('Unknown namespace %r, should be one of %s' % (
+            namespace, ', '.join(sorted(FIELD_PROPS.keys() +
+                                        [VAR_NAMESPACE, 'ctime',
+                                         'breadcrumb']))))
+
+    return FieldPredicate(namespace, match.group('key'),
+                          match.group('operator') or match.group('in'),
+                          match.group('value'))
+
+
+class Filter(object):
+    """
+    Conjunction of predicates compiled once and checked against each event
+    before any of its fields is extracted.
+    """
+
+    def __init__(self, predicates):
+        """
+        :type predicates: list
+        """
+        self.predicates = sorted(predicates, key=lambda predicate:
+                                 predicate.cost)
+        # Texts (any of each group) which have to appear in raw event.
+        self.hints = [predicate.hints for predicate in self.predicates
+                      if predicate.hints]
+
+    def __call__(self, event):
+        """
+        :type event: sentrycli.event.Event
+        :rtype: bool
+        """
+        for predicate in self.predicates:
+            if not predicate(event):
+                return False
+
+        return True
+
+    def accepts_text(self, text):
+        """
+        Quick check of raw (not yet decoded) event - False means event
+        can't pass the filter, True that it has to be checked after
+        decoding.
+
+        :param text: event's JSON
+        :type: str
+        :rtype: bool
+        """
+        for hints in self.hints:
+            for hint in hints:
+                if hint in text:
+                    break
+            else:
+                return False
+
+        return True
+
+    def get_ctime_range(self):
+        """
+        :return: min and max creation time (seconds since epoch) of events
+        which can pass the filter, None if not limited
+        :rtype: (int or None, int or None)
+        """
+        since = to = None
+
+        for predicate in self.predicates:
+            if not isinstance(predicate, CtimePredicate):
+                continue
+
+            low, high = predicate.bounds()
+
+            if low is not None:
+                since = low if since is None else max(since, low)
+
+            if high is not None:
+                to = high if to is None else min(to, high)
+
+        return since, to
+
+    def select(self, index):
+        """
+        Evaluate filter against columnar index.
+
+        :type index: sentrycli.index.ColumnIndex
+        :return: 1 for each row passing the filter, 0 otherwise or None if
+        index doesn't have all needed fields
+        :rtype: bytearray or None
+        """
+        masks = []
+
+        for predicate in self.predicates:
+            if isinstance(predicate, CtimePredicate):
+                masks.append(bytearray(predicate.test(timestamp)
+                                       for timestamp in index.ctimes))
+                continue
+
+            if (not isinstance(predicate, FieldPredicate) or
+                    predicate.namespace not in FIELD_PROPS):
+                return None
+
+            prop = FIELD_PROPS[predicate.namespace]
+
+            if not index.has(prop, predicate.key):
+                return None
+
+            column = index.column(prop, predicate.key)
+            passing = bytearray(predicate.test(value)
+                                for value in column.values)
+            masks.append(bytearray(passing[code] for code in column.codes))
+
+        mask = bytearray([1]) * index.count
+
+        for other in masks:
+            mask = bytearray(a & b for a, b in izip(mask, other))
+
+        return mask
+
+
+def compile_filter(expressions):
+    """
+    :param expressions: predicates which all have to be true
+    :type: list(str)
+    :rtype: Filter or None if there are no predicates
+    """
+    if not expressions:
+        return None
+
+    return Filter([parse_predicate(expression)
+                   for expression in expressions])
@@ -0,0 +1,199 @@
+import json
+import os
+import pickle
+
+from sentrycli import container
+from sentrycli.utils import parse_timestamp
+
+
+class Writer(object):
+    """
+    Writes events to output file page by page as they're downloaded.
+    """
+    # Whether file is consistent after each written page so interrupted
+    # download can be resumed.
+    resumable = True
+
+    def __init__(self, pathname, append=False):
+        """
+        :param pathname: path to output file
+        :type: str
+        :param append: keep events already saved in file
+        :type: bool
+        """
+        self.pathname = pathname
+        self.f = self.open(append)
+
+    def open(self, append):
+        return open(self.pathname, 'ab' if append else 'wb')
+
+    def write(self, events):
+        """
+        Write page of events.
+
+        :type events: list
+        :return: size of the file after writing
+        :rtype: int
+        """
+        raise NotImplementedError
+
+    def close(self):
+        self.f.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *args):
+        self.close()
+
+
+class JsonWriter(Writer):
+    """
+    Writes events as (indented) JSON array. File is valid JSON after each
+    written page.
+    """
+
+    def open(self, append):
+        if not append or not os.path.isfile(self.pathname):
+            with open(self.pathname, 'wb') as f:
+                f.write('[]')
+
+        return open(self.pathname, 'r+b')
+
+    def write(self, events):
+        f = self.f
+        f.seek(0, os.SEEK_END)
+        end = f.tell()
+
+        if not events:
+            return end
+
+        f.seek(max(end - 4096, 0))
+        tail = f.read()
+        stripped = tail.rstrip()
+
+        if not stripped.endswith(']'):
+            raise ValueError('%s is not JSON array' % self.pathname)
+
+        head = stripped[:-1].rstrip()
+        f.seek(end - len(tail) + len(head))
+        f.truncate()
+
+        if not head.endswith('['):
+            f.write(',')
+
+        for i, event in enumerate(events):
+            if i:
+                f.write(',')
+
+            content = json.dumps(event, indent=2)
+            f.write('\n  ' + content.replace('\n', '\n  '))
+
+        f.write('\n]')
+        f.flush()
+        return f.tell()
+
+
+class NdjsonWriter(Writer):
+    """
+    Writes events as newline-delimited JSON - one compact event per line.
+    """
+
+    def write(self, events):
+        for event in events:
+            self.f.write(json.dumps(event, separators=(',', ':')))
+            self.f.write('\n')
+
+        self.f.flush()
+        return self.f.tell()
+
+
+class PickleWriter(Writer):
+    """
+    Writes pickled list of events. Pickle can't be streamed so events are
+    kept in memory until writer is closed.
+    """
+    resumable = False
+
+    def open(self, append):
+        self.events = []
+
+        if append and os.path.isfile(self.pathname):
+            with open(self.pathname, 'rb') as f:
+                self.events = pickle.load(f)
+
+    def write(self, events):
+        self.events.extend(events)
+        return 0
+
+    def close(self):
+        with open(self.pathname, 'wb') as f:
+            pickle.dump(self.events, f)
+
+
+class BinaryWriter(Writer):
+    """
+    Writes events to binary container (see `sentrycli.container`) - records
+    are appended as pages come, offset table is written when writer is
+    closed so interrupted download can't be resumed.
+    """
+    resumable = False
+
+    def open(self, append):
+        if append and os.path.isfile(self.pathname):
+            f = open(self.pathname, 'r+b')
+
+            try:
+                end, self.timestamps, self.offsets = container.read_table(f)
+            except ValueError:
+                f.close()
+                raise ValueError('%s is not binary container' % self.pathname)
+
+            f.seek(end)
+            f.truncate()
+            return f
+
+        self.timestamps = []
+        self.offsets = []
+        f = open(self.pathname, 'w+b')
+        container.write_header(f)
+        return f
+
+    def write(self, events):
+        f = self.f
+        f.seek(0, os.SEEK_END)
+
+        for event in events:
+            self.timestamps.append(parse_timestamp(event['dateCreated']))
+            self.offsets.append(f.tell())
+            container.write_record(f, event)
+
+        f.flush()
+        return f.tell()
+
+    def close(self):
+        container.write_table(self.f, self.timestamps, self.offsets)
+        self.f.close()
+
+
+WRITERS = {
+    'binary': BinaryWriter,
+    'json': JsonWriter,
+    'ndjson': NdjsonWriter,
+    'pickle': PickleWriter,
+}
+
+
+def get_writer(format, pathname, append=False):
+    """
+    Create writer for given output format.
+
+    :param format: one of `WRITERS` keys
+    :type: str
+    :param pathname: path to output file
+    :type: str
+    :param append: keep events already saved in file
+    :type: bool
+    :rtype: Writer
+    """
+    return WRITERS[format](pathname, append=append)